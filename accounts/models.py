@@ -1,8 +1,13 @@
+import copy
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.fields.files import FieldFile
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from blog.images import schedule_renditions
+
 class UserProfile(models.Model):
     """
     Extended user profile with additional fields
@@ -10,6 +15,8 @@ class UserProfile(models.Model):
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    # Resized copies of profile_picture for avatars (blog/images.py)
+    profile_picture_renditions = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(max_length=500, blank=True)
     location = models.CharField(max_length=100, blank=True)
     website = models.URLField(max_length=200, blank=True)
@@ -17,6 +24,44 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the row holds, so saving the user only writes a changed profile
+        instance._saved_values = instance.field_values()
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        values = self.field_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # Only these were written
+            written = {self._meta.get_field(name).attname for name in update_fields}
+            values = {key: value for key, value in values.items() if key in written}
+            values = {**getattr(self, '_saved_values', {}), **values}
+        self._saved_values = values
+    
+    def field_values(self):
+        # Loaded field values, files by name and JSON copied so edits in place show up
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__:
+                value = field.value_from_object(self)
+                values[field.attname] = value.name if isinstance(value, FieldFile) else copy.deepcopy(value)
+        return values
+    
+    def changed_fields(self):
+        """
+        Names of the fields that differ from the stored row
+        """
+        saved = getattr(self, '_saved_values', {})
+        current = self.field_values()
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in current and (field.attname not in saved or saved[field.attname] != current[field.attname])
+        ]
+    
     def get_profile_picture(self):
         """
         Returns profile picture URL or None
@@ -27,11 +72,27 @@ class UserProfile(models.Model):
 
 # Automatically create profile when user is created
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    # Fixtures (raw) carry their own profiles
+    if created and not raw:
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
+def save_user_profile(sender, instance, raw=False, **kwargs):
+    # Only a profile loaded with the user and edited is written - not on the
+    # last_login update of every login, or when users are saved in bulk
+    profile = None if raw else User.profile.related.get_cached_value(instance, None)
+    if profile is None:
+        return
+    if profile._state.adding:
+        profile.save()
+        return
+    changed = profile.changed_fields()
+    if changed:
+        profile.save(update_fields=changed)
+
+# Resize new profile pictures in the background
+@receiver(post_save, sender=UserProfile)
+def process_profile_picture(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_renditions(instance, 'profile_picture')
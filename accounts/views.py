@@ -2,6 +2,8 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from blog.author_stats import get_author_stats
+from blog.models import Post
 from .forms import SignUpForm, LoginForm, ProfileEditForm
 
 def signup_view(request):
@@ -58,7 +60,17 @@ def profile_view(request):
     """
     User profile page - shows user stats and recent activity
     """
-    return render(request, 'accounts/profile.html')
+    # Load the 5 latest posts once (the template used to query them twice)
+    # Newest written first, drafts included - same order and index as My Posts
+    recent_posts = list(
+        request.user.blog_posts.select_related('author', 'category')
+        .only(*Post.CARD_FIELDS).order_by('-created_at', '-id')[:5]
+    )
+    
+    return render(request, 'accounts/profile.html', {
+        'recent_posts': recent_posts,
+        'stats': get_author_stats(request.user.pk),
+    })
 
 @login_required
 def profile_edit(request):
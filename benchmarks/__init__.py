@@ -0,0 +1,4 @@
+"""
+Benchmarks for BlogHub
+Run from the project root, e.g.: python -m benchmarks.search
+"""
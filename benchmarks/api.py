@@ -0,0 +1,177 @@
+"""
+JSON API check and benchmark - sparse fieldsets, keyset paging, batch
+calls and like state (blog/api.py), then one batch call against
+fetching the same posts' HTML pages one by one
+Usage: python -m benchmarks.api   (exits with 1 on a failure)
+"""
+import sys
+import time
+
+from benchmarks.common import benchmark_database, make_posts
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+
+from blog.comments import fill_tree_positions
+from blog.counters import get_view_counter
+from blog.models import Comment, Post
+
+failures = []
+
+
+def check(label, ok):
+    print(f'{label:64} {"ok" if ok else "FAIL"}')
+    if not ok:
+        failures.append(label)
+
+
+def get(client, url, **params):
+    # (status, JSON body, SELECT statements run)
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, params)
+    selects = [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+    return response.status_code, response.json(), selects
+
+
+def check_posts(client):
+    status, body, queries = get(client, '/api/v1/posts/')
+    check('posts: default fields, one query', status == 200 and len(body['data']) == 20 and len(queries) == 1)
+    check('posts: no body column in listings', 'content' not in queries[0])
+
+    status, body, queries = get(client, '/api/v1/posts/', fields='id,title', limit=5)
+    check('posts: sparse fieldset', set(body['data'][0]) == {'id', 'title'})
+    check('posts: only the needed columns are read', '"views"' not in queries[0] and '"auto_excerpt"' not in queries[0])
+
+    status, body, queries = get(client, '/api/v1/posts/', fields='id,tags', limit=50)
+    check('posts: tags for a whole page in one more query', len(queries) == 2 and len(body['data'][0]['tags']) == 3)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {'fields': 'id', 'limit': 7, **({'cursor': cursor} if cursor else {})}
+        status, body, _ = get(client, '/api/v1/posts/', **params)
+        seen += [item['id'] for item in body['data']]
+        pages += 1
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    published = list(Post.objects.filter(status='published').values_list('id', flat=True))
+    check(f'posts: {pages} keyset pages cover every post once', sorted(seen) == sorted(published) and len(seen) == len(set(seen)))
+    status, second, _ = get(client, '/api/v1/posts/', fields='id', limit=7)
+    status, third, _ = get(client, '/api/v1/posts/', fields='id', limit=7, cursor=second['next_cursor'])
+    status, back, _ = get(client, '/api/v1/posts/', fields='id', limit=7, cursor=third['previous_cursor'])
+    check('posts: previous_cursor goes back a page', back['data'] == second['data'])
+
+    category = Post.objects.first().category
+    status, body, _ = get(client, '/api/v1/posts/', category=category.slug, fields='category')
+    check('posts: category filter', body['data'] and all(item['category'] == category.slug for item in body['data']))
+
+    status, body, _ = get(client, '/api/v1/posts/', fields='id,nope')
+    check('posts: unknown field -> 400', status == 400 and 'nope' in body['error'])
+    status, body, _ = get(client, '/api/v1/posts/', cursor='garbage')
+    check('posts: invalid cursor -> 400', status == 400)
+    status, body, _ = get(client, '/api/v1/posts/', limit=1000)
+    check('posts: limit over the maximum -> 400', status == 400)
+
+
+def check_batch(client, reader):
+    posts = list(Post.objects.filter(status='published').order_by('?').values_list('id', 'slug')[:30])
+    slugs = [slug for _, slug in posts]
+    status, body, queries = get(client, '/api/v1/posts/batch/', slugs=','.join(slugs + ['nope']), fields='slug,title')
+    check('batch: 30 posts by slug in one query, in order',
+          [item['slug'] for item in body['data']] == slugs and len(queries) == 1)
+    check('batch: unknown slugs listed as missing', body['missing'] == ['nope'])
+    ids = [post_id for post_id, _ in posts]
+    status, body, _ = get(client, '/api/v1/posts/batch/', ids=','.join(map(str, ids)), fields='id')
+    check('batch: by id', [item['id'] for item in body['data']] == ids)
+    status, body, _ = get(client, '/api/v1/posts/batch/', ids='1', slugs='a')
+    check('batch: ids and slugs together -> 400', status == 400)
+
+    status, body, queries = get(client, '/api/v1/likes/', ids=','.join(map(str, ids)))
+    check('likes: anonymous, one query', len(queries) == 1 and not any(item['liked'] for item in body['data']))
+    liked = set(ids[:5])
+    for post in Post.objects.filter(id__in=liked):
+        post.likes.add(reader)
+    user = Client()
+    user.force_login(reader)
+    status, body, queries = get(user, '/api/v1/likes/', ids=','.join(map(str, ids)))
+    check('likes: 30 like states, 2 queries + session and user',
+          {item['id'] for item in body['data'] if item['liked']} == liked and len(queries) == 4)
+    check('likes: counts included', all(item['like_count'] >= 1 for item in body['data'] if item['liked']))
+
+
+def check_detail(client, reader):
+    post = Post.objects.filter(status='published').first()
+    Comment.objects.bulk_create([Comment(post=post, author=reader, content=f'Comment {i}') for i in range(25)])
+    fill_tree_positions()
+    status, body, _ = get(client, f'/api/v1/posts/{post.slug}/')
+    check('detail: body and tags', body['data']['content'] == post.content and len(body['data']['tags']) == 3)
+    status, body, _ = get(client, '/api/v1/posts/nope/')
+    check('detail: unknown post -> JSON 404', status == 404 and 'error' in body)
+
+    status, body, queries = get(client, f'/api/v1/posts/{post.slug}/comments/', limit=10)
+    check('comments: keyset paged, newest first', len(body['data']) == 10 and body['next_cursor'] and len(queries) == 2)
+    status, body, _ = get(client, '/api/v1/categories/')
+    check('categories: published post counts', sum(item['post_count'] for item in body['data']) == Post.objects.count())
+    status, body, _ = get(client, '/api/v1/tags/', limit=10)
+    check('tags: keyset paged by name', len(body['data']) == 10 and body['next_cursor'])
+
+    anonymous = Client()
+    check('like: anonymous -> 401', anonymous.put(f'/api/v1/posts/{post.slug}/like/').status_code == 401)
+    user = Client()
+    user.force_login(reader)
+    response = user.put(f'/api/v1/posts/{post.slug}/like/')
+    again = user.put(f'/api/v1/posts/{post.slug}/like/')
+    check('like: PUT twice likes once', again.json() == {'liked': True, 'like_count': response.json()['like_count']})
+    response = user.delete(f'/api/v1/posts/{post.slug}/like/')
+    check('like: DELETE unlikes', response.json()['liked'] is False)
+    check('like: GET not allowed', user.get(f'/api/v1/posts/{post.slug}/like/').status_code == 405)
+
+
+def compare(client):
+    # What a client needs for a feed of 30 posts: titles, counts and like state
+    slugs = list(Post.objects.filter(status='published').values_list('slug', flat=True)[:30])
+    rows = []
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        for slug in slugs:
+            client.get(f'/post/{slug}/')
+    rows.append(('30 HTML post pages', 30, len(queries), time.perf_counter() - started))
+
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        client.get('/api/v1/posts/batch/', {'slugs': ','.join(slugs), 'fields': 'id,slug,title,like_count,comment_count'})
+        client.get('/api/v1/likes/', {'slugs': ','.join(slugs)})
+    rows.append(('batch posts + batch likes', 2, len(queries), time.perf_counter() - started))
+
+    print(f'\n{"":30} {"requests":>9} {"queries":>8} {"ms":>8}')
+    for label, requests, count, seconds in rows:
+        print(f'{label:30} {requests:9} {count:8} {seconds * 1000:8.1f}')
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.BLOG_PAGE_CACHE_ENABLED = False
+    with benchmark_database():
+        make_posts(120, words=300, users=10)
+        reader = User.objects.create_user('api_reader')
+        client = Client()
+        check_posts(client)
+        check_batch(client, reader)
+        check_detail(client, reader)
+        user = Client()
+        user.force_login(reader)
+        compare(user)
+        get_view_counter().flush()
+
+    if failures:
+        print(f'\n{len(failures)} API checks failed')
+        sys.exit(1)
+    print('\nAPI works')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,247 @@
+"""
+Async views check and benchmark - the async pages (blog/async_views.py)
+served through Django's ASGI handler against the sync pages through its
+WSGI handler, in process, under concurrent load
+Each query waits --latency ms first, standing in for the network round
+trip to a database server (PostgreSQL on another host)
+Usage: python -m benchmarks.async_views [--concurrency 16] [--requests 200] [--latency 2]
+Exits with 1 when the async pages differ from the sync ones
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+DIRECTORY = tempfile.mkdtemp()
+os.environ.update(DB_ENGINE='sqlite', DB_NAME=os.path.join(DIRECTORY, 'async.sqlite3'), DB_REPLICAS='')
+
+from benchmarks.common import make_posts  # noqa: E402 - settings read the environment above
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import clear_url_caches  # noqa: E402
+
+from blog.comments import fill_tree_positions  # noqa: E402
+from blog.counters import get_view_counter  # noqa: E402
+from blog.models import Category, Comment, Post  # noqa: E402
+from blog.related import RelatedPostsEngine  # noqa: E402
+
+LATENCY = 0.0
+failures = []
+
+
+def check(label, ok):
+    print(f'{label:64} {"ok" if ok else "FAIL"}')
+    if not ok:
+        failures.append(label)
+
+
+def slow_query(execute, sql, params, many, context):
+    time.sleep(LATENCY)
+    return execute(sql, params, many, context)
+
+
+def add_latency(sender, connection, **kwargs):
+    connection.execute_wrappers.append(slow_query)
+
+
+def use_async_views(enabled):
+    # Routes the pages to blog/async_views.py or blog/views.py, as BLOG_ASYNC_VIEWS does at startup
+    import blog.urls
+    import blog_project.urls
+    settings.BLOG_ASYNC_VIEWS = enabled
+    importlib.reload(blog.urls)
+    importlib.reload(blog_project.urls)
+    clear_url_caches()
+
+
+def wsgi_get(handler, path, cookie=''):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path.partition('?')[0], 'QUERY_STRING': path.partition('?')[2],
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie,
+        'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+    }
+    status = []
+    body = handler(environ, lambda code, headers: status.append(int(code.split()[0])))
+    try:
+        return status[0], b''.join(body)
+    finally:
+        body.close()
+
+
+async def asgi_get(handler, path, cookie=''):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path.partition('?')[0], 'query_string': path.partition('?')[2].encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await handler(scope, receive, send)
+    return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+
+def page_text(body):
+    # The rendered page without the per-request CSRF tokens and the view count, which each request adds to
+    return re.sub(rb"[A-Za-z0-9]{64}|\d+ views", b'', body)
+
+
+def check_pages(pages, cookie):
+    use_async_views(False)
+    sync_handler = WSGIHandler()
+    expected = {name: wsgi_get(sync_handler, path, cookie if name.endswith('(user)') else '')
+                for name, path in pages.items()}
+    use_async_views(True)
+    async_handler = ASGIHandler()
+    for name, path in pages.items():
+        status, body = asyncio.run(asgi_get(async_handler, path, cookie if name.endswith('(user)') else ''))
+        check(f'{name}: async page matches the sync one',
+              status == expected[name][0] == 200 and page_text(body) == page_text(expected[name][1]))
+
+    status, _ = asyncio.run(asgi_get(async_handler, '/post/no-such-post/'))
+    check('async post_detail: unknown post -> 404', status == 404)
+    post = Post.objects.filter(status='published').first()
+    client = Client()
+    client.force_login(User.objects.get(username='async_reader'))
+    liked = client.post(f'/post/{post.slug}/like/').json()
+    unliked = client.post(f'/post/{post.slug}/like/').json()
+    check('async post_like: like then unlike', liked['liked'] and not unliked['liked']
+          and unliked['total_likes'] == liked['total_likes'] - 1)
+    check('async post_like: anonymous -> login redirect', Client().post(f'/post/{post.slug}/like/').status_code == 302)
+
+
+def load_wsgi(path, cookie, concurrency, requests):
+    # A threaded WSGI server (gunicorn --threads) - each request holds a thread
+    handler = WSGIHandler()
+    wsgi_get(handler, path, cookie)
+
+    def one(_):
+        started = time.perf_counter()
+        wsgi_get(handler, path, cookie)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(one, range(requests)))
+    return samples, time.perf_counter() - started
+
+
+def load_asgi(path, cookie, concurrency, requests):
+    # An ASGI server (uvicorn) - one event loop, concurrency requests in flight
+    handler = ASGIHandler()
+
+    async def client(count, samples):
+        for _ in range(count):
+            started = time.perf_counter()
+            await asgi_get(handler, path, cookie)
+            samples.append((time.perf_counter() - started) * 1000)
+
+    async def main():
+        await asgi_get(handler, path, cookie)
+        samples = []
+        started = time.perf_counter()
+        await asyncio.gather(*(client(requests // concurrency, samples) for _ in range(concurrency)))
+        return samples, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def compare(pages, cookie, concurrency, requests):
+    clients = f'{concurrency} concurrent clients' if concurrency > 1 else 'One request at a time'
+    print(f'\n{clients}, {requests} requests per page, {LATENCY * 1000:g} ms per query, {os.cpu_count()} CPUs')
+    print(f'{"":34} {"p50 ms":>8} {"p95 ms":>8} {"req/s":>8}')
+    modes = (
+        ('WSGI, sync views', False, load_wsgi),
+        ('ASGI, sync views', False, load_asgi),
+        ('ASGI, async views', True, load_asgi),
+    )
+    for name, path in pages.items():
+        print(name)
+        for label, async_views, load in modes:
+            use_async_views(async_views)
+            samples, seconds = load(path, cookie if name.endswith('(user)') else '', concurrency, requests)
+            samples.sort()
+            print(f'  {label:32} {statistics.median(samples):8.1f} '
+                  f'{samples[int(len(samples) * 0.95)]:8.1f} {len(samples) / seconds:8.0f}')
+
+
+def run(concurrency, requests, latency):
+    global LATENCY
+    warnings.filterwarnings('ignore', message='No directory at')
+    settings.DEBUG = False
+    # Not collected here - plain static URLs instead of the manifest's hashed ones
+    settings.STORAGES = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.BLOG_PAGE_CACHE_ENABLED = False
+    get_view_counter().flush_threshold = float('inf')
+    get_view_counter().flush_interval = float('inf')
+
+    call_command('migrate', verbosity=0)
+    print(f'Creating 500 posts in {settings.DATABASES["default"]["NAME"]}...')
+    make_posts(500, words=300, users=20)
+    RelatedPostsEngine().rebuild()
+    reader = User.objects.create_user('async_reader')
+    post = Post.objects.filter(status='published').order_by('id').first()
+    Comment.objects.bulk_create([Comment(post=post, author=reader, content=f'Comment {i}') for i in range(30)])
+    fill_tree_positions()
+    client = Client()
+    client.force_login(reader)
+    cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+    category = Category.objects.first()
+
+    pages = {
+        'home': '/',
+        'explore': '/explore/',
+        'category': f'/category/{category.slug}/',
+        'post_detail': f'/post/{post.slug}/',
+        'post_detail (user)': f'/post/{post.slug}/',
+    }
+    check_pages(pages, cookie)
+
+    connection_created.connect(add_latency)
+    connections.close_all()
+    LATENCY = latency / 1000
+    compare(pages, cookie, 1, 20)
+    compare(pages, cookie, concurrency, requests)
+    connection_created.disconnect(add_latency)
+    get_view_counter().flush()
+
+    if failures:
+        print(f'\n{len(failures)} async view checks failed')
+        sys.exit(1)
+    print('\nAsync views work')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=2)
+    options = parser.parse_args()
+    try:
+        run(options.concurrency, options.requests, options.latency)
+    finally:
+        connections.close_all()
+        shutil.rmtree(DIRECTORY, ignore_errors=True)
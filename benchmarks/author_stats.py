@@ -0,0 +1,167 @@
+"""
+Author stats check and benchmark - the profile page numbers from
+blog/author_stats.py: one query on a miss, none once cached, and still
+exact after posts are written, liked, unliked, read and deleted. Then the
+profile numbers of an author with 20,000 posts, the four COUNTs the
+template used to run vs the one query vs the cache. Counting up is
+checked on local memory, standing in for Redis (an atomic incr); the
+default file cache recomputes instead
+Usage: python -m benchmarks.author_stats   (exits with 1 on a failure)
+"""
+import random
+import sys
+
+from benchmarks.common import benchmark_database, make_posts, print_table, timed
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+
+from blog.author_stats import compute_author_stats, get_author_stats, get_cache
+from blog.counters import get_view_counter, recount_likes
+from blog.models import Post
+
+failures = []
+
+
+def check(label, ok):
+    print(f'{label:64} {"ok" if ok else "FAIL"}')
+    if not ok:
+        failures.append(label)
+
+
+def exact(label, *users):
+    # The numbers served (cached or not) match a fresh count
+    check(label, all(get_author_stats(user.pk) == compute_author_stats(user.pk) for user in users))
+
+
+def cached_queries(user):
+    with CaptureQueriesContext(connection) as queries:
+        get_author_stats(user.pk)
+    return len(queries)
+
+
+def write_post(author, number):
+    return Post.objects.create(
+        title=f'Stats post {number}', slug=f'stats-check-{number}', author=author,
+        content='Counted by the author stats', status='published',
+    )
+
+
+def check_stats():
+    author = User.objects.create_user('stats_author')
+    reader = User.objects.create_user('stats_reader')
+    other = User.objects.create_user('stats_other')
+    check('new user: all zero', get_author_stats(author.pk) == (0, 0, 0, 0))
+
+    get_cache().clear()
+    with CaptureQueriesContext(connection) as queries:
+        get_author_stats(author.pk)
+    check('miss: one query', len(queries) == 1)
+    check('cached: no query', cached_queries(author) == 0)
+
+    posts = [write_post(author, i) for i in range(3)]
+    check('new posts counted up, still cached', cached_queries(author) == 0 and get_author_stats(author.pk).posts == 3)
+    exact('new posts: exact', author)
+
+    get_author_stats(reader.pk)
+    posts[0].likes.add(reader, other)
+    check('like counted up, still cached', cached_queries(author) == 0 and cached_queries(reader) == 0)
+    exact('like: author and likers exact', author, reader, other)
+    posts[0].likes.add(reader)
+    exact('repeated like: nothing counted twice', author, reader)
+
+    reader.liked_posts.add(posts[1], posts[2])
+    exact('likes added from the user side: exact', author, reader)
+    posts[0].likes.remove(reader, author)
+    exact('unlike (one of them never liked): exact', author, reader, other)
+    reader.liked_posts.clear()
+    exact('user clears their likes: exact', author, reader)
+    posts[1].likes.add(reader, other)
+    posts[1].likes.clear()
+    exact('post clears its likes: exact', author, reader, other)
+
+    get_view_counter().write({posts[0].pk: 5, posts[2].pk: 2})
+    check('views written: counted up, still cached',
+          cached_queries(author) == 0 and get_author_stats(author.pk).views == 7)
+    exact('views written: exact', author)
+
+    posts[2].likes.add(reader, other)
+    posts[2].delete()
+    exact('deleted post: author and its likers exact', author, reader, other)
+    other.delete()
+    exact('deleted user: authors of the posts they liked exact', author)
+
+    client = Client()
+    client.force_login(author)
+    response = client.get('/accounts/profile/')
+    check('profile page shows the stats', response.status_code == 200 and response.context['stats'] == get_author_stats(author.pk))
+    with CaptureQueriesContext(connection) as queries:
+        client.get('/accounts/profile/')
+    counts = [query['sql'] for query in queries if 'COUNT(' in query['sql'] or 'SUM(' in query['sql']]
+    check(f'profile page: no counting query with cached stats ({len(queries)} queries)', not counts)
+
+
+def compare():
+    make_posts(20000, words=20, users=1, prefix='stats')
+    author = User.objects.get(username='stats_user_0')
+    readers = User.objects.bulk_create([User(username=f'stats_liker_{i}') for i in range(300)])
+    rng = random.Random(42)
+    post_ids = list(author.blog_posts.values_list('id', flat=True))
+    through = Post.likes.through
+    through.objects.bulk_create([
+        through(post_id=post_id, user_id=reader.pk)
+        for reader in readers for post_id in rng.sample(post_ids, 100)
+    ])
+    recount_likes(post_ids)
+    through.objects.bulk_create([through(post_id=post_id, user_id=author.pk) for post_id in post_ids[:5000]])
+
+    def old_counts():
+        # What the template evaluated: each number twice, the views never
+        author.blog_posts.count(), author.blog_posts.count()
+        author.liked_posts.count(), author.liked_posts.count()
+
+    def compute():
+        compute_author_stats(author.pk)
+
+    def cached():
+        get_author_stats(author.pk)
+
+    get_cache().clear()
+    exact('20,000 posts: exact', author)
+    print_table('Profile numbers, author with 20,000 posts and 5,000 likes', [
+        ('4 COUNTs in the template (no views)', timed(old_counts)),
+        ('one query (cache miss)', timed(compute)),
+        ('cached', timed(cached)),
+    ])
+
+
+def check_file_cache():
+    # The default 'counters' file cache has no atomic incr - changes drop the numbers
+    author = User.objects.create_user('stats_file_author')
+    get_author_stats(author.pk)
+    write_post(author, 'file')
+    check('file cache: new post recomputed (1 query)', cached_queries(author) == 1)
+    exact('file cache: exact', author)
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    atomic = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'author-stats'}
+    with benchmark_database():
+        check_file_cache()
+        with override_settings(CACHES={**settings.CACHES, 'counters': atomic}):
+            check_stats()
+            compare()
+
+    if failures:
+        print(f'\n{len(failures)} author stats checks failed')
+        sys.exit(1)
+    print('\nAuthor stats are exact')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,161 @@
+"""
+Threaded comments check and benchmark - a post with thousands of nested
+comments: paged threads, "load more replies" and replying (blog/comments.py),
+then a page of threads against loading every comment of the post
+Usage: python -m benchmarks.comment_threads   (exits with 1 on a failure)
+"""
+import random
+import sys
+
+from benchmarks.common import benchmark_database, make_posts, print_table, timed
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.utils import timezone
+
+from blog.comments import fill_tree_positions, more_replies, thread_page
+from blog.counters import get_view_counter
+from blog.models import Comment, Post
+
+THREADS = 500
+REPLIES = 4500
+
+failures = []
+
+
+def check(label, ok):
+    print(f'{label:64} {"ok" if ok else "FAIL"}')
+    if not ok:
+        failures.append(label)
+
+
+def make_comments(post, users, seed=42):
+    # Top-level comments, then replies to random earlier comments, up to MAX_DEPTH deep
+    rng = random.Random(seed)
+    now = timezone.now()
+    roots = Comment.objects.bulk_create([
+        Comment(post=post, author=rng.choice(users), content=f'Thread {i}', created_at=now - timezone.timedelta(minutes=i))
+        for i in range(THREADS)
+    ])
+    levels = [roots]
+    per_level = REPLIES // Comment.MAX_DEPTH
+    for depth in range(1, Comment.MAX_DEPTH + 1):
+        parents = [rng.choice(levels[-1]) for _ in range(per_level)]
+        levels.append(Comment.objects.bulk_create([
+            Comment(post=post, author=rng.choice(users), parent=parent, content=f'Reply at {depth}', created_at=now)
+            for parent in parents
+        ]))
+    fill_tree_positions()
+
+
+def walk(post):
+    # Every comment of the post, page by page and "more replies" by "more replies"
+    seen, cursor, requests = [], None, 0
+    while True:
+        page = thread_page(post.id, cursor)
+        requests += 1
+        for thread in page:
+            seen += [comment.id for comment in thread]
+            after, more = thread.after, thread.more
+            while more:
+                replies, more = more_replies(thread.root.id, after)
+                requests += 1
+                seen += [comment.id for comment in replies]
+                after = replies[-1].path
+        cursor = page.next_cursor
+        if not cursor:
+            return seen, requests
+
+
+def check_threads(post):
+    with CaptureQueriesContext(connection) as queries:
+        page = thread_page(post.id)
+        threads = list(page)
+    check('first page of threads in one query', len(threads) == 10 and len(queries) == 1)
+    check('newest thread first', [thread.root.content for thread in threads[:2]] == ['Thread 0', 'Thread 1'])
+    check('at most 3 replies shown per thread', all(len(thread.comments) <= 4 for thread in threads))
+    check('replies in depth-first order',
+          all([c.path for c in thread] == sorted(c.path for c in thread) for thread in threads))
+    check('paths match parents',
+          all(c.path.startswith(c.parent.path) and c.depth == c.parent.depth + 1
+              for c in Comment.objects.filter(post=post, parent__isnull=False).select_related('parent')[:500]))
+
+    second = thread_page(post.id, page.next_cursor)
+    back = thread_page(post.id, second.previous_cursor)
+    check('previous cursor goes back a page', [t.root.id for t in back] == [t.root.id for t in threads])
+    check('invalid cursor falls back to the first page', [t.root.id for t in thread_page(post.id, 'garbage')] == [t.root.id for t in threads])
+
+    seen, requests = walk(post)
+    total = Comment.objects.filter(post=post).count()
+    check(f'{requests} requests show all {total} comments once', sorted(seen) == sorted(
+        Comment.objects.filter(post=post).values_list('id', flat=True)) and len(seen) == len(set(seen)))
+
+
+def check_views(post, user):
+    client = Client()
+    client.force_login(user)
+    root = thread_page(post.id)[0].root
+    deepest = Comment.objects.filter(post=post, depth=Comment.MAX_DEPTH).first()
+
+    response = client.post(f'/post/{post.slug}/comment/', {'content': 'A reply', 'parent': deepest.id})
+    reply = Comment.objects.latest('id')
+    check('reply past MAX_DEPTH answers the parent instead',
+          reply.parent_id == deepest.parent_id and reply.depth == Comment.MAX_DEPTH)
+    check('reply redirects to its anchor', response['Location'].endswith(f'#comment-{reply.id}'))
+    other = Comment.objects.exclude(post=post).first()
+    response = client.post(f'/post/{post.slug}/comment/', {'content': 'Wrong post', 'parent': other.id})
+    check("replying to another post's comment is refused", Comment.objects.latest('id') == reply)
+
+    thread = thread_page(post.id)[0]
+    response = Client().get(f'/comment/{root.id}/replies/', {'after': thread.after})
+    check('replies endpoint renders the next replies',
+          response.status_code == 200 and (thread.more == 0 or b'comment-' in response.content))
+    check('replies endpoint only for top-level comments',
+          Client().get(f'/comment/{reply.id}/replies/').status_code == 404)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = Client().get(f'/post/{post.slug}/')
+    # Not counting the newest comment id in the conditional GET state (blog/conditional.py)
+    comment_queries = [
+        q['sql'] for q in queries if 'FROM "blog_comment"' in q['sql'] and 'newest_comment' not in q['sql']
+    ]
+    check('post page loads its comment threads in one query', response.status_code == 200 and len(comment_queries) == 1)
+
+
+def compare(post):
+    total = Comment.objects.filter(post=post).count()
+    page = list(thread_page(post.id))
+    shown = sum(len(thread.comments) for thread in page)
+    print_table(f'Comments on a post with {total} comments', [
+        (f'every comment ({total} rows)', timed(lambda: list(Comment.objects.filter(post=post).select_related('author')))),
+        (f'a page of threads ({shown} rows)', timed(lambda: list(thread_page(post.id)))),
+        ('more replies (one thread)', timed(lambda: more_replies(page[0].root.id, page[0].after))),
+    ])
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.BLOG_PAGE_CACHE_ENABLED = False
+    with benchmark_database():
+        make_posts(20, words=100, users=20)
+        users = list(User.objects.all())
+        post = Post.objects.filter(status='published').first()
+        make_comments(post, users)
+        Comment.objects.create(post=Post.objects.exclude(id=post.id).first(), author=users[0], content='Elsewhere')
+        check_threads(post)
+        check_views(post, users[0])
+        compare(post)
+        get_view_counter().flush()
+
+    if failures:
+        print(f'\n{len(failures)} comment thread checks failed')
+        sys.exit(1)
+    print('\nComment threads work')
+
+
+if __name__ == '__main__':
+    run()
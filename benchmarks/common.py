@@ -0,0 +1,61 @@
+"""
+Shared helpers for the benchmark scripts
+Every benchmark runs against a throwaway test database, never db.sqlite3
+"""
+import atexit
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog_project.settings')
+# A page cache of its own, the site's cached pages are left alone
+if 'BLOG_CACHE_DIR' not in os.environ:
+    os.environ['BLOG_CACHE_DIR'] = tempfile.mkdtemp(prefix='bloghub-cache-')
+    atexit.register(shutil.rmtree, os.environ['BLOG_CACHE_DIR'], True)
+django.setup()
+
+from django.db import connection
+
+# The sample data is shared with the tests
+from blog.tests.base import make_posts, page_urls  # noqa: F401
+
+
+@contextmanager
+def benchmark_database():
+    # Create a fresh test database and drop it again afterwards
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def timed(func, repeat=20):
+    """
+    Calls func repeat times, returns timings in milliseconds
+    as a dict with median, p95 and best
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'median': statistics.median(samples),
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'best': samples[0],
+    }
+
+
+def print_table(title, rows):
+    # rows: list of (label, timings dict)
+    print(f'\n{title}')
+    print(f'{"":40} {"median ms":>10} {"p95 ms":>10} {"best ms":>10}')
+    for label, result in rows:
+        print(f'{label:40} {result["median"]:10.2f} {result["p95"]:10.2f} {result["best"]:10.2f}')
@@ -0,0 +1,169 @@
+"""
+Conditional GET check - home, category and post pages send an ETag,
+answer revalidations with 304 Not Modified without rendering, and stop
+matching once something they show changes
+Usage: python -m benchmarks.conditional_get   (exits with 1 on a failure)
+"""
+import sys
+import time
+
+from benchmarks.common import benchmark_database, make_posts
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.signals import template_rendered
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.utils import timezone
+from django.utils.http import http_date
+
+from blog.counters import get_view_counter
+from blog.models import Comment, Post
+from blog.related import RelatedPostsEngine
+
+failures = []
+
+
+def check(label, ok):
+    print(f'{label:64} {"ok" if ok else "FAIL"}')
+    if not ok:
+        failures.append(label)
+
+
+def revalidate(client, url, response):
+    # Repeat a request the way a browser does, returns (response, queries, templates rendered)
+    rendered = []
+
+    def on_render(sender, template, **kwargs):
+        rendered.append(template.name)
+
+    template_rendered.connect(on_render)
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            again = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    finally:
+        template_rendered.disconnect(on_render)
+    return again, len(queries), len(rendered)
+
+
+def check_page(name, client, url, max_queries):
+    response = client.get(url)
+    check(f'{name}: ETag, no Last-Modified', response.has_header('ETag') and not response.has_header('Last-Modified'))
+    check(f'{name}: varies on Cookie', 'Cookie' in response.get('Vary', ''))
+    again, queries, rendered = revalidate(client, url, response)
+    check(f'{name}: If-None-Match -> 304, {queries} queries', again.status_code == 304 and queries <= max_queries)
+    check(f'{name}: 304 renders no template', rendered == 0 and not again.content)
+    # No Last-Modified, so a date - even one in the future - never gives a 304
+    again = client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 3600))
+    check(f'{name}: If-Modified-Since alone -> 200', again.status_code == 200)
+    return response
+
+
+def changed(client, url, response):
+    return client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    with benchmark_database():
+        make_posts(40, words=100, users=5)
+        RelatedPostsEngine().rebuild()
+        reader = User.objects.create_user('reader', password='reader-pass')
+        post = Post.objects.order_by('-published_at').first()
+        category = post.category
+        related = Post.objects.filter(related_from__post=post).order_by('-related_from__score').first()
+        pages = {'home': '/', 'category': category.get_absolute_url(), 'post_detail': post.get_absolute_url()}
+
+        # Revalidations that miss the page cache read the page's state
+        settings.BLOG_PAGE_CACHE_ENABLED = False
+        anonymous = Client()
+        budget = {'home': 2, 'category': 3, 'post_detail': 3}
+        first = {name: check_page(name, anonymous, url, budget[name]) for name, url in pages.items()}
+
+        get_view_counter().flush()
+        views = Post.objects.get(id=post.id).views
+        anonymous.get(pages['post_detail'], HTTP_IF_NONE_MATCH=first['post_detail']['ETag'])
+        get_view_counter().flush()
+        check('post_detail: a 304 still counts the view', Post.objects.get(id=post.id).views == views + 1)
+
+        # Page cache hits answer revalidations without any query
+        settings.BLOG_PAGE_CACHE_ENABLED = True
+        for cache in caches.all():
+            cache.clear()
+        for name, url in pages.items():
+            response = anonymous.get(url)
+            anonymous.get(url)  # stored
+            again, queries, _ = revalidate(anonymous, url, response)
+            check(f'{name}: cached page -> 304, {queries} queries', again.status_code == 304 and queries == 0)
+        settings.BLOG_PAGE_CACHE_ENABLED = False
+
+        # Logged-in pages are validated per user
+        client = Client()
+        client.login(username='reader', password='reader-pass')
+        mine = check_page('post_detail (logged in)', client, pages['post_detail'], 5)
+        check('logged in: private, own ETag',
+              'private' in mine['Cache-Control'] and mine['ETag'] != first['post_detail']['ETag'])
+        client.post(f'{pages["post_detail"]}like/')
+        check('logged in: own like -> 200', changed(client, pages['post_detail'], mine))
+        response = client.post(f'{pages["post_detail"]}comment/', {'content': 'Nice'}, follow=True)
+        check('page with a flash message has no ETag', not response.has_header('ETag'))
+
+        # Changes to what the pages show
+        first = {name: anonymous.get(url) for name, url in pages.items()}
+        Comment.objects.create(post=post, author=reader, content='Another one')
+        check('new comment -> post_detail 200', changed(anonymous, pages['post_detail'], first['post_detail']))
+        check('new comment -> home still 304', not changed(anonymous, pages['home'], first['home']))
+
+        first = {name: anonymous.get(url) for name, url in pages.items()}
+        related.likes.add(reader)
+        check('like on a related post -> post_detail 200', changed(anonymous, pages['post_detail'], first['post_detail']))
+
+        first = {name: anonymous.get(url) for name, url in pages.items()}
+        post.title = 'Edited title'
+        post.save()
+        for name, url in pages.items():
+            check(f'edited post -> {name} 200', changed(anonymous, url, first[name]))
+
+        # The validators come from the database, not from this process's cache
+        first = {name: anonymous.get(url) for name, url in pages.items()}
+        Post.objects.filter(id=post.id).update(title='Edited elsewhere', updated_at=timezone.now())
+        for name, url in pages.items():
+            check(f'post edited without signals -> {name} 200', changed(anonymous, url, first[name]))
+
+        first = {name: anonymous.get(url) for name, url in pages.items()}
+        category.name = 'Renamed'
+        category.save()
+        for name, url in pages.items():
+            check(f'renamed category -> {name} 200', changed(anonymous, url, first[name]))
+
+        first = {name: anonymous.get(url) for name, url in pages.items()}
+        category.description = 'Edited description'
+        category.save()
+        check('category description edit -> category 200', changed(anonymous, pages['category'], first['category']))
+
+        first = {name: anonymous.get(url) for name, url in pages.items()}
+        Post.objects.create(
+            title='Brand new', slug='brand-new', author=reader, category=category,
+            content='Fresh', status='published',
+        )
+        check('new post -> home 200', changed(anonymous, pages['home'], first['home']))
+        check('new post -> category 200', changed(anonymous, pages['category'], first['category']))
+
+        first = {name: anonymous.get(url) for name, url in pages.items()}
+        Post.objects.get(slug='brand-new').delete()
+        check('deleted post -> home 200', changed(anonymous, pages['home'], first['home']))
+        check('deleted post -> category 200', changed(anonymous, pages['category'], first['category']))
+
+        get_view_counter().flush()
+
+    if failures:
+        print(f'\n{len(failures)} conditional GET checks failed')
+        sys.exit(1)
+    print('\nConditional GET works')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,83 @@
+"""
+HTML size report - bytes per page with the CSS/JS inlined (as the templates
+used to ship it) against the HTML that links the static files instead
+Repeat visits only download the HTML: the static files are cached for a
+year under their hashed names
+Usage: python -m benchmarks.html_size
+"""
+import gzip
+import re
+
+from benchmarks.common import benchmark_database, make_posts
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from blog.models import Category, Post
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ASSET = re.compile(r'(?:href|src)="%s([^"]+\.(?:css|js))"' % re.escape(settings.STATIC_URL))
+
+
+def sizes(data):
+    return len(data), len(gzip.compress(data, 6)), len(brotli.compress(data)) if brotli else 0
+
+
+def linked_assets(html):
+    # Local stylesheets and scripts the page links to
+    assets = {}
+    for path in ASSET.findall(html.decode()):
+        with open(finders.find(path), 'rb') as f:
+            assets[path] = f.read()
+    return assets
+
+
+def page_urls():
+    post = Post.objects.order_by('id').first()
+    return {
+        'home': ('/', False),
+        'explore': ('/explore/', False),
+        'post_detail': (post.get_absolute_url(), False),
+        'category': (Category.objects.order_by('id').first().get_absolute_url(), False),
+        'profile': ('/accounts/profile/', True),
+        'profile_edit': ('/accounts/profile/edit/', True),
+        'post_form': ('/create/', True),
+    }
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.BLOG_PAGE_CACHE_ENABLED = False
+    with benchmark_database():
+        make_posts(30, words=300, users=5)
+        reader = User.objects.create_user('reader')
+
+        print(f'{"":14} {"inlined (before)":>27} {"linked (after)":>27} {"static files":>27}')
+        print(f'{"bytes":14}' + f' {"raw":>9} {"gzip":>8} {"br":>8}' * 3)
+        totals = [0, 0]
+        for name, (url, logged_in) in page_urls().items():
+            client = Client()
+            if logged_in:
+                client.force_login(reader)
+            response = client.get(url)
+            assert response.status_code == 200, f'{url} returned {response.status_code}'
+            html = response.content
+            assets = b''.join(linked_assets(html).values())
+            before, after, static = sizes(html + assets), sizes(html), sizes(assets)
+            totals[0] += before[1]
+            totals[1] += after[1]
+            print(f'{name:14}' + ''.join(f' {raw:9} {gz:8} {br:8}' for raw, gz, br in (before, after, static)))
+        print(f'\nEvery page, gzip: {totals[0]} bytes inlined, {totals[1]} linked '
+              f'({100 - totals[1] * 100 // totals[0]}% less per repeat visit)')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,116 @@
+"""
+Image benchmark - upload latency and image bytes per page view,
+raw uploads vs responsive renditions
+Usage: python -m benchmarks.images
+"""
+import io
+import random
+import re
+import tempfile
+import time
+
+from benchmarks.common import benchmark_database, make_posts
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.test import Client
+from django.test.utils import setup_test_environment
+from PIL import Image, ImageDraw, ImageFilter
+
+from blog.models import Category, Post
+from blog.tasks import Worker
+
+# (label, viewport width, device pixel ratio, card slot width in CSS px)
+# slots follow the home card sizes attribute
+SCREENS = (
+    ('phone 390px @3x', 390, 3, 390),
+    ('tablet 820px @2x', 820, 2, 410),
+    ('laptop 1440px @1x', 1440, 1, 420),
+    ('laptop 1440px @2x', 1440, 2, 420),
+)
+
+
+def photo(width=3000, height=2000, seed=1):
+    # Something JPEG-like: gradients, shapes and a little grain, as a camera upload
+    rng = random.Random(seed)
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(40, 400)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+    image = image.filter(ImageFilter.GaussianBlur(3))
+    grain = Image.effect_noise((width, height), 12).convert('RGB')
+    image = Image.blend(image, grain, 0.08)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=92)
+    buffer.name = 'holiday.jpg'
+    buffer.seek(0)
+    return buffer
+
+
+def upload(client, category, number):
+    data = {
+        'title': f'Upload {number}', 'slug': f'upload-{number}', 'content': 'Pictures from the trip',
+        'category': category.id, 'status': 'published', 'featured_image': photo(seed=number),
+    }
+    started = time.perf_counter()
+    response = client.post('/create/', data)
+    elapsed = (time.perf_counter() - started) * 1000
+    assert response.status_code == 302, response.status_code
+    return elapsed
+
+
+def chosen_rendition(sizes, slot, ratio):
+    # What the browser fetches: the smallest candidate covering slot * ratio
+    needed = slot * ratio
+    return next((entry for entry in sizes if entry['width'] >= needed), sizes[-1])
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.MEDIA_ROOT = tempfile.mkdtemp()
+    settings.BLOG_PAGE_CACHE_ENABLED = False
+
+    with benchmark_database():
+        make_posts(6, words=50)
+        User.objects.create_user('photographer', password='photo-pass')
+        client = Client()
+        client.login(username='photographer', password='photo-pass')
+        category = Category.objects.first()
+
+        timings = {}
+        for label, eager in (('resize during the request', True), ('resize in the task worker', False)):
+            settings.BLOG_TASKS_EAGER = eager
+            samples = sorted(upload(client, category, len(timings) * 10 + i) for i in range(5))
+            Worker().run_pending()
+            timings[label] = samples[len(samples) // 2]
+
+        print('\npost_create with a 3000x2000 JPEG upload (median of 5)')
+        for label, ms in timings.items():
+            print(f'{label:40} {ms:10.1f} ms')
+
+        uploaded = Post.objects.filter(slug__startswith='upload-').exclude(featured_image_renditions={}).first()
+        renditions = uploaded.featured_image_renditions
+        Post.objects.update(featured_image=uploaded.featured_image.name, featured_image_renditions=renditions)
+
+        html = client.get('/').content.decode()
+        assert 'srcset=' in html and 'loading="lazy"' in html
+        cards = len(re.findall(r'<picture>', html))
+        original = default_storage.size(renditions['source'])
+
+        print(f'\nImage bytes for the home page ({cards} cards)')
+        print(f'{"":24} {"raw upload":>12} {"WebP rendition":>16} {"JPEG rendition":>16}')
+        for label, _, ratio, slot in SCREENS:
+            entry = chosen_rendition(renditions['sizes'], slot, ratio)
+            webp = default_storage.size(entry['webp'])
+            jpeg = default_storage.size(entry['jpeg'])
+            print(f'{label:24} {cards * original / 1024:10.0f} KB {cards * webp / 1024:14.0f} KB {cards * jpeg / 1024:14.0f} KB'
+                  f'   ({entry["width"]}w)')
+
+
+if __name__ == '__main__':
+    run()
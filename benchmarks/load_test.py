@@ -0,0 +1,459 @@
+"""
+End-to-end load test - boots the site under gunicorn (WSGI, or ASGI with
+--asgi) against a dataset made by generate_data, drives a traffic mix
+over HTTP and reports per view p50/p95/p99 latency, throughput and SQL
+queries per request (from the Server-Timing header)
+
+Anonymous clients read the home, explore, post, search and category pages.
+Logged-in clients (--logged-in of them) also like posts and comment. Posts
+are picked by popularity, so the popular ones get most of the traffic, as
+in production. Every client has its own seeded random generator.
+
+The dataset is generated into a throwaway SQLite file, or kept in --db
+and reused by later runs. --existing uses the database from the settings
+instead (e.g. PostgreSQL through DB_ENGINE/DB_NAME), which generate_data
+has filled. The task worker runs next to the server, as in production.
+
+Results can be saved as a JSON baseline, and a run (or a saved file)
+compared with one. A view whose latency or queries grew, or whose
+throughput dropped, by more than --threshold percent is a regression.
+Numbers only compare between runs on the same machine.
+Usage: python -m benchmarks.load_test [--duration 30] [--concurrency 16] [--asgi] [--save FILE] [--baseline FILE]
+       python -m benchmarks.load_test --compare OLD.json NEW.json   (both exit with 1 on a regression)
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from itertools import accumulate
+from urllib.parse import urlencode
+
+ANONYMOUS_MIX = (('home', 30), ('explore', 10), ('post', 40), ('search', 10), ('category', 10))
+LOGGED_IN_MIX = (('home', 20), ('post', 40), ('like', 25), ('comment', 15))
+POPULAR_POSTS = 10000   # posts the clients pick from, most viewed first
+MIN_SAMPLES = 20        # fewer requests than this are too noisy to compare latency
+MIN_QUERIES = 0.5       # smaller rises in queries per request are page cache hit ratio noise
+MAX_ERROR_RISE = 1      # percentage points of failed requests
+SETUP = ('server', 'workers', 'threads', 'concurrency', 'logged_in', 'dataset')
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+MANAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'manage.py')
+
+
+def percentile(samples, q):
+    # Nearest rank, samples sorted
+    return samples[max(0, math.ceil(q * len(samples)) - 1)] if samples else 0.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Client:
+    """
+    One simulated visitor: a keep-alive connection, its cookies and its random generator
+    """
+
+    def __init__(self, port, rng):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self.cookies = {}
+        self.rng = rng
+
+    def request(self, method, path, data=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            # Closed keep-alive connection or a server error - the next request reconnects
+            self.connection.close()
+            raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0' or not morsel.value:
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+        return response
+
+    def login(self, username, password):
+        self.request('GET', '/accounts/login/')
+        response = self.request('POST', '/accounts/login/', {
+            'username': username, 'password': password, 'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''),
+        })
+        return response.status == 302 and 'sessionid' in self.cookies
+
+
+class Traffic:
+    """
+    What the clients request: the pages of the mix, with popular posts picked most
+    """
+
+    def __init__(self, posts, categories, terms):
+        self.posts = posts
+        self.post_weights = list(accumulate(1 / rank for rank in range(1, len(posts) + 1)))
+        self.categories = categories
+        self.terms = terms
+        self.term_weights = list(accumulate(1 / rank for rank in range(1, len(terms) + 1)))
+
+    def post(self, rng):
+        return rng.choices(self.posts, cum_weights=self.post_weights)[0]
+
+    def send(self, client, action):
+        rng = client.rng
+        if action == 'home':
+            return client.request('GET', '/')
+        if action == 'explore':
+            return client.request('GET', '/explore/')
+        if action == 'post':
+            return client.request('GET', f'/post/{self.post(rng)}/')
+        if action == 'search':
+            terms = ' '.join(rng.choices(self.terms, cum_weights=self.term_weights, k=rng.randint(1, 2)))
+            return client.request('GET', '/?' + urlencode({'search': terms}))
+        if action == 'category':
+            return client.request('GET', f'/category/{rng.choice(self.categories)}/')
+        if action == 'like':
+            return client.request('POST', f'/post/{self.post(rng)}/like/', {},
+                                  {'X-CSRFToken': client.cookies.get('csrftoken', '')})
+        if action == 'comment':
+            return client.request('POST', f'/post/{self.post(rng)}/comment/', {
+                'content': ' '.join(rng.choices(self.terms, k=rng.randint(5, 30))).capitalize(),
+                'csrfmiddlewaretoken': client.cookies.get('csrftoken', ''),
+            })
+        raise ValueError(action)
+
+
+class Results:
+    """
+    Latencies, SQL query counts and errors per view, from every client thread
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.queries = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, action, seconds, response):
+        with self.lock:
+            if response is None or response.status >= 400:
+                self.errors[action] = self.errors.get(action, 0) + 1
+                return
+            self.latencies.setdefault(action, []).append(seconds * 1000)
+            match = QUERIES.search(response.headers.get('Server-Timing', ''))
+            if match:
+                self.queries.setdefault(action, []).append(int(match[1]))
+
+    def summary(self, duration):
+        views = {}
+        for action in sorted(set(self.latencies) | set(self.errors)):
+            views[action] = summarize(self.latencies.get(action, []), self.queries.get(action, []),
+                                      self.errors.get(action, 0), duration)
+        views['total'] = summarize(
+            [ms for samples in self.latencies.values() for ms in samples],
+            [n for counts in self.queries.values() for n in counts],
+            sum(self.errors.values()), duration,
+        )
+        return views
+
+
+def summarize(latencies, queries, errors, duration):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / duration, 1),
+        'latency_ms': {f'p{int(q * 100)}': round(percentile(latencies, q), 2) for q in (0.5, 0.95, 0.99)},
+        'queries': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def run_client(client, mix, traffic, results, warmup_until, deadline):
+    actions = [action for action, _ in mix]
+    weights = list(accumulate(weight for _, weight in mix))
+    while True:
+        action = client.rng.choices(actions, cum_weights=weights)[0]
+        started = time.perf_counter()
+        try:
+            response = traffic.send(client, action)
+        except (OSError, http.client.HTTPException):
+            response = None
+        finished = time.perf_counter()
+        if finished >= deadline:
+            return
+        if started >= warmup_until:
+            results.add(action, finished - started, response)
+
+
+def load(port, traffic, args, usernames):
+    """
+    Runs the clients for the warmup and the measured duration, returns the summary
+    """
+    clients = []
+    logged_in = round(args.concurrency * args.logged_in)
+    for i in range(args.concurrency):
+        client = Client(port, random.Random(f'{args.seed}:client:{i}'))
+        if i < logged_in and not client.login(usernames[i % len(usernames)], args.password):
+            raise SystemExit(f'Could not log in as {usernames[i % len(usernames)]}')
+        clients.append((client, LOGGED_IN_MIX if i < logged_in else ANONYMOUS_MIX))
+
+    results = Results()
+    started = time.perf_counter()
+    warmup_until = started + args.warmup
+    deadline = warmup_until + args.duration
+    threads = [
+        threading.Thread(target=run_client, args=(client, mix, traffic, results, warmup_until, deadline))
+        for client, mix in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.summary(args.duration)
+
+
+def manage(*command, env):
+    subprocess.run([sys.executable, MANAGE, *command], env=env, check=True)
+
+
+def prepare_data(args, env):
+    # Generates the dataset unless --existing, or --db already holds one
+    if args.existing or (args.db and os.path.exists(args.db)):
+        return
+    manage('migrate', '-v0', env=env)
+    manage('generate_data', '--users', str(args.users), '--posts', str(args.posts), '--seed', str(args.seed),
+           '--prefix', args.prefix, '--password', args.password, env=env)
+
+
+def read_traffic(args):
+    """
+    Post and category slugs, search terms and usernames for the clients
+    Django is set up only here, after the environment names the database
+    """
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.db import connections
+
+    from blog.datagen import TOPICS
+    from blog.models import Category, Post
+
+    posts = list(
+        Post.objects.filter(status='published').order_by('-views', '-id').values_list('slug', flat=True)[:POPULAR_POSTS]
+    )
+    categories = list(Category.objects.filter(posts__status='published').distinct().values_list('slug', flat=True))
+    usernames = list(
+        User.objects.filter(username__startswith=f'{args.prefix}_user_').order_by('id')
+        .values_list('username', flat=True)[:args.concurrency]
+    )
+    connections.close_all()
+    if not posts or not usernames:
+        raise SystemExit(f'No generated data - run: python manage.py generate_data --prefix {args.prefix}')
+    return Traffic(posts, categories, list(TOPICS)), usernames
+
+
+def start_server(args, port, env, log):
+    if args.asgi:
+        command = ['-k', 'uvicorn.workers.UvicornWorker', 'blog_project.asgi:application']
+    else:
+        command = ['--threads', str(args.threads), 'blog_project.wsgi:application']
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--bind', f'127.0.0.1:{port}', *command],
+        cwd=os.path.dirname(MANAGE), env=env, stdout=log, stderr=log,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit('The server exited, see its log above')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/accounts/login/')
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit('The server did not answer within 60 seconds')
+
+
+def stop(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(MANAGE)).stdout.strip()
+    except OSError:
+        return ''
+
+
+def print_summary(summary):
+    print(f'\n{"view":10} {"requests":>9} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"errors":>7}')
+    for view, result in summary['views'].items():
+        latency = result['latency_ms']
+        queries = '-' if result['queries'] is None else f'{result["queries"]:.1f}'
+        print(f'{view:10} {result["requests"]:9} {result["throughput"]:8.1f} {latency["p50"]:8.1f} '
+              f'{latency["p95"]:8.1f} {latency["p99"]:8.1f} {queries:>8} {result["errors"]:7}')
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints each view's change against the baseline, returns the regressions
+    A latency or query count up, or throughput down, by more than threshold percent
+    (and queries by at least MIN_QUERIES), or more requests failing
+    """
+    regressions = []
+    print(f'\nAgainst the baseline from {baseline["meta"]["date"]} ({baseline["meta"].get("commit") or "?"}), '
+          f'threshold {threshold:g}%')
+    for key in SETUP:
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print(f'Note: {key} was {baseline["meta"].get(key)}, now {current["meta"].get(key)}')
+    print(f'{"view":10} {"metric":11} {"baseline":>10} {"current":>10} {"change":>8}')
+    for view, new in current['views'].items():
+        old = baseline['views'].get(view)
+        if old is None:
+            continue
+        metrics = [('throughput', old['throughput'], new['throughput'], -1)]
+        if min(old['requests'], new['requests']) >= MIN_SAMPLES:
+            metrics += [(name, old['latency_ms'][name], new['latency_ms'][name], 1) for name in ('p50', 'p95', 'p99')]
+        if old['queries'] is not None and new['queries'] is not None:
+            metrics.append(('queries', old['queries'], new['queries'], 1))
+        for name, before, after, direction in metrics:
+            change = (after - before) / before * 100 if before else 0.0
+            regressed = change * direction > threshold and (name != 'queries' or after - before >= MIN_QUERIES)
+            if regressed:
+                regressions.append((view, name))
+            print(f'{view:10} {name:11} {before:10.2f} {after:10.2f} {change:+7.1f}%{"  REGRESSION" if regressed else ""}')
+        before, after = error_rate(old), error_rate(new)
+        if after > before + MAX_ERROR_RISE:
+            regressions.append((view, 'errors'))
+            print(f'{view:10} {"errors":11} {before:9.1f}% {after:9.1f}%           REGRESSION')
+    return regressions
+
+
+def error_rate(result):
+    total = result['requests'] + result['errors']
+    return result['errors'] / total * 100 if total else 0.0
+
+
+def report(regressions):
+    if regressions:
+        print(f'\n{len(regressions)} regressions: ' + ', '.join(f'{view} {name}' for view, name in regressions))
+        sys.exit(1)
+    print('\nNo regressions')
+
+
+def run(args):
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, BLOG_TASKS_EAGER='False')
+    if not args.existing:
+        env.update(DB_ENGINE='sqlite', DB_NAME=args.db or os.path.join(directory, 'load.sqlite3'), DB_REPLICAS='')
+    os.environ.update(env)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog_project.settings')
+    log = open(os.path.join(directory, 'server.log'), 'w+')
+    processes = []
+    try:
+        prepare_data(args, env)
+        traffic, usernames = read_traffic(args)
+        port = free_port()
+        processes.append(subprocess.Popen([sys.executable, MANAGE, 'run_tasks'], env=env, stdout=log, stderr=log))
+        processes.append(start_server(args, port, env, log))
+        server = 'gunicorn + uvicorn (ASGI)' if args.asgi else f'gunicorn (WSGI, {args.threads} threads)'
+        print(f'{server}, {args.workers} workers: {args.concurrency} clients ({args.logged_in:.0%} logged in), '
+              f'{args.warmup}s warmup + {args.duration}s')
+        views = load(port, traffic, args, usernames)
+    except BaseException:
+        log.seek(0)
+        print(log.read()[-4000:], file=sys.stderr)
+        raise
+    finally:
+        for process in reversed(processes):
+            stop(process)
+        log.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    summary = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': git_commit(),
+            'server': 'asgi' if args.asgi else 'wsgi',
+            'workers': args.workers,
+            'threads': None if args.asgi else args.threads,
+            'concurrency': args.concurrency,
+            'logged_in': args.logged_in,
+            'duration': args.duration,
+            'dataset': 'existing' if args.existing else {'users': args.users, 'posts': args.posts, 'seed': args.seed},
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'views': views,
+    }
+    print_summary(summary)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as file:
+            json.dump(summary, file, indent=2)
+        print(f'\nSaved to {args.save}')
+    if args.baseline:
+        with open(args.baseline) as file:
+            report(compare(json.load(file), summary, args.threshold))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of traffic before measuring')
+    parser.add_argument('--concurrency', type=int, default=16, help='Simulated clients, each one request at a time')
+    parser.add_argument('--logged-in', type=float, default=0.25, help='Share of the clients that log in')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per WSGI worker')
+    parser.add_argument('--asgi', action='store_true', help='Serve blog_project.asgi with uvicorn workers')
+    parser.add_argument('--users', type=int, default=1000, help='Dataset users')
+    parser.add_argument('--posts', type=int, default=5000, help='Dataset posts')
+    parser.add_argument('--seed', type=int, default=42, help='Dataset and traffic seed')
+    parser.add_argument('--prefix', default='gen', help='generate_data --prefix')
+    parser.add_argument('--password', default='password', help='generate_data --password')
+    parser.add_argument('--db', help='SQLite file for the dataset, reused when it exists')
+    parser.add_argument('--existing', action='store_true', help='Use the database from the settings as it is')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare the results with this JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two saved results, no run')
+    parser.add_argument('--threshold', type=float, default=15, help='Percent change that counts as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            report(compare(json.load(old), json.load(new), args.threshold))
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
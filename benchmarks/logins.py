@@ -0,0 +1,145 @@
+"""
+Login check and benchmark - a login saves the user's last_login, and the
+User post_save handler (accounts/models.py) only writes the profile when
+it was loaded with the user and changed. Checks when profiles are and
+aren't written and the create_profiles.py backfill, then logins per second
+against the old handler, which re-saved the profile on every user save
+Password hashing is cheap MD5 here, so the timings are the database work
+Usage: python -m benchmarks.logins   (exits with 1 on a failure)
+"""
+import os
+import runpy
+import sys
+
+from benchmarks.common import benchmark_database, print_table, timed
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+
+from accounts.models import UserProfile, save_user_profile
+from blog.models import Task
+
+PASSWORD = 'login-pass'
+
+failures = []
+
+
+def check(label, ok):
+    print(f'{label:64} {"ok" if ok else "FAIL"}')
+    if not ok:
+        failures.append(label)
+
+
+def profile_queries(queries):
+    return [query['sql'] for query in queries if 'accounts_userprofile' in query['sql']]
+
+
+def old_save_user_profile(sender, instance, **kwargs):
+    # The handler before: every user save loads and re-saves the profile
+    instance.profile.save()
+
+
+def login(username):
+    return Client().post('/accounts/login/', {'username': username, 'password': PASSWORD})
+
+
+def check_profile_writes():
+    with CaptureQueriesContext(connection) as queries:
+        user = User.objects.create_user('login_new', password=PASSWORD)
+    written = profile_queries(queries)
+    check('new user: one profile INSERT, nothing else', len(written) == 1 and written[0].startswith('INSERT'))
+
+    queued = Task.objects.count()
+    with CaptureQueriesContext(connection) as queries:
+        response = login('login_new')
+    check('login works', response.status_code == 302 and response.url == '/')
+    check('login: no profile query', not profile_queries(queries))
+    check('login: no task queued', Task.objects.count() == queued)
+
+    user = User.objects.select_related('profile').get(pk=user.pk)
+    with CaptureQueriesContext(connection) as queries:
+        user.first_name = 'Renamed'
+        user.save()
+    check('user saved with an untouched profile: no profile write', not profile_queries(queries))
+
+    user.profile.bio = 'Writes about databases'
+    with CaptureQueriesContext(connection) as queries:
+        user.save()
+    written = profile_queries(queries)
+    check('edited profile saved with its user, just that column',
+          len(written) == 1 and '"bio"' in written[0] and '"location"' not in written[0])
+    check('edit stored', UserProfile.objects.get(user=user).bio == 'Writes about databases')
+
+    user.profile.profile_picture_renditions['source'] = 'profiles/new.jpg'
+    check('JSON edited in place counts as a change', user.profile.changed_fields() == ['profile_picture_renditions'])
+    user.profile.save(update_fields=['profile_picture_renditions'])
+    check('nothing left to save after saving it', user.profile.changed_fields() == [])
+
+
+def check_backfill():
+    users = User.objects.bulk_create([
+        User(username=f'login_bulk_{i}', password=make_password(PASSWORD)) for i in range(2500)
+    ])
+    check('bulk_create made no profiles', not UserProfile.objects.filter(user__in=users).exists())
+    with CaptureQueriesContext(connection) as queries:
+        backfill = timed(lambda: runpy.run_path(os.path.join(settings.BASE_DIR, 'create_profiles.py')), repeat=1)
+    inserts = [sql for sql in profile_queries(queries) if sql.startswith('INSERT')]
+    check('create_profiles.py: every user has a profile', not User.objects.filter(profile__isnull=True).exists())
+    check(f'create_profiles.py: 2500 profiles in {len(inserts)} batched INSERTs', len(inserts) <= 25)
+
+    UserProfile.objects.filter(user__in=users).delete()
+
+    def one_by_one():
+        # The script before: a get_or_create per user (DEBUG off, so its queries aren't logged)
+        with override_settings(DEBUG=False):
+            for user in User.objects.all():
+                UserProfile.objects.get_or_create(user=user)
+
+    print_table('Backfilling 2500 profiles', [
+        ('get_or_create per user', timed(one_by_one, repeat=1)),
+        ('create_profiles.py, bulk', backfill),
+    ])
+
+
+def compare():
+    usernames = [f'login_bulk_{i}' for i in range(200)]
+    rows = []
+    per_login = {}
+    for label, handler in (('profile saved on every user save', old_save_user_profile),
+                           ('profile written when changed', save_user_profile)):
+        post_save.disconnect(save_user_profile, sender=User)
+        post_save.connect(handler, sender=User)
+        names = iter(usernames * 2)
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            login(usernames[0])
+        per_login[label] = len(queries)
+        rows.append((label, timed(lambda: login(next(names)), repeat=200)))
+        post_save.disconnect(handler, sender=User)
+    post_save.connect(save_user_profile, sender=User)
+    print_table('Login request (POST /accounts/login/)', rows)
+    for label, result in rows:
+        print(f'{label:40} {1000 / result["median"]:8.0f} logins/s  {per_login[label]} queries')
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']), benchmark_database():
+        check_profile_writes()
+        check_backfill()
+        compare()
+
+    if failures:
+        print(f'\n{len(failures)} login checks failed')
+        sys.exit(1)
+    print('\nLogins work')
+
+
+if __name__ == '__main__':
+    run()
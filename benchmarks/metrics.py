@@ -0,0 +1,167 @@
+"""
+Request metrics check and benchmark - RequestMetricsMiddleware
+(blog/metrics.py): Server-Timing against the queries Django sees, the staff
+stats page and Prometheus endpoint, async views, sampled profiles, then
+what the instrumentation costs per request
+Usage: python -m benchmarks.metrics   (exits with 1 on a failure)
+"""
+import asyncio
+import importlib
+import os
+import pstats
+import re
+import shutil
+import sys
+import tempfile
+
+from benchmarks.common import benchmark_database, make_posts, print_table, timed
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import clear_url_caches
+
+from blog.counters import get_view_counter
+from blog.metrics import get_metrics
+from blog.models import Post
+from blog.related import RelatedPostsEngine
+
+SERVER_TIMING = re.compile(r'sql;dur=([\d.]+);desc="(\d+) queries", tpl;dur=([\d.]+);desc="templates", total;dur=([\d.]+)')
+SAMPLE = re.compile(r'^[a-z_]+(\{[^}]*\})? [\d.e+-]+$')
+
+failures = []
+
+
+def check(label, ok):
+    print(f'{label:64} {"ok" if ok else "FAIL"}')
+    if not ok:
+        failures.append(label)
+
+
+def server_timing(response):
+    # (sql ms, queries, template ms, total ms)
+    match = SERVER_TIMING.fullmatch(response.get('Server-Timing', ''))
+    return (float(match[1]), int(match[2]), float(match[3]), float(match[4])) if match else None
+
+
+def use_async_views(enabled):
+    import blog.urls
+    import blog_project.urls
+    settings.BLOG_ASYNC_VIEWS = enabled
+    importlib.reload(blog.urls)
+    importlib.reload(blog_project.urls)
+    clear_url_caches()
+
+
+def check_timings(post):
+    client = Client()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get('/')
+    timing = server_timing(response)
+    check('Server-Timing header on the home page', timing is not None)
+    check(f'Server-Timing counts the {len(queries)} queries Django ran', timing and timing[1] == len(queries))
+
+    timing = server_timing(client.get(f'/post/{post.slug}/'))
+    check('post page: template and SQL time within the total',
+          timing and timing[2] > 0 and timing[0] > 0 and timing[0] < timing[3] and timing[2] < timing[3])
+
+    get_metrics().reset()
+    for _ in range(5):
+        client.get('/')
+    client.get('/no-such-page/')
+    views = get_metrics().summary()
+    check('5 home requests recorded under blog:home', views.get('blog:home', {}).get('requests') == 5)
+    check('latency percentiles in order', views['blog:home']['latency_ms']['p50'] <= views['blog:home']['latency_ms']['p99'])
+    check('unknown URL recorded as <unmatched> 4xx', views.get('<unmatched>', {}).get('status') == {'4xx': 1})
+
+
+def check_endpoints(staff):
+    check('stats page: anonymous sent to the login', Client().get('/stats/performance/').status_code == 302)
+    client = Client()
+    client.force_login(staff)
+    stats = client.get('/stats/performance/').json()
+    check('stats page: staff get per view JSON', 'blog:home' in stats['views'])
+
+    check('/metrics: anonymous refused', Client().get('/metrics').status_code == 403)
+    check('/metrics: wrong token refused', Client().get('/metrics', HTTP_AUTHORIZATION='Bearer nope').status_code == 403)
+    response = Client().get('/metrics', HTTP_AUTHORIZATION=f'Bearer {settings.BLOG_METRICS_TOKEN}')
+    text = response.content.decode()
+    check('/metrics: token accepted, Prometheus text', response.status_code == 200
+          and response['Content-Type'].startswith('text/plain; version=0.0.4'))
+    samples = [line for line in text.splitlines() if not line.startswith('#')]
+    check('/metrics: every sample line is well formed', samples and all(SAMPLE.match(line) for line in samples))
+    buckets = [int(line.rsplit(' ', 1)[1]) for line in samples
+               if line.startswith('bloghub_request_duration_seconds_bucket{view="blog:home"')]
+    count = next(int(line.rsplit(' ', 1)[1]) for line in samples
+                 if line.startswith('bloghub_request_duration_seconds_count{view="blog:home"}'))
+    check('/metrics: cumulative buckets end at the count', buckets == sorted(buckets) and buckets[-1] == count)
+
+
+def check_async(post):
+    sync_timing = server_timing(Client().get(f'/post/{post.slug}/'))
+    use_async_views(True)
+    try:
+        response = asyncio.run(AsyncClient().get(f'/post/{post.slug}/'))
+    finally:
+        use_async_views(False)
+    async_timing = server_timing(response)
+    check('async post page: queries in worker threads counted',
+          async_timing and sync_timing and async_timing[1] == sync_timing[1])
+
+
+def check_profiles():
+    directory = tempfile.mkdtemp()
+    settings.BLOG_PROFILE_SAMPLE_RATE = 1
+    settings.BLOG_PROFILE_SLOW_MS = 0
+    settings.BLOG_PROFILE_DIR = directory
+    try:
+        # A new client builds its own middleware, which reads the settings
+        Client().get('/explore/')
+        saved = list(os.scandir(directory))
+        check('sampled slow request saved as a .prof file', len(saved) == 1 and 'blog.explore' in saved[0].name)
+        functions = {name for _, _, name in pstats.Stats(saved[0].path).stats} if saved else set()
+        check('profile holds the view', 'explore' in functions)
+    finally:
+        settings.BLOG_PROFILE_SAMPLE_RATE = 0
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(post):
+    rows = []
+    middleware = list(settings.MIDDLEWARE)
+    for label, enabled in (('with metrics', True), ('without metrics', False)):
+        settings.MIDDLEWARE = middleware if enabled else [m for m in middleware if 'RequestMetrics' not in m]
+        client = Client()
+        rows.append((f'home, {label}', timed(lambda: client.get('/'), repeat=200)))
+        rows.append((f'post page, {label}', timed(lambda: client.get(f'/post/{post.slug}/'), repeat=200)))
+    settings.MIDDLEWARE = middleware
+    print_table('Request time (test client, page cache off)', rows)
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.BLOG_PAGE_CACHE_ENABLED = False
+    settings.BLOG_METRICS_TOKEN = 'scrape-token'
+    with benchmark_database():
+        make_posts(200, words=300, users=20)
+        RelatedPostsEngine().rebuild()
+        staff = User.objects.create_user('metrics_staff', is_staff=True)
+        post = Post.objects.filter(status='published').first()
+        check_timings(post)
+        check_endpoints(staff)
+        check_async(post)
+        check_profiles()
+        compare(post)
+        get_view_counter().flush()
+
+    if failures:
+        print(f'\n{len(failures)} request metrics checks failed')
+        sys.exit(1)
+    print('\nRequest metrics work')
+
+
+if __name__ == '__main__':
+    run()
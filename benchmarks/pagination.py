@@ -0,0 +1,56 @@
+"""
+Pagination benchmark - COUNT + OFFSET pages vs keyset (cursor) pages
+Usage: python -m benchmarks.pagination [post_count]
+Default is 60,006 posts, enough for page 10,000 at 6 posts per page
+"""
+import sys
+
+from benchmarks.common import benchmark_database, make_posts, timed, print_table
+
+from django.core.paginator import Paginator
+
+from blog.pagination import CursorPaginator
+from blog.views import published_posts
+
+PER_PAGE = 6
+PAGES = (1, 100, 10000)
+
+
+def offset_page(number):
+    # What the list views did before: COUNT(*) then LIMIT/OFFSET
+    page = Paginator(published_posts(), PER_PAGE).page(number)
+    return [post.id for post in page]
+
+
+def cursor_page(cursor):
+    return [post.id for post in CursorPaginator(published_posts(), PER_PAGE).page(cursor)]
+
+
+def cursor_for(number):
+    # The cursor a reader holds after paging to number - the last row of the page before it
+    if number == 1:
+        return None
+    paginator = CursorPaginator(published_posts(), PER_PAGE)
+    last = paginator.queryset[(number - 1) * PER_PAGE - 1]
+    return paginator.encode_cursor(last, 'n')
+
+
+def run(post_count):
+    with benchmark_database():
+        print(f'Creating {post_count} posts...')
+        make_posts(post_count, words=30)
+
+        rows = []
+        for number in PAGES:
+            if (number - 1) * PER_PAGE >= post_count:
+                print(f'Skipping page {number} - only {post_count} posts')
+                continue
+            cursor = cursor_for(number)
+            assert offset_page(number) == cursor_page(cursor)
+            rows.append((f'page {number:>6}, count + offset', timed(lambda: offset_page(number))))
+            rows.append((f'page {number:>6}, keyset cursor', timed(lambda: cursor_page(cursor))))
+        print_table(f'One page of {PER_PAGE} posts', rows)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else (PAGES[-1] * PER_PAGE))
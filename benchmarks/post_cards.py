@@ -0,0 +1,65 @@
+"""
+Post card benchmark - full rows vs the card projection on long posts
+Usage: python -m benchmarks.post_cards [post_count] [words_per_post]
+Default is 600 posts of ~7,000 words (about 50 KB each)
+"""
+import math
+import sys
+import tracemalloc
+
+from benchmarks.common import benchmark_database, make_posts, timed, print_table
+
+from django.template.defaultfilters import truncatewords
+
+from blog.models import Post
+from blog.views import published_posts
+
+
+def full_cards(rows):
+    # What list pages did before: load content, truncate and split it per card
+    posts = Post.objects.filter(status='published').select_related('author', 'category')[:rows]
+    return [
+        (post.title, truncatewords(post.excerpt or post.content, 20),
+         max(1, math.ceil(len(post.content.split()) / 200)))
+        for post in posts
+    ]
+
+
+def projected_cards(rows):
+    return [
+        (post.title, truncatewords(post.excerpt or post.auto_excerpt, 20), post.reading_time())
+        for post in published_posts()[:rows]
+    ]
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def run(post_count, words):
+    with benchmark_database():
+        print(f'Creating {post_count} posts of {words} words...')
+        make_posts(post_count, words=words)
+        size = len(Post.objects.only('content').first().content) / 1024
+        print(f'Average post body: {size:.1f} KB')
+
+        rows = []
+        for page_size in (6, 60):
+            assert full_cards(page_size) == projected_cards(page_size)
+            for label, func in (('full rows', full_cards), ('card projection', projected_cards)):
+                result = timed(lambda: func(page_size), repeat=10)
+                memory = peak_memory(lambda: func(page_size))
+                rows.append((f'{page_size:3} cards, {label}', result))
+                print(f'{page_size:3} cards, {label:16} peak memory {memory:10.1f} KB')
+        print_table('Loading post cards', rows)
+
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 600,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 7000,
+    )
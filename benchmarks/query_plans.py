@@ -0,0 +1,72 @@
+"""
+Query plan check - EXPLAIN every query the hot pages run and fail on
+full table scans or temporary sorts, so a dropped or unusable index
+shows up before production does
+Usage: python -m benchmarks.query_plans   (exits with 1 on a regression)
+Runs against the configured database backend (SQLite or PostgreSQL)
+The pages and plan checks are in blog/tests/base.py, shared with
+blog/tests/test_query_plans.py
+"""
+import sys
+
+from benchmarks.common import benchmark_database, make_posts
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+from blog.counters import get_view_counter
+from blog.models import Comment, Post
+from blog.related import RelatedPostsEngine
+from blog.search import get_search_backend
+from blog.tests.base import EXPECTED, page_queries, plan_lines, problems
+
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.BLOG_PAGE_CACHE_ENABLED = False
+    get_view_counter().flush_threshold = float('inf')
+    get_view_counter().flush_interval = float('inf')
+
+    failures = 0
+    with benchmark_database():
+        # Enough rows that the planners prefer indexes where they have them
+        make_posts(2000, words=20, users=20)
+        get_search_backend().rebuild()
+        RelatedPostsEngine().rebuild()
+        reader = User.objects.create_user('plan_reader')
+        Post.objects.filter(id__in=Post.objects.order_by('id').values('id')[:30]).update(author=reader)
+        # Likes from every user, so an index on the liking user is selective
+        readers = list(User.objects.all())
+        for post in Post.objects.order_by('id')[:30]:
+            post.likes.add(*readers)
+            Comment.objects.create(post=post, author=reader, content='Nice post!')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        for name, queries in page_queries(reader).items():
+            bad = []
+            for sql in queries:
+                if any(pattern.match(sql) for pattern in EXPECTED):
+                    continue
+                found = problems(plan_lines(sql), windowed=' OVER (' in sql)
+                if found:
+                    bad.append((sql, found))
+            print(f'{name:20} {len(queries):3} queries  {"FAIL" if bad else "ok"}')
+            for sql, found in bad:
+                failures += 1
+                print(f'    {sql[:160]}')
+                for line in found:
+                    print(f'      -> {line}')
+
+    if failures:
+        print(f'\n{failures} queries scan or sort outside an index')
+        sys.exit(1)
+    print('\nAll hot-path queries use indexes')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,110 @@
+"""
+Replica routing check - two SQLite files stand in for a PostgreSQL
+primary and its read replica; "replication" is copying the primary file
+Checks that public pages read from the replica, writes go to the primary,
+and a user sees their own write while the replica lags behind
+Usage: python -m benchmarks.replica_routing   (exits with 1 on a failure)
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+DIRECTORY = tempfile.mkdtemp()
+PRIMARY = os.path.join(DIRECTORY, 'primary.sqlite3')
+REPLICA = os.path.join(DIRECTORY, 'replica.sqlite3')
+os.environ.update(DB_ENGINE='sqlite', DB_NAME=PRIMARY, DB_REPLICAS=REPLICA, DB_CONN_MAX_AGE='0')
+
+from benchmarks.common import make_posts  # noqa: E402 - settings read the environment above
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+
+from blog.counters import get_view_counter  # noqa: E402
+from blog.models import Category, Post  # noqa: E402
+from blog.routers import PIN_COOKIE  # noqa: E402
+
+failures = []
+
+
+def check(label, ok):
+    print(f'{label:60} {"ok" if ok else "FAIL"}')
+    if not ok:
+        failures.append(label)
+
+
+def replicate():
+    # Copy the primary to the replica - what streaming replication does continuously
+    connections.close_all()
+    with connections['default'].cursor() as cursor:
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    connections.close_all()
+    shutil.copyfile(PRIMARY, REPLICA)
+
+
+def queries_by_alias(client, url, method='get', **data):
+    with CaptureQueriesContext(connections['default']) as primary, \
+            CaptureQueriesContext(connections['replica1']) as replica:
+        response = getattr(client, method)(url, data) if data else getattr(client, method)(url)
+    return response, len(primary), len(replica)
+
+
+def run():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.BLOG_PAGE_CACHE_ENABLED = False
+    try:
+        call_command('migrate', verbosity=0)
+        make_posts(12, words=50, users=3)
+        User.objects.create_user('writer', password='writer-pass')
+        replicate()
+
+        anonymous = Client()
+        response, primary, replica = queries_by_alias(anonymous, '/')
+        check('home reads from the replica', response.status_code == 200 and replica > 0 and primary == 0)
+        response, primary, replica = queries_by_alias(anonymous, '/explore/')
+        check('explore reads from the replica', response.status_code == 200 and replica > 0 and primary == 0)
+
+        client = Client()
+        client.login(username='writer', password='writer-pass')
+        replicate()  # the login's session row reaches the replica
+        client.cookies.pop(PIN_COOKIE, None)
+        response, primary, replica = queries_by_alias(client, '/my-posts/')
+        check('other pages read from the primary', response.status_code == 200 and replica == 0)
+
+        # The writer publishes a post - the replica doesn't have it yet
+        category = Category.objects.first()
+        response, primary, replica = queries_by_alias(client, '/create/', method='post', **{
+            'title': 'Fresh from the primary', 'slug': 'fresh-from-the-primary',
+            'content': 'Written just now', 'category': category.id, 'status': 'published',
+        })
+        post = Post.objects.using('default').filter(title='Fresh from the primary').first()
+        check('the write went to the primary', post is not None and replica == 0)
+        check('the replica lags behind', not Post.objects.using('replica1').filter(title=post.title).exists())
+        check('the writer is pinned to the primary', PIN_COOKIE in response.cookies)
+
+        response, primary, replica = queries_by_alias(client, post.get_absolute_url())
+        check('the writer sees their new post', response.status_code == 200 and replica == 0)
+        response, primary, replica = queries_by_alias(Client(), post.get_absolute_url())
+        check('other readers still see the replica', response.status_code == 404 and replica > 0)
+
+        replicate()
+        response, primary, replica = queries_by_alias(Client(), post.get_absolute_url())
+        check('after replication everyone sees it', response.status_code == 200)
+    finally:
+        get_view_counter().flush()  # before the files go away
+        connections.close_all()
+        shutil.rmtree(DIRECTORY, ignore_errors=True)
+
+    if failures:
+        print(f'\n{len(failures)} replica routing checks failed')
+        sys.exit(1)
+    print('\nReplica routing works')
+
+
+if __name__ == '__main__':
+    run()
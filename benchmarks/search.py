@@ -0,0 +1,31 @@
+"""
+Search benchmark - icontains scan vs the full-text index
+Usage: python -m benchmarks.search [post_count]
+"""
+import sys
+
+from benchmarks.common import benchmark_database, make_posts, timed, print_table
+
+from blog.search import DatabaseSearchBackend, get_search_backend
+
+QUERIES = ['django', 'coffee mountain', 'photo', 'nothingmatcheshere']
+
+
+def run(post_count):
+    with benchmark_database():
+        print(f'Creating {post_count} posts...')
+        make_posts(post_count)
+        indexed = get_search_backend()
+        timings = timed(indexed.rebuild, repeat=1)
+        print(f'Index rebuild with {type(indexed).__name__}: {timings["median"] / 1000:.2f}s')
+
+        scan = DatabaseSearchBackend()
+        rows = []
+        for query in QUERIES:
+            rows.append((f'icontains  "{query}"', timed(lambda: scan.search(query), repeat=5)))
+            rows.append((f'indexed    "{query}"', timed(lambda: indexed.search(query), repeat=5)))
+        print_table(f'Search over {post_count} posts (top 1000 ids)', rows)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
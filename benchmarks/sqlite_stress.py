@@ -0,0 +1,139 @@
+"""
+SQLite stress benchmark - concurrent reader and writer processes on one
+database file, with the stock settings and with the production profile
+(blog/sqlite.py)
+Usage: python -m benchmarks.sqlite_stress [readers] [writers] [seconds]
+Default is 4 readers and 4 writers for 5 seconds per mode
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_posts
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.db import OperationalError, connection
+
+from blog.counters import MemoryViewBuffer, ViewCounter
+from blog.models import Post
+from blog.views import published_posts
+
+POSTS = 300
+
+
+def read(rng):
+    # A listing page and a post page
+    list(published_posts()[:6])
+    post = Post.objects.select_related('author', 'category').get(slug=f'bench-post-{rng.randrange(POSTS)}')
+    list(post.comments.select_related('author'))
+
+
+def write(rng, counter, users):
+    # The writes a busy site makes: view flushes, like toggles and session saves
+    choice = rng.random()
+    if choice < 0.4:
+        counter.write({rng.randrange(1, POSTS + 1): rng.randint(1, 5) for _ in range(10)})
+    elif choice < 0.7:
+        post = Post.objects.only('id').get(slug=f'bench-post-{rng.randrange(POSTS)}')
+        user = rng.choice(users)
+        if rng.random() < 0.5:
+            post.likes.add(user)
+        else:
+            post.likes.remove(user)
+    else:
+        session = SessionStore()
+        session['cart'] = rng.random()
+        session.save()
+
+
+def worker(role, profile, seconds, seed, results):
+    settings.BLOG_SQLITE_PRODUCTION = profile
+    connection.close()  # never share the parent's connection
+    rng = random.Random(seed)
+    counter = ViewCounter(MemoryViewBuffer())
+    users = list(User.objects.all()[:20])
+    done = errors = 0
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if role == 'reader':
+                read(rng)
+            else:
+                write(rng, counter, users)
+            done += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+        except OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            errors += 1
+    connection.close()
+    results.put((role, done, errors, latencies))
+
+
+def run_mode(profile, readers, writers, seconds):
+    settings.BLOG_SQLITE_PRODUCTION = profile
+    connection.close()
+    with connection.cursor() as cursor:
+        # The journal mode is stored in the file, so reset it for the baseline
+        cursor.execute(f'PRAGMA journal_mode = {"wal" if profile else "delete"}')
+    connection.close()
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    roles = ['reader'] * readers + ['writer'] * writers
+    processes = [
+        context.Process(target=worker, args=(role, profile, seconds, i, results))
+        for i, role in enumerate(roles)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for role in ('reader', 'writer'):
+        rows = [row for row in collected if row[0] == role]
+        latencies = sorted(ms for row in rows for ms in row[3])
+        summary[role] = {
+            'ops': sum(row[1] for row in rows) / seconds,
+            'errors': sum(row[2] for row in rows),
+            'p95': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
+    return summary
+
+
+def run(readers, writers, seconds):
+    with tempfile.TemporaryDirectory() as directory:
+        connection.close()
+        connection.settings_dict['NAME'] = os.path.join(directory, 'stress.sqlite3')
+        print(f'Creating {POSTS} posts in {connection.settings_dict["NAME"]}...')
+        call_command('migrate', verbosity=0)
+        make_posts(POSTS, words=100, users=20)
+
+        print(f'\n{readers} readers + {writers} writers, {seconds}s per mode')
+        print(f'{"":28} {"reads/s":>9} {"writes/s":>9} {"locked":>7} {"read p95 ms":>12} {"write p95 ms":>13}')
+        for label, profile in (('stock SQLite settings', False), ('production profile', True)):
+            result = run_mode(profile, readers, writers, seconds)
+            reader, writer = result['reader'], result['writer']
+            print(
+                f'{label:28} {reader["ops"]:9.0f} {writer["ops"]:9.0f} '
+                f'{reader["errors"] + writer["errors"]:7} {reader["p95"]:12.1f} {writer["p95"]:13.1f}'
+            )
+        connection.close()
+
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 5,
+    )
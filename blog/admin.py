@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Category, Tag, Post, Comment
+from django.db.models import Count, Q
+from .models import Category, Tag, Post, Comment, Task
+from .tasks import retry_failed
 
 # Register Category model with custom admin interface
 @admin.register(Category)
@@ -8,6 +10,17 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name', 'description')
     list_per_page = 20
+    
+    def get_queryset(self, request):
+        # Count published posts in the list query instead of once per row
+        return super().get_queryset(request).annotate(
+            published_count=Count('posts', filter=Q(posts__status='published'))
+        )
+    
+    def post_count(self, obj):
+        return obj.published_count
+    post_count.short_description = 'Post count'
+    post_count.admin_order_field = 'published_count'
 
 # Register Tag model
 @admin.register(Tag)
@@ -19,7 +32,7 @@ class TagAdmin(admin.ModelAdmin):
 # Register Post model with full admin features
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'category', 'status', 'views', 'total_likes', 'published_at')
+    list_display = ('title', 'author', 'category', 'status', 'views', 'like_count', 'comment_count', 'published_at')
     list_filter = ('status', 'category', 'tags', 'created_at')
     search_fields = ('title', 'content', 'excerpt')
     prepopulated_fields = {'slug': ('title',)}
@@ -27,7 +40,7 @@ class PostAdmin(admin.ModelAdmin):
     date_hierarchy = 'published_at'
     ordering = ('-published_at', '-created_at')
     list_editable = ('status',)
-    readonly_fields = ('views', 'total_likes', 'reading_time', 'created_at', 'updated_at')
+    readonly_fields = ('views', 'like_count', 'comment_count', 'reading_time', 'created_at', 'updated_at')
     filter_horizontal = ('tags', 'likes')
     
     fieldsets = (
@@ -41,7 +54,7 @@ class PostAdmin(admin.ModelAdmin):
             'fields': ('status', 'published_at')
         }),
         ('Engagement', {
-            'fields': ('views', 'likes', 'total_likes', 'reading_time'),
+            'fields': ('views', 'likes', 'like_count', 'comment_count', 'reading_time'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -63,3 +76,16 @@ class CommentAdmin(admin.ModelAdmin):
         # Show first 50 characters of comment
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Comment Preview'
+
+# Background tasks - mostly useful to look at and retry failed ones
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'dedup_key', 'created_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'dedup_key', 'last_error')
+    readonly_fields = ('name', 'args', 'dedup_key', 'attempts', 'locked_by', 'locked_until', 'last_error', 'created_at')
+    actions = ['retry']
+    
+    def retry(self, request, queryset):
+        retry_failed(queryset)
+    retry.short_description = 'Retry selected failed tasks'
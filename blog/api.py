@@ -0,0 +1,373 @@
+"""
+JSON API, version 1 (mounted at /api/v1/, see blog/api_urls.py)
+
+Read endpoints load rows with values() - only the columns behind the
+requested fields, no model instances - and page with keyset cursors:
+
+    GET /api/v1/posts/?fields=id,title,author&category=travel&limit=20
+    GET /api/v1/posts/?cursor=<next_cursor from the previous page>
+    GET /api/v1/posts/batch/?slugs=a,b,c        (or ?ids=1,2,3, up to 100)
+    GET /api/v1/posts/<slug>/?fields=title,content,tags
+    GET /api/v1/posts/<slug>/comments/
+    GET /api/v1/categories/
+    GET /api/v1/tags/
+    GET /api/v1/likes/?ids=1,2,3               like state for many posts
+    PUT / DELETE /api/v1/posts/<slug>/like/    like / unlike (logged in)
+
+?fields= picks the fields (sparse fieldsets); without it each resource
+returns its default fields. Errors come back as {"error": "..."} with
+a 4xx status. Requests are authenticated by the site's session cookie.
+"""
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.db.models import Count, Q
+from django.http import JsonResponse
+from django.urls import reverse
+
+from .counters import get_view_counter
+from .models import Category, Comment, Post, Tag
+from .pagination import CursorPaginator, InvalidCursor
+from .routers import replica_reads
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def image_data(name, renditions):
+    # The upload and its resized copies (blog/images.py), as URLs
+    if not name:
+        return None
+    return {
+        'url': default_storage.url(name),
+        'width': renditions.get('width'),
+        'height': renditions.get('height'),
+        'sizes': [
+            {
+                'width': size['width'],
+                'height': size['height'],
+                'webp': default_storage.url(size['webp']),
+                'jpeg': default_storage.url(size['jpeg']),
+            }
+            for size in renditions.get('sizes', [])
+        ],
+    }
+
+
+class Projection:
+    """
+    The fields a resource can return: name -> (columns, build)
+    build(*column values) makes the field's value, None returns the
+    single column as it is. select() reads only the requested columns
+    """
+
+    def __init__(self, fields, default):
+        self.fields = fields
+        self.default = default
+
+    def parse(self, request, default=None):
+        value = request.GET.get('fields')
+        if not value:
+            return list(default or self.default)
+        names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(self.fields)}')
+        return names
+
+    def columns(self, names, extra=()):
+        columns = dict.fromkeys(extra)
+        for name in names:
+            columns.update(dict.fromkeys(self.fields[name][0]))
+        return list(columns)
+
+    def select(self, queryset, names, extra=()):
+        # A values() queryset with the columns these fields need
+        return queryset.values(*self.columns(names, extra))
+
+    def serialize(self, row, names):
+        data = {}
+        for name in names:
+            columns, build = self.fields[name]
+            data[name] = row[columns[0]] if build is None else build(*(row[column] for column in columns))
+        return data
+
+
+POSTS = Projection(
+    {
+        'id': (('id',), None),
+        'slug': (('slug',), None),
+        'title': (('title',), None),
+        'url': (('slug',), lambda slug: reverse('blog:post_detail', kwargs={'slug': slug})),
+        'excerpt': (('excerpt', 'auto_excerpt'), lambda excerpt, auto_excerpt: excerpt or auto_excerpt),
+        'content': (('content',), None),
+        'author': (('author__username',), None),
+        'category': (('category__slug',), None),
+        'category_name': (('category__name',), None),
+        'tags': (('id',), None),  # filled in by serialize_posts, one query per page
+        'image': (('featured_image', 'featured_image_renditions'), image_data),
+        'published_at': (('published_at',), None),
+        'updated_at': (('updated_at',), None),
+        'views': (('views',), None),
+        'like_count': (('like_count',), None),
+        'comment_count': (('comment_count',), None),
+        'word_count': (('word_count',), None),
+        'reading_time': (('word_count',), lambda word_count: max(1, -(-word_count // 200))),
+    },
+    default=(
+        'id', 'slug', 'title', 'url', 'excerpt', 'author', 'category', 'image',
+        'published_at', 'views', 'like_count', 'comment_count', 'reading_time',
+    ),
+)
+POST_DETAIL_FIELDS = POSTS.default + ('content', 'tags', 'category_name', 'updated_at')
+
+COMMENTS = Projection(
+    {
+        'id': (('id',), None),
+        'author': (('author__username',), None),
+        'content': (('content',), None),
+        'parent': (('parent_id',), None),
+        'thread': (('thread_id',), None),
+        'depth': (('depth',), None),
+        'created_at': (('created_at',), None),
+    },
+    default=('id', 'author', 'content', 'parent', 'depth', 'created_at'),
+)
+
+CATEGORIES = Projection(
+    {
+        'id': (('id',), None),
+        'name': (('name',), None),
+        'slug': (('slug',), None),
+        'description': (('description',), None),
+        'url': (('slug',), lambda slug: reverse('blog:category', kwargs={'slug': slug})),
+        'post_count': (('post_count',), None),
+    },
+    default=('id', 'name', 'slug', 'url', 'post_count'),
+)
+
+TAGS = Projection(
+    {
+        'id': (('id',), None),
+        'name': (('name',), None),
+        'slug': (('slug',), None),
+        'post_count': (('post_count',), None),
+    },
+    default=('id', 'name', 'slug'),
+)
+
+
+def published_count():
+    return Count('posts', filter=Q(posts__status='published'))
+
+
+def api_view(*methods, login=False):
+    """
+    Decorator for API views - allowed methods, JSON errors, and
+    a JSON 401 instead of the login redirect when login=True
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = JsonResponse({'error': f'Method {request.method} not allowed'}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            if login and not request.user.is_authenticated:
+                return JsonResponse({'error': 'Authentication required'}, status=401)
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as e:
+                return JsonResponse({'error': str(e)}, status=e.status)
+            except InvalidCursor:
+                return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        return wrapper
+    return decorator
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be a number')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit
+
+
+def get_batch(request):
+    """
+    The posts a batch call asks for: ('id', [1, 2]) or ('slug', ['a', 'b'])
+    """
+    ids, slugs = request.GET.get('ids'), request.GET.get('slugs')
+    if bool(ids) == bool(slugs):
+        raise ApiError('Pass either ids or slugs')
+    values = list(dict.fromkeys(value.strip() for value in (ids or slugs).split(',') if value.strip()))
+    if len(values) > MAX_LIMIT:
+        raise ApiError(f'At most {MAX_LIMIT} posts per call')
+    if ids:
+        try:
+            return 'id', [int(value) for value in values]
+        except ValueError:
+            raise ApiError('ids must be numbers')
+    return 'slug', values
+
+
+def keyset_page(request, queryset, projection, names, ordering, serialize=None):
+    # One keyset page of values() rows, as the response body
+    paginator = CursorPaginator(
+        projection.select(queryset, names, extra=[name.lstrip('-') for name in ordering]),
+        get_limit(request), ordering=ordering,
+    )
+    page = paginator.page(request.GET.get('cursor'))
+    rows = list(page)
+    data = serialize(rows) if serialize else [projection.serialize(row, names) for row in rows]
+    return {'data': data, 'next_cursor': page.next_cursor, 'previous_cursor': page.previous_cursor}
+
+
+def serialize_posts(rows, names):
+    data = [POSTS.serialize(row, names) for row in rows]
+    if 'tags' in names:
+        # Tag slugs for every post on the page in one query
+        tags = {}
+        through = Post.tags.through.objects.filter(post_id__in=[row['id'] for row in rows])
+        for post_id, slug in through.order_by('tag__name').values_list('post_id', 'tag__slug'):
+            tags.setdefault(post_id, []).append(slug)
+        for row, item in zip(rows, data):
+            item['tags'] = tags.get(row['id'], [])
+    return data
+
+
+def published():
+    return Post.objects.filter(status='published')
+
+
+@api_view('GET')
+@replica_reads
+def post_list(request):
+    """
+    Published posts, newest first
+    Filters: ?category=<slug>, ?tag=<slug>, ?author=<username>
+    """
+    names = POSTS.parse(request)
+    posts = published()
+    if request.GET.get('category'):
+        posts = posts.filter(category__slug=request.GET['category'])
+    if request.GET.get('tag'):
+        posts = posts.filter(tags__slug=request.GET['tag'])
+    if request.GET.get('author'):
+        posts = posts.filter(author__username=request.GET['author'])
+    return JsonResponse(keyset_page(
+        request, posts, POSTS, names, ('-published_at', '-id'),
+        serialize=lambda rows: serialize_posts(rows, names),
+    ))
+
+
+@api_view('GET')
+@replica_reads
+def post_batch(request):
+    """
+    Many posts by id or slug in one call, in the order asked for
+    Unknown or unpublished ones are listed under "missing"
+    """
+    names = POSTS.parse(request)
+    key, values = get_batch(request)
+    rows = {row[key]: row for row in POSTS.select(published().filter(**{f'{key}__in': values}), names, extra=[key, 'id'])}
+    found = [rows[value] for value in values if value in rows]
+    return JsonResponse({
+        'data': serialize_posts(found, names),
+        'missing': [value for value in values if value not in rows],
+    })
+
+
+@api_view('GET')
+@replica_reads
+def post_detail(request, slug):
+    names = POSTS.parse(request, default=POST_DETAIL_FIELDS)
+    row = POSTS.select(published().filter(slug=slug), names, extra=['id']).first()
+    if row is None:
+        raise ApiError('Post not found', status=404)
+    # Reading a post through the API counts as a view, like the web page
+    get_view_counter().record(row['id'])
+    data = serialize_posts([row], names)[0]
+    if 'views' in data:
+        data['views'] += get_view_counter().pending(row['id'])
+    return JsonResponse({'data': data})
+
+
+@api_view('GET')
+@replica_reads
+def comment_list(request, slug):
+    # A post's comments, newest first
+    names = COMMENTS.parse(request)
+    post_id = published().filter(slug=slug).values_list('id', flat=True).first()
+    if post_id is None:
+        raise ApiError('Post not found', status=404)
+    comments = Comment.objects.filter(post_id=post_id)
+    return JsonResponse(keyset_page(request, comments, COMMENTS, names, ('-created_at', '-id')))
+
+
+@api_view('GET')
+@replica_reads
+def category_list(request):
+    # Every category - there are only a few dozen, so no paging
+    names = CATEGORIES.parse(request)
+    categories = Category.objects.all()
+    if 'post_count' in names:
+        categories = categories.annotate(post_count=published_count())
+    rows = CATEGORIES.select(categories, names).order_by('name')
+    return JsonResponse({'data': [CATEGORIES.serialize(row, names) for row in rows]})
+
+
+@api_view('GET')
+@replica_reads
+def tag_list(request):
+    # Tags by name, keyset paged
+    names = TAGS.parse(request)
+    tags = Tag.objects.all()
+    if 'post_count' in names:
+        tags = tags.annotate(post_count=published_count())
+    return JsonResponse(keyset_page(request, tags, TAGS, names, ('name', 'id')))
+
+
+@api_view('GET')
+@replica_reads
+def like_states(request):
+    """
+    Like count, and whether the current user liked it, for many posts:
+    {"data": [{"id": 1, "slug": "...", "liked": true, "like_count": 12}, ...]}
+    Two queries however many posts - anonymous users have liked nothing
+    """
+    key, values = get_batch(request)
+    rows = {row[key]: row for row in published().filter(**{f'{key}__in': values}).values('id', 'slug', 'like_count')}
+    liked = set()
+    if request.user.is_authenticated and rows:
+        liked = set(Post.likes.through.objects.filter(
+            user_id=request.user.id, post_id__in=[row['id'] for row in rows.values()]
+        ).values_list('post_id', flat=True))
+    return JsonResponse({
+        'data': [{**rows[value], 'liked': rows[value]['id'] in liked} for value in values if value in rows],
+        'missing': [value for value in values if value not in rows],
+    })
+
+
+@api_view('PUT', 'DELETE', login=True)
+def post_like(request, slug):
+    # PUT likes the post, DELETE unlikes it - repeating either is harmless
+    post = published().only('id').filter(slug=slug).first()
+    if post is None:
+        raise ApiError('Post not found', status=404)
+    if request.method == 'PUT':
+        post.likes.add(request.user)
+    else:
+        post.likes.remove(request.user)
+    # Counter was updated by the m2m signal
+    post.refresh_from_db(fields=['like_count'])
+    return JsonResponse({'liked': request.method == 'PUT', 'like_count': post.like_count})
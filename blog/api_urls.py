@@ -0,0 +1,16 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+# Mounted at /api/v1/ - a future v2 gets its own module and prefix
+urlpatterns = [
+    path('posts/', api.post_list, name='post_list'),
+    path('posts/batch/', api.post_batch, name='post_batch'),
+    path('posts/<slug:slug>/', api.post_detail, name='post_detail'),
+    path('posts/<slug:slug>/comments/', api.comment_list, name='comment_list'),
+    path('posts/<slug:slug>/like/', api.post_like, name='post_like'),
+    path('categories/', api.category_list, name='category_list'),
+    path('tags/', api.tag_list, name='tag_list'),
+    path('likes/', api.like_states, name='like_states'),
+]
@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        # Connect signal handlers (search index sync etc.)
+        from . import signals  # noqa: F401
+        # Shared cache settings (blog/checks.py)
+        from . import checks  # noqa: F401
+
+        # SQLite production profile - WAL, pragmas and BEGIN IMMEDIATE
+        from django.db.backends.signals import connection_created
+        from .sqlite import configure_connection
+        connection_created.connect(configure_connection, dispatch_uid='blog_sqlite_profile')
+
+        # Query count and time for the request metrics (blog/metrics.py)
+        from .metrics import install_query_timer
+        connection_created.connect(install_query_timer, dispatch_uid='blog_request_metrics')
@@ -0,0 +1,201 @@
+"""
+Async versions of the read-heavy views, for ASGI servers
+
+blog/urls.py routes the home, explore, category and post pages and the
+like button here when BLOG_ASYNC_VIEWS is on (blog_project/asgi.py turns
+it on). They build the same pages with the same helpers as blog/views.py;
+what changes is how the queries run:
+
+- queries that don't depend on each other run at the same time with
+  concurrently(), each in a worker thread with its own connection
+- the pages' other queries and template rendering (lazy querysets,
+  {% cache %} fragments to re-render) run in those worker threads too
+  with in_worker(), and so do context helpers that read the cache.
+  Django 4.2's async ORM (aget, afirst...) runs them on a thread made
+  for each request instead, so every page would open a new database
+  connection; worker threads keep theirs for CONN_MAX_AGE
+- the views' own cache reads use the async cache API (blog.page_cache)
+- the like button, a logged-in write, uses the async ORM (aexists, aadd...)
+"""
+import asyncio
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.db.models import prefetch_related_objects
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.functional import SimpleLazyObject
+
+from .comments import thread_page
+from .conditional import conditional_page
+from .models import Category, Post
+from .page_cache import acached_fragments, afragment_versions, cache_anonymous_page
+from .routers import replica_reads
+from .views import (
+    category_context, category_page, category_state, count_cached_view, count_view, explore_context,
+    home_context, home_posts, home_state, popular_posts, post_detail_context, post_detail_state,
+    published_posts, related_posts_of, trending_posts,
+)
+
+
+def worker_call(call):
+    # Like a request on a WSGI thread: drop an expired or broken connection
+    # first, and close it afterwards unless CONN_MAX_AGE keeps it open
+    close_old_connections()
+    try:
+        return call()
+    finally:
+        close_old_connections()
+
+
+async def concurrently(*calls):
+    """
+    Runs blocking calls that don't depend on each other at the same time,
+    each in a worker thread, and returns their results in order
+    """
+    return await asyncio.gather(*(sync_to_async(worker_call, thread_sensitive=False)(call) for call in calls))
+
+
+async def in_worker(func, *args, **kwargs):
+    # One blocking call in a worker thread
+    (result,) = await concurrently(partial(func, *args, **kwargs))
+    return result
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def get_user(request):
+    # request.user - the first use loads the session and user, so it runs in a thread
+    # (Django 5.0 adds request.auser())
+    if not hasattr(request, '_cached_user'):
+        await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def render_page(request, template_name, context):
+    # Rendering can still query (lazy querysets, fragments to re-render)
+    return await in_worker(render, request, template_name, context)
+
+
+def load_content(post):
+    # The deferred body, for a post_body fragment that has to be rendered
+    post.content = Post.objects.values_list('content', flat=True).get(id=post.id)
+
+
+@cache_anonymous_page()
+@replica_reads
+@conditional_page(home_state)
+async def home(request):
+    """
+    Async home() - the page of posts loads in a thread
+    """
+    versions = await afragment_versions(categories=['categories'], count=['posts'])
+    search_query = request.GET.get('search', '')
+    posts = await in_worker(home_posts, request, search_query, versions['count'])
+    return await render_page(request, 'blog/home.html', home_context(request, posts, search_query, versions))
+
+
+@cache_anonymous_page(on_hit=count_cached_view)
+@replica_reads
+@conditional_page(post_detail_state, on_not_modified=count_cached_view)
+async def post_detail(request, slug):
+    """
+    Async post_detail() - related posts, the like state, the view count and
+    the body, tags and comments (unless their fragments are cached) load at
+    the same time
+    """
+    post = await in_worker(
+        get_object_or_404, Post.objects.select_related('author', 'category').defer('content'),
+        slug=slug, status='published'
+    )
+    comments_cursor = request.GET.get('comments', '')
+    user = await get_user(request)
+
+    loads = {
+        'related_posts': partial(related_posts_of, post.id, post.category_id, published_posts()),
+        'views': partial(count_view, post),
+    }
+    if user.is_authenticated:
+        loads['is_liked'] = partial(post.is_liked_by, user)
+    versions = await afragment_versions(body=[f'post:{post.id}'], comments=[f'comments:{post.id}'])
+    cached = await acached_fragments(
+        post_body=[post.id, versions['body']],
+        post_comments=[post.id, comments_cursor, versions['comments']],
+    )
+    if 'post_body' not in cached:
+        loads['content'] = partial(load_content, post)
+        loads['tags'] = partial(prefetch_related_objects, [post], 'tags')
+    if 'post_comments' not in cached:
+        loads['comment_threads'] = partial(thread_page, post.id, comments_cursor)
+    loaded = dict(zip(loads, await concurrently(*loads.values())))
+
+    if 'comment_threads' in loaded:
+        comment_threads = loaded['comment_threads']
+    else:
+        # Cached - only read if the fragment expires before the page renders
+        comment_threads = SimpleLazyObject(partial(thread_page, post.id, comments_cursor))
+    # The context reads the related posts' fragment versions from the cache
+    context = await in_worker(
+        post_detail_context,
+        request, post, loaded['related_posts'], comment_threads, comments_cursor, loaded.get('is_liked', False)
+    )
+    return await render_page(request, 'blog/post_detail.html', context)
+
+
+@cache_anonymous_page()
+@replica_reads
+async def explore(request):
+    """
+    Async explore() - trending posts, popular posts and the category count
+    load at the same time
+    """
+    trending, popular, category_count = await concurrently(
+        lambda: list(trending_posts()), lambda: list(popular_posts()), Category.objects.count,
+    )
+    context = await in_worker(explore_context, request, trending, popular, category_count)
+    return await render_page(request, 'blog/explore.html', context)
+
+
+@cache_anonymous_page()
+@replica_reads
+@conditional_page(category_state)
+async def category_posts(request, slug):
+    """
+    Async category_posts()
+    """
+    category = await in_worker(get_object_or_404, Category, slug=slug)
+    posts = await in_worker(category_page, category, request.GET.get('cursor'))
+    return await render_page(request, 'blog/category_posts.html', category_context(request, category, posts))
+
+
+async def post_like(request, slug):
+    """
+    Async post_like() - the same toggle with the async ORM
+    """
+    # login_required only takes sync views before Django 5.1
+    user = await get_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    post = await aget_object_or_404(Post.objects.all(), slug=slug)
+
+    if await post.likes.filter(id=user.id).aexists():
+        await post.likes.aremove(user)
+        liked = False
+    else:
+        await post.likes.aadd(user)
+        liked = True
+
+    # Counter was updated by the m2m signal - reload just that column
+    await post.arefresh_from_db(fields=['like_count'])
+
+    return JsonResponse({
+        'liked': liked,
+        'total_likes': post.total_likes()
+    })
@@ -0,0 +1,153 @@
+"""
+Per-author statistics for the profile page
+
+The profile used to count a user's posts and liked posts in the template,
+twice each, on every view. The four numbers are now computed together in
+one query and cached per user, one cache key per number. blog.signals and
+the view counter keep the cached numbers current with atomic cache.incr()
+as posts are written, liked and read. Changes whose size isn't known
+exactly (unlikes, deletes) drop the user's numbers instead, and the next
+read computes them again.
+
+The keys carry a per-user generation. Dropping the numbers moves it on,
+and so does a change that finds no number to count up: a read may be
+computing them at that moment from before the change, and what it then
+stores lands under the old generation, where nobody reads it.
+
+Counting up needs a cache whose incr() is atomic (Redis, Memcached, or
+local memory in a single process). On others, such as the file cache,
+incr() reads and writes the number back, so two workers counting at once
+lose one change; there every change drops the numbers instead.
+"""
+import uuid
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+AuthorStats = namedtuple('AuthorStats', ['posts', 'views', 'likes_received', 'liked_posts'])
+
+
+# Backends whose incr() is a single atomic operation
+ATOMIC_INCR_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+def cache_alias():
+    return getattr(settings, 'BLOG_AUTHOR_STATS_CACHE', 'default')
+
+
+def get_cache():
+    return caches[cache_alias()]
+
+
+def counts_atomically():
+    return settings.CACHES.get(cache_alias(), {}).get('BACKEND') in ATOMIC_INCR_BACKENDS
+
+
+def generation_key(user_id):
+    return f'blog:authorstats:{user_id}'
+
+
+def stats_key(user_id, generation, field):
+    return f'blog:authorstats:{user_id}:{generation}:{field}'
+
+
+def new_generation():
+    return uuid.uuid4().hex
+
+
+def current_generation(cache, user_id):
+    # A missing generation gets a fresh one, so numbers stored under an evicted one are never read
+    key = generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, new_generation(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def compute_author_stats(user_id):
+    """
+    Reads a user's statistics from the database in one query
+    Drafts count too - the profile is only shown to its owner
+    """
+    from django.contrib.auth.models import User
+    from .models import Post
+
+    # Uncorrelated, so it runs once (in the aggregate, it would run for
+    # every joined post if it referenced the outer user)
+    liked_posts = Subquery(
+        Post.likes.through.objects
+        .filter(user_id=user_id)
+        .order_by()
+        .values('user_id')
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    # The user LEFT JOINed to their posts, one pass over the author index.
+    # Prefixed, the reverse relations already use these names
+    stats = User.objects.filter(pk=user_id).aggregate(
+        stats_posts=Count('blog_posts'),
+        stats_views=Coalesce(Sum('blog_posts__views'), 0),
+        stats_likes_received=Coalesce(Sum('blog_posts__like_count'), 0),
+        stats_liked_posts=Coalesce(Max(liked_posts), 0),
+    )
+    return AuthorStats(*[stats[f'stats_{field}'] for field in AuthorStats._fields])
+
+
+def get_author_stats(user_id):
+    """
+    Returns the user's AuthorStats, from the cache when all of it is there
+    """
+    cache = get_cache()
+    generation = current_generation(cache, user_id)
+    keys = {field: stats_key(user_id, generation, field) for field in AuthorStats._fields}
+    cached = cache.get_many(list(keys.values()))
+    if len(cached) == len(keys):
+        return AuthorStats(**{field: cached[key] for field, key in keys.items()})
+    stats = compute_author_stats(user_id)
+    # add() leaves the numbers that are there alone, they were counted up
+    # since this query read them
+    timeout = getattr(settings, 'BLOG_AUTHOR_STATS_TIMEOUT', 3600)
+    for field, value in stats._asdict().items():
+        cache.add(keys[field], value, timeout=timeout)
+    return stats
+
+
+def add_author_stats(field, counts):
+    """
+    Adds {user_id: n} to one cached number of each user
+    Users without cached numbers are skipped, their next read computes them
+    """
+    counts = {user_id: count for user_id, count in Counter(counts).items() if count}
+    if not counts:
+        return
+    if not counts_atomically():
+        forget_author_stats(counts)
+        return
+    cache = get_cache()
+    generations = cache.get_many([generation_key(user_id) for user_id in counts])
+    for user_id, count in counts.items():
+        generation = generations.get(generation_key(user_id))
+        if generation is None:
+            continue
+        try:
+            cache.incr(stats_key(user_id, generation, field), count)
+        except ValueError:
+            # A read may be computing the numbers without this change
+            cache.set(generation_key(user_id), new_generation(), timeout=None)
+
+
+def forget_author_stats(user_ids):
+    """
+    Drops the cached numbers of the given users
+    """
+    if user_ids:
+        get_cache().set_many({generation_key(user_id): new_generation() for user_id in set(user_ids)}, timeout=None)
@@ -0,0 +1,52 @@
+"""
+System checks for settings that break the blog's caching across processes
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from .author_stats import ATOMIC_INCR_BACKENDS
+
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    With queued tasks, run_tasks refreshes related posts and renditions,
+    bumps page cache tags and writes views in its own process - the web
+    workers only see that when the caches holding the pages, tag versions,
+    fragments, author stats and buffered views are shared
+    """
+    if getattr(settings, 'BLOG_TASKS_EAGER', False):
+        return []
+    errors = []
+    fragments = 'template_fragments' if 'template_fragments' in settings.CACHES else 'default'
+    shared = [
+        ('page cache', getattr(settings, 'BLOG_PAGE_CACHE', 'default'), 'blog.E001'),
+        ('fragment cache', fragments, 'blog.E002'),
+        ('author stats cache', getattr(settings, 'BLOG_AUTHOR_STATS_CACHE', 'default'), 'blog.E003'),
+    ]
+    view_cache = None
+    if getattr(settings, 'BLOG_VIEW_BUFFER', 'memory') == 'cache':
+        view_cache = getattr(settings, 'BLOG_VIEW_CACHE', 'default')
+        shared.append(('view buffer cache', view_cache, 'blog.E004'))
+    for name, alias, error_id in shared:
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in LOCAL_BACKENDS:
+            errors.append(Error(
+                f"The {name} ('{alias}') is local to each process, so changes made by the task "
+                'worker or other web workers never refresh what the other workers cached',
+                hint='Use a shared backend (FileBasedCache, RedisCache) or set BLOG_TASKS_EAGER for a single process',
+                id=error_id,
+            ))
+    if view_cache and settings.CACHES.get(view_cache, {}).get('BACKEND') not in ATOMIC_INCR_BACKENDS + LOCAL_BACKENDS:
+        errors.append(Warning(
+            f"The view buffer cache ('{view_cache}') has no atomic incr, so views "
+            'counted by two workers at once can be lost',
+            hint="Use RedisCache for BLOG_VIEW_CACHE, or BLOG_VIEW_BUFFER = 'memory'",
+            id='blog.W001',
+        ))
+    return errors
@@ -0,0 +1,134 @@
+"""
+Threaded comments
+
+Each comment stores its thread (the top-level comment it belongs to) and
+a materialized path of zero-padded ids from the top down:
+
+    0000000012/                        top-level comment 12
+    0000000012/0000000015/             a reply to it
+    0000000012/0000000015/0000000031/  a reply to the reply
+
+Sorting a thread by path lists it depth-first, oldest reply first, which
+is the order it is shown in (indented by depth). So:
+
+- thread_page() loads a page of threads, newest first, with the first
+  few comments of each, in one query (a window function caps the replies)
+- more_replies() continues a thread after the last path shown, an index
+  range read on (thread, path)
+"""
+from django.conf import settings
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Comment
+from .pagination import CursorPaginator, InvalidCursor
+
+
+class Thread:
+    """
+    A top-level comment with the replies shown under it
+    more: replies not loaded yet, continued from after (the last path shown)
+    """
+
+    def __init__(self, comments, size):
+        self.comments = comments
+        self.root = comments[0]
+        self.more = size - len(comments)
+        self.after = comments[-1].path
+
+    def __iter__(self):
+        return iter(self.comments)
+
+
+def thread_page(post_id, cursor=None, per_page=None, replies_shown=None):
+    """
+    CursorPage of Threads for a post, newest thread first
+    The top-level comments of the page, each thread's size and its
+    first replies_shown replies all come from one query
+    """
+    per_page = per_page or getattr(settings, 'BLOG_COMMENT_THREADS_PER_PAGE', 10)
+    if replies_shown is None:
+        replies_shown = getattr(settings, 'BLOG_COMMENT_REPLIES_SHOWN', 3)
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id, parent__isnull=True), per_page, ordering=('-created_at', '-id')
+    )
+    try:
+        roots, direction = paginator.window(cursor)
+    except InvalidCursor:
+        roots, direction = paginator.window()
+
+    comments = list(
+        Comment.objects.filter(thread__in=roots.values('id')[:per_page + 1])
+        .select_related('author')
+        .annotate(
+            position=Window(RowNumber(), partition_by=[F('thread_id')], order_by=F('path').asc()),
+            thread_size=Window(Count('id'), partition_by=[F('thread_id')]),
+        )
+        .filter(position__lte=replies_shown + 1)
+        .order_by('thread_id', 'path')
+    )
+    threads = {}
+    for comment in comments:
+        threads.setdefault(comment.thread_id, []).append(comment)
+
+    # Top-level comments in window order - newest first, or oldest first when going back
+    rows = sorted(
+        (thread[0] for thread in threads.values()),
+        key=lambda root: (root.created_at, root.id), reverse=direction != 'p',
+    )
+    page = paginator.page_from_rows(rows, direction)
+    page.object_list = [Thread(threads[root.id], root.thread_size) for root in page.object_list]
+    return page
+
+
+def more_replies(thread_id, after, limit=None):
+    """
+    The next replies of a thread after the path last shown, in thread order
+    Returns (replies, has_more)
+    """
+    limit = limit or getattr(settings, 'BLOG_COMMENT_REPLIES_PAGE', 20)
+    replies = list(
+        Comment.objects.filter(thread_id=thread_id, path__gt=after)
+        .select_related('author')
+        .order_by('path')[:limit + 1]
+    )
+    return replies[:limit], len(replies) > limit
+
+
+def fill_tree_positions():
+    """
+    Sets thread, path and depth on comments that have none - rows made with
+    bulk_create or raw SQL skip Comment.save(). A bulk update per nesting level
+    Like save(), replies nested deeper than Comment.MAX_DEPTH answer their
+    parent's parent, so a path never outgrows its column
+    """
+    filled = 0
+    while True:
+        level = list(
+            Comment.objects.filter(Q(parent__isnull=True) | ~Q(parent__path=''), path='')
+            .values('id', 'parent_id', 'parent__parent_id', 'parent__thread_id', 'parent__path', 'parent__depth')
+        )
+        if not level:
+            return filled
+        Comment.objects.bulk_update(
+            [tree_position(row) for row in level],
+            ['parent', 'thread', 'path', 'depth'], batch_size=1000,
+        )
+        filled += len(level)
+
+
+def tree_position(row):
+    """
+    The comment of a fill_tree_positions() row with its thread, path and depth
+    A path segment is a zero-padded id and a slash, 11 characters
+    """
+    if row['parent_id'] is None:
+        return Comment(id=row['id'], parent_id=None, thread_id=row['id'], path=f'{row["id"]:010d}/', depth=0)
+    parent_id, parent_path, depth = row['parent_id'], row['parent__path'], row['parent__depth'] + 1
+    if depth > Comment.MAX_DEPTH:
+        # Too deep to indent further - answer the parent's parent
+        parent_id, parent_path, depth = row['parent__parent_id'], parent_path[:-11], depth - 1
+    return Comment(
+        id=row['id'], parent_id=parent_id, thread_id=row['parent__thread_id'],
+        path=f'{parent_path}{row["id"]:010d}/', depth=depth,
+    )
@@ -0,0 +1,147 @@
+"""
+Conditional GET for the public pages
+
+A page's ETag comes from the database rows it shows: each view has a
+page_state function that reads, in a query or two, what can change on the
+page - the posts' updated_at, like and comment counts and image
+renditions, the newest comment, the related posts, the categories. The
+ETag hashes those values. Browsers and crawlers that revalidate with
+If-None-Match get 304 Not Modified:
+
+- from a page cache hit, without any query
+- otherwise after the page_state lookup, without running the view or
+  its template
+
+There is no Last-Modified: no single timestamp moves for every change a
+page shows (new comments, likes, deleted posts, category descriptions),
+so If-Modified-Since would answer 304 for pages that changed.
+
+A revalidation always reads the state from the database, so edits made
+without signals are caught. Other GETs reuse the hash remembered for the
+page (in the page cache) while the versions of its page cache tags are
+unchanged, and only read the state when one of them moved. The state is
+read before the view runs, so a change made while the page renders gives
+the next revalidation a full page rather than a 304 for a page that never
+showed it. View counts are not part of the state, so as with the page
+cache a 304 may show a count that is a few minutes old. Logged-in pages
+add the user and their CSRF secret to the ETag, are marked private, and
+all pages vary on Cookie.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from .page_cache import get_page_cache
+
+
+def state_digest(state):
+    """
+    state is a list of plain values (rows from values_list...) whose repr
+    changes whenever the page would change
+    """
+    return hashlib.md5(repr(state).encode()).hexdigest()
+
+
+def page_etag(request, digest):
+    # The ETag for a page showing the state with this digest
+    parts = [digest]
+    if request.user.is_authenticated:
+        # The page shows who is logged in, their likes and a CSRF token
+        # (read again after rendering, which may have set the token)
+        parts += [f'user={request.user.pk}', request.META.get('CSRF_COOKIE', '')]
+    return 'W/"%s"' % hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def state_key(page_cache, request):
+    return f'blog:pagestate:{page_cache.page_key(request)}'
+
+
+def remembered_digest(request):
+    # The state digest remembered for this page, while none of its tags changed
+    page_cache = get_page_cache()
+    entry = page_cache.cache.get(state_key(page_cache, request))
+    if entry is None or not page_cache.is_current(entry, page_cache.cache.get_many(
+        [page_cache.tag_key(tag) for tag in entry['versions']]
+    )):
+        return None
+    return entry['digest']
+
+
+def remember_digest(request, digest):
+    tags = getattr(request, 'page_cache_tags', None)
+    if tags:
+        page_cache = get_page_cache()
+        page_cache.cache.set(
+            state_key(page_cache, request),
+            {'digest': digest, 'versions': page_cache.current_versions(tags)},
+            page_cache.timeout,
+        )
+
+
+def conditional_page(page_state, on_not_modified=None):
+    """
+    View decorator - ETag from the page's database state, and 304 Not
+    Modified for revalidations without running the view
+    page_state(request, *args, **kwargs) returns (state, meta), or None
+    for pages that aren't validated (e.g. search results)
+    on_not_modified(request, meta) runs for 304 responses, like on_hit
+    Works on sync and async views (the lookups then run in a thread)
+    """
+    def decorator(view):
+
+        def prepare(request, *args, **kwargs):
+            """
+            Before the view: (response, found, private) - a 304 (or 412)
+            when the revalidation still matches, (digest, remember) for
+            the page, and whether it is a logged-in page
+            """
+            private = request.user.is_authenticated
+            # Pages with flash messages are one-offs - never validate them
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return None, None, private
+            revalidation = 'HTTP_IF_NONE_MATCH' in request.META
+            digest = None if revalidation else remembered_digest(request)
+            if digest is not None:
+                return None, (digest, False), private
+            found = page_state(request, *args, **kwargs)
+            if found is None:
+                return None, None, private
+            state, meta = found
+            digest = state_digest(state)
+            response = None
+            if revalidation:
+                response = get_conditional_response(request, etag=page_etag(request, digest))
+                if response is not None and response.status_code == 304 and on_not_modified:
+                    on_not_modified(request, meta)
+            return response, (digest, True), private
+
+        def finish(request, response, found, private):
+            if found and response.status_code == 200 and not response.has_header('ETag'):
+                digest, remember = found
+                response.headers['ETag'] = page_etag(request, digest)
+                if remember:
+                    remember_digest(request, digest)
+            patch_vary_headers(response, ['Cookie'])
+            patch_cache_control(response, no_cache=True, private=private)
+            return response
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                response, found, private = await sync_to_async(prepare)(request, *args, **kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return await sync_to_async(finish)(request, response, found, private)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response, found, private = prepare(request, *args, **kwargs)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return finish(request, response, found, private)
+        return wrapper
+    return decorator
@@ -0,0 +1,314 @@
+"""
+Engagement counters for posts
+
+post_detail used to write the views column on every page hit. Instead,
+hits are collected in a buffer (process memory or the shared cache) and
+flushed once the flush interval has passed or enough hits have piled up.
+Each worker process checks that on every hit and from a background thread,
+so a worker that stops getting hits still flushes what it buffered. Hits
+buffered in memory are lost when a worker is killed without a clean exit
+(SIGKILL, out of memory) - at most the last interval's worth. A flush queues the counts as a task (blog.tasks), and the task worker
+sums the flushes of all web workers into one write of atomic
+F('views') + n updates. Each write also adds the hits to today's
+PostViewDaily rollup, which feeds blog.trending, and to the authors'
+cached total views (blog.author_stats).
+
+Like and comment counts are stored on Post (like_count, comment_count)
+and updated from blog.signals with atomic UPDATE statements.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .author_stats import add_author_stats
+from .tasks import enqueue, task
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryViewBuffer:
+    """
+    Keeps pending hits in a dict inside this process
+    Fast, but each worker only knows about its own hits
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, post_id, count=1):
+        with self._lock:
+            self._counts[post_id] += count
+
+    def pending(self, post_id):
+        return self._counts.get(post_id, 0)
+
+    def drain(self, post_ids=None):
+        # Take the pending counts out of the buffer and return them
+        with self._lock:
+            if post_ids is None:
+                counts, self._counts = dict(self._counts), Counter()
+            else:
+                counts = {pid: self._counts.pop(pid) for pid in post_ids if pid in self._counts}
+        return counts
+
+
+class CacheViewBuffer:
+    """
+    Keeps pending hits in the Django cache with atomic incr/decr
+    With a shared cache (Redis) every worker sees the same counts. The
+    backend's decr must be able to go below zero (Memcached stops at zero)
+    """
+    key_prefix = 'blog:views:'
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+        self._touched = set()
+        self._lock = threading.Lock()
+
+    def key(self, post_id):
+        return f'{self.key_prefix}{post_id}'
+
+    def add(self, post_id, count=1):
+        key = self.key(post_id)
+        try:
+            self.cache.incr(key, count)
+        except ValueError:
+            # First hit since the last flush - add() loses to a racing worker
+            if not self.cache.add(key, count, timeout=None):
+                self.cache.incr(key, count)
+        with self._lock:
+            self._touched.add(post_id)
+
+    def pending(self, post_id):
+        # Below zero while a drain gives back what it couldn't claim
+        return max(self.cache.get(self.key(post_id), 0), 0)
+
+    def drain(self, post_ids=None):
+        with self._lock:
+            if post_ids is None:
+                post_ids, self._touched = self._touched, set()
+            else:
+                self._touched.difference_update(post_ids)
+        keys = {self.key(pid): pid for pid in post_ids}
+        counts = {}
+        for key, count in self.cache.get_many(list(keys)).items():
+            count = self.claim(key, count)
+            if count:
+                counts[keys[key]] = count
+        return counts
+
+    def claim(self, key, count):
+        """
+        Takes up to count hits out of a key and returns how many it got
+        decr instead of delete so hits that arrive meanwhile survive. The
+        value decr returns says what was really there: when another worker
+        drained the same hits first, it went below zero, and the shortfall
+        goes back instead of being written twice
+        """
+        if count <= 0:
+            return 0
+        try:
+            remaining = self.cache.decr(key, count)
+        except ValueError:
+            # Evicted or drained and expired in the meantime
+            return 0
+        if remaining >= 0:
+            return count
+        claimed = max(count + remaining, 0)
+        self.cache.incr(key, count - claimed)
+        return claimed
+
+
+class ViewCounter:
+    """
+    Records post views and flushes them to the database in batches
+    The views column lags behind by at most flush_interval seconds
+    (or flush_threshold hits) plus the task queue, pending() gives the
+    unflushed part
+    """
+    # How often the flusher thread looks at the interval, in seconds
+    flush_check_interval = 1
+
+    def __init__(self, buffer, flush_interval=10, flush_threshold=100):
+        self.buffer = buffer
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def record(self, post_id):
+        self.buffer.add(post_id)
+        self._unflushed += 1
+        self.start_flusher()
+        if self._unflushed >= self.flush_threshold or self.interval_passed():
+            self.flush()
+
+    def interval_passed(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def start_flusher(self):
+        """
+        Starts the thread that flushes once the interval has passed, even
+        without new hits - once per process, so forked workers get their own
+        """
+        if self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self.flush_periodically, name='view-flusher', daemon=True).start()
+
+    def flush_periodically(self):
+        # Until stop()
+        while not self.stopping.wait(self.flush_check_interval):
+            if not (self._unflushed and self.interval_passed()):
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush buffered views')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopping.set()
+
+    def pending(self, post_id):
+        return self.buffer.pending(post_id)
+
+    def flush(self, post_ids=None):
+        """
+        Queues buffered views to be written, returns how many were queued
+        Pass post_ids to flush only those posts (e.g. every post on shutdown)
+        """
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        counts = self.buffer.drain(post_ids)
+        if not counts:
+            return 0
+        try:
+            enqueue('blog.write_views', counts)
+        except Exception:
+            # Put the hits back so the next flush can retry them
+            for post_id, count in counts.items():
+                self.buffer.add(post_id, count)
+            raise
+        return sum(counts.values())
+
+    def write(self, counts):
+        from .models import Post, PostViewDaily
+
+        # One UPDATE per distinct increment instead of one per post
+        by_increment = defaultdict(list)
+        for post_id, count in counts.items():
+            by_increment[count].append(post_id)
+        today = timezone.localdate()
+        with transaction.atomic():
+            # Make sure today's rollup rows exist, then bump them like the totals
+            existing = set(
+                PostViewDaily.objects.filter(date=today, post_id__in=counts)
+                .values_list('post_id', flat=True)
+            )
+            PostViewDaily.objects.bulk_create(
+                [PostViewDaily(post_id=post_id, date=today) for post_id in counts if post_id not in existing],
+                ignore_conflicts=True,
+            )
+            for count, post_ids in by_increment.items():
+                Post.objects.filter(id__in=post_ids).update(views=F('views') + count)
+                PostViewDaily.objects.filter(date=today, post_id__in=post_ids).update(views=F('views') + count)
+        # The authors' cached total views go up by the same hits
+        authors = Counter()
+        for post_id, author_id in Post.objects.filter(id__in=counts).values_list('id', 'author_id'):
+            authors[author_id] += counts[post_id]
+        add_author_stats('views', authors)
+
+
+@task('blog.write_views', batch_size=100)
+def write_views(batch):
+    # Flushes queued by any number of web workers, summed into one write
+    counts = Counter()
+    for (post_counts,) in batch:
+        counts.update({int(post_id): count for post_id, count in post_counts.items()})
+    get_view_counter().write(counts)
+
+
+_counter = None
+
+
+def get_view_counter():
+    """
+    Returns the view counter for this process (created once)
+    Configured with the BLOG_VIEW_* settings
+    """
+    global _counter
+    if _counter is None:
+        if getattr(settings, 'BLOG_VIEW_BUFFER', 'memory') == 'cache':
+            buffer = CacheViewBuffer(getattr(settings, 'BLOG_VIEW_CACHE', 'default'))
+        else:
+            buffer = MemoryViewBuffer()
+        _counter = ViewCounter(
+            buffer,
+            flush_interval=getattr(settings, 'BLOG_VIEW_FLUSH_INTERVAL', 10),
+            flush_threshold=getattr(settings, 'BLOG_VIEW_FLUSH_THRESHOLD', 100),
+        )
+        # Don't lose buffered hits when a worker shuts down cleanly
+        atexit.register(_counter.flush)
+    return _counter
+
+
+def like_count_subquery():
+    # Number of likes for the outer post, straight from the join table
+    from .models import Post
+
+    return Coalesce(Subquery(
+        Post.likes.through.objects
+        .filter(post_id=OuterRef('pk'))
+        .order_by()
+        .values('post_id')
+        .annotate(total=Count('*'))
+        .values('total')
+    ), 0)
+
+
+def comment_count_subquery():
+    from .models import Comment
+
+    return Coalesce(Subquery(
+        Comment.objects
+        .filter(post_id=OuterRef('pk'))
+        .order_by()
+        .values('post_id')
+        .annotate(total=Count('*'))
+        .values('total')
+    ), 0)
+
+
+def recount_likes(post_ids):
+    """
+    Recomputes like_count for the given posts in a single UPDATE
+    Exact even when likes were added or removed concurrently
+    """
+    from .models import Post
+
+    if post_ids:
+        Post.objects.filter(id__in=post_ids).update(like_count=like_count_subquery())
+
+
+def add_comments(post_id, count):
+    from .models import Post
+
+    Post.objects.filter(id=post_id).update(comment_count=F('comment_count') + count)
@@ -0,0 +1,399 @@
+"""
+Synthetic datasets for load tests and benchmarks
+
+The generate_data command fills the database with users, posts, tags,
+likes and comments shaped like a real blog's data rather than uniform rows:
+
+- popularity is heavy-tailed (Pareto, so the views per post follow a Zipf-like
+  rank curve): most posts get a few views, likes and comments, and a few get
+  most of them
+- a few authors write most of the posts, and a few readers like and
+  comment the most
+- tags are long-tail: a handful are on many posts, most on very few
+- posts are spread over the last `days` (3 years by default), more of them recent
+- comment threads are deep: replies mostly answer recent comments, down
+  to Comment.MAX_DEPTH
+- post and comment text uses a vocabulary with Zipf word frequencies, so
+  search sees common and rare words
+
+Rows are written with bulk_create, one transaction per chunk, and the
+derived columns are filled in as they go: like_count, comment_count,
+views, word counts, comment tree positions, profiles and the
+PostViewDaily rollups of recent posts. Signals don't fire, so the search
+index, related posts and trending scores are rebuilt at the end.
+
+Each chunk has its own random generator seeded from the seed and the
+chunk's position, so the same seed and chunk size give the same data,
+whether the chunks run in one process or several.
+"""
+import math
+import multiprocessing
+import random
+import time
+from collections import namedtuple
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Concat, LPad
+from django.utils import timezone
+from django.utils.text import slugify
+
+from accounts.models import UserProfile
+from .models import Category, Comment, Post, PostViewDaily, Tag
+from .page_cache import invalidate_pages
+
+# Most frequent first - word i is drawn with weight 1 / (i + 1)
+VOCABULARY = (
+    'the of and to in is for that with on it as this you are be from by or have at not can your '
+    'more about how all new one will we time when what which use their make web like data first '
+    'python django code work people way also get just best life guide most over app good day '
+    'year database server design need help know team world user tips easy simple build project '
+    'learn great home travel food health city start page small query index cache search business '
+    'money market music movie sport football cricket science history culture photography recipe '
+    'coffee mountain ocean learning teaching career finance budget garden family weekend adventure '
+    'fitness startup marketing javascript api performance testing deploy docker linux cloud '
+    'security network mobile android browser frontend backend template model view form admin '
+    'migration postgres sqlite redis queue worker async thread process memory latency benchmark '
+    'profile scale traffic review story photo camera beach hiking festival street island bread '
+    'pasta spice tea wine running yoga sleep diet habit focus writing reading book podcast '
+    'interview salary invest savings tax housing rent school student exam university research '
+    'climate energy solar electric flower plant winter summer spring autumn rain snow desert forest'
+).split()
+
+# Topic words - titles, tag names and first names skip the stop words
+TOPICS = VOCABULARY[VOCABULARY.index('python'):]
+
+CATEGORIES = (
+    'Technology', 'Lifestyle', 'Travel', 'Food', 'Business', 'Education', 'Entertainment', 'Sports',
+    'Science', 'Health', 'Finance', 'Culture', 'Design', 'Music', 'Photography', 'Career',
+)
+
+# Shape of the data
+POPULARITY_ALPHA = 1.2     # Pareto shape of post popularity - lower is more skewed
+AUTHOR_SKEW = 1.0          # Zipf exponent of posts per author
+READER_SKEW = 0.6          # ... of likes per user
+COMMENTER_SKEW = 0.8       # ... of comments per user
+TAG_SKEW = 1.1             # ... of posts per tag
+CATEGORY_SKEW = 0.7        # ... of posts per category
+TAGS_PER_POST = (1, 5)
+DRAFT_SHARE = 0.05
+THREAD_SHARE = 0.3         # share of comments that start a new thread
+REPLY_RECENCY = 3          # replies answer one of the last ~3 comments, so threads go deep
+
+# Settings and id lists the chunk functions read - set in each worker process
+Plan = namedtuple('Plan', [
+    'seed', 'prefix', 'now', 'days', 'trending_days', 'words', 'views', 'likes', 'comments',
+    'password', 'batch_size', 'user_ids', 'category_ids', 'tag_ids',
+])
+_plan = None
+_weights = {}
+
+
+def use_plan(plan):
+    # Pool initializer, and what the single process setup calls
+    global _plan
+    _plan = plan
+    _weights.clear()
+
+
+def zipf_weights(n, skew):
+    # Cumulative weights of ranks 1..n, for random.choices(cum_weights=...)
+    key = (n, skew)
+    if key not in _weights:
+        _weights[key] = list(accumulate(1 / rank ** skew for rank in range(1, n + 1)))
+    return _weights[key]
+
+
+def chunk_random(kind, index):
+    return random.Random(f'{_plan.seed}:{kind}:{index}')
+
+
+def pick(rng, population, skew, k=1):
+    return rng.choices(population, cum_weights=zipf_weights(len(population), skew), k=k)
+
+
+def pick_distinct(rng, population, skew, k):
+    # k different items, the popular ones more often - uniform when k is most of the population
+    if k * 2 >= len(population):
+        return rng.sample(population, k)
+    picked = set()
+    while len(picked) < k:
+        picked.update(pick(rng, population, skew, k - len(picked)))
+    return list(picked)
+
+
+def popularity(rng):
+    # Pareto with mean 1 - multiplies the average views, likes and comments
+    return rng.paretovariate(POPULARITY_ALPHA) * (POPULARITY_ALPHA - 1) / POPULARITY_ALPHA
+
+
+def text(rng, words, vocabulary=VOCABULARY):
+    return ' '.join(pick(rng, vocabulary, 1.0, words))
+
+
+def paragraphs(rng, words):
+    # Median length `words`, a few posts several times longer
+    total = max(20, int(rng.lognormvariate(math.log(words), 0.6)))
+    sizes = []
+    while total > 0:
+        sizes.append(min(total, rng.randint(40, 120)))
+        total -= sizes[-1]
+    return '\n\n'.join(text(rng, size).capitalize() + '.' for size in sizes)
+
+
+def tag_name(index):
+    # 0 -> 'python', 1 -> 'django', ..., then two-word and three-word names, all different
+    words = []
+    index += 1
+    while index:
+        index, digit = divmod(index - 1, len(TOPICS))
+        words.append(TOPICS[digit])
+    return ' '.join(words)
+
+
+def create_users(chunk):
+    """
+    Users with their profiles - bulk_create skips the post_save signal that makes them
+    """
+    start, stop = chunk
+    plan = _plan
+    rng = chunk_random('users', start)
+    users = [
+        User(
+            username=f'{plan.prefix}_user_{i}',
+            email=f'{plan.prefix}_user_{i}@example.com',
+            password=plan.password,
+            first_name=rng.choice(TOPICS).title(),
+            date_joined=plan.now - timezone.timedelta(days=plan.days * rng.random() ** 2),
+        )
+        for i in range(start, stop)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=plan.batch_size)
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=user.id, bio=text(rng, rng.randint(5, 30)).capitalize() if rng.random() < 0.3 else '')
+            for user in users
+        ], batch_size=plan.batch_size)
+    return [user.id for user in users]
+
+
+def create_posts(chunk):
+    """
+    Posts with their tags, engagement counters and recent daily views
+    The counters are targets that create_likes and create_comments then fill
+    """
+    start, stop = chunk
+    plan = _plan
+    rng = chunk_random('posts', start)
+    today = timezone.localdate(plan.now)
+    posts = []
+    post_tags = []
+    daily_views = []
+    for i in range(start, stop):
+        title = text(rng, rng.randint(3, 9), TOPICS).capitalize()
+        age = timezone.timedelta(days=plan.days * rng.random() ** 2)
+        published = rng.random() >= DRAFT_SHARE
+        share = popularity(rng) if published else 0
+        post = Post(
+            title=title,
+            slug=f'{slugify(title)[:200]}-{plan.prefix}-{i}',
+            author_id=pick(rng, plan.user_ids, AUTHOR_SKEW)[0],
+            category_id=pick(rng, plan.category_ids, CATEGORY_SKEW)[0],
+            content=paragraphs(rng, plan.words),
+            status='published' if published else 'draft',
+            created_at=plan.now - age - timezone.timedelta(hours=rng.uniform(0, 48)),
+            published_at=plan.now - age if published else None,
+            views=round(plan.views * share * rng.uniform(0.8, 1.2)),
+            like_count=min(len(plan.user_ids), round(plan.likes * share * rng.uniform(0.5, 1.5))),
+            comment_count=round(plan.comments * share * rng.uniform(0.5, 1.5)),
+        )
+        post.update_card_fields()
+        posts.append(post)
+        post_tags.append(pick_distinct(rng, plan.tag_ids, TAG_SKEW, rng.randint(*TAGS_PER_POST)))
+        if published and age.days < plan.trending_days:
+            daily_views.append(spread_views(rng, post, today))
+
+    with transaction.atomic():
+        Post.objects.bulk_create(posts, batch_size=plan.batch_size)
+        through = Post.tags.through
+        through.objects.bulk_create([
+            through(post_id=post.id, tag_id=tag_id)
+            for post, tag_ids in zip(posts, post_tags)
+            for tag_id in tag_ids
+        ], batch_size=plan.batch_size)
+        PostViewDaily.objects.bulk_create([
+            PostViewDaily(post_id=post.id, date=date, views=views)
+            for post, days in daily_views
+            for date, views in days
+        ], batch_size=plan.batch_size)
+    return [post.id for post in posts]
+
+
+def spread_views(rng, post, today):
+    # A recent post's views by day, most of them in its first days
+    published = timezone.localdate(post.published_at)
+    days = (today - published).days + 1
+    weights = [math.exp(-day / 3) * rng.uniform(0.5, 1.5) for day in range(days)]
+    total = sum(weights)
+    return post, [
+        (published + timezone.timedelta(days=day), round(post.views * weight / total))
+        for day, weight in enumerate(weights)
+        if round(post.views * weight / total)
+    ]
+
+
+def chunk_posts(post_ids, *fields):
+    # (id, *fields) of a chunk's posts - ids from other processes' chunks can fall in the range
+    wanted = set(post_ids)
+    rows = (
+        Post.objects.filter(id__gte=min(post_ids), id__lte=max(post_ids))
+        .order_by('id')
+        .values_list('id', *fields)
+    )
+    return [row for row in rows if row[0] in wanted]
+
+
+def create_likes(chunk):
+    index, post_ids = chunk
+    plan = _plan
+    rng = chunk_random('likes', index)
+    through = Post.likes.through
+    likes = []
+    with transaction.atomic():
+        for post_id, like_count in chunk_posts(post_ids, 'like_count'):
+            likes += [
+                through(post_id=post_id, user_id=user_id)
+                for user_id in pick_distinct(rng, plan.user_ids, READER_SKEW, like_count)
+            ]
+            if len(likes) >= plan.batch_size * 10:
+                through.objects.bulk_create(likes, batch_size=plan.batch_size)
+                likes = []
+        through.objects.bulk_create(likes, batch_size=plan.batch_size)
+
+
+def create_comments(chunk):
+    """
+    Comment threads, inserted one nesting level at a time so replies know their parent's id
+    """
+    index, post_ids = chunk
+    plan = _plan
+    rng = chunk_random('comments', index)
+    levels = [[] for _ in range(Comment.MAX_DEPTH + 1)]
+    for post_id, comment_count, published_at in chunk_posts(post_ids, 'comment_count', 'published_at'):
+        thread = []
+        for _ in range(comment_count):
+            if not thread or rng.random() < THREAD_SHARE:
+                parent = None
+                created_at = published_at + timezone.timedelta(hours=rng.expovariate(1 / 48))
+            else:
+                parent = thread[max(0, len(thread) - 1 - int(rng.expovariate(1 / REPLY_RECENCY)))]
+                if parent.depth >= Comment.MAX_DEPTH:
+                    # Too deep - answer the parent's parent, like Comment.save()
+                    parent = parent.parent
+                created_at = parent.created_at + timezone.timedelta(hours=rng.expovariate(1 / 6))
+            comment = Comment(
+                post_id=post_id,
+                author_id=pick(rng, plan.user_ids, COMMENTER_SKEW)[0],
+                content=text(rng, max(3, int(rng.lognormvariate(math.log(20), 0.7)))).capitalize(),
+                created_at=min(created_at, plan.now),
+                parent=parent,
+                depth=parent.depth + 1 if parent else 0,
+            )
+            thread.append(comment)
+            levels[comment.depth].append(comment)
+
+    own_id = Concat(LPad(Cast('id', CharField()), 10, Value('0')), Value('/'))
+    with transaction.atomic():
+        for depth, comments in enumerate(levels):
+            for comment in comments:
+                if comment.parent:
+                    comment.thread_id = comment.parent.thread_id
+                    comment.path = comment.parent.path
+            Comment.objects.bulk_create(comments, batch_size=plan.batch_size)
+            # The path ends with the comment's own id, known only now
+            for comment in comments:
+                comment.path += f'{comment.id:010d}/'
+                if not depth:
+                    comment.thread_id = comment.id
+            for start in range(0, len(comments), 500):
+                ids = [comment.id for comment in comments[start:start + 500]]
+                if depth:
+                    Comment.objects.filter(id__in=ids).update(path=Concat('path', own_id))
+                else:
+                    Comment.objects.filter(id__in=ids).update(path=own_id, thread=F('id'))
+
+
+class DataGenerator:
+    """
+    Writes a dataset in chunks, in this process or a pool of them
+    log(message) reports each step
+    """
+
+    def __init__(self, users=10000, posts=100000, tags=2000, categories=12, views=500, likes=20, comments=5,
+                 words=300, days=1095, seed=42, prefix='gen', password='password', chunk_size=2000,
+                 processes=1, log=print):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise ValueError('generating data needs a database that returns ids from bulk inserts')
+        if processes > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            raise ValueError('several processes need the fork start method (Linux, macOS)')
+        self.counts = {'users': users, 'posts': posts, 'tags': tags, 'categories': min(categories, len(CATEGORIES))}
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.log = log
+        self.plan = Plan(
+            seed=seed, prefix=prefix, now=timezone.now(), days=days,
+            trending_days=getattr(settings, 'BLOG_TRENDING_WINDOW_DAYS', 30),
+            words=words, views=views, likes=likes, comments=comments,
+            password=make_password(password), batch_size=min(chunk_size, 1000),
+            user_ids=[], category_ids=[], tag_ids=[],
+        )
+
+    def run(self):
+        user_chunks = self.run_chunks('users', create_users, self.ranges(self.counts['users']))
+        self.plan = self.plan._replace(user_ids=[pk for chunk in user_chunks for pk in chunk])
+        self.create_taxonomy()
+
+        post_chunks = self.run_chunks('posts', create_posts, self.ranges(self.counts['posts']))
+        chunks = [(start, post_ids) for (start, _), post_ids in zip(self.ranges(self.counts['posts']), post_chunks)]
+        self.run_chunks('likes', create_likes, chunks)
+        self.run_chunks('comments', create_comments, chunks)
+        # Cached listings don't know about the new posts
+        invalidate_pages('posts', 'search', 'explore', 'categories')
+
+    def ranges(self, count):
+        return [(start, min(start + self.chunk_size, count)) for start in range(0, count, self.chunk_size)]
+
+    def run_chunks(self, label, func, chunks):
+        started = time.perf_counter()
+        if self.processes > 1:
+            # Forked children must not share the parent's connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with context.Pool(self.processes, initializer=use_plan, initargs=(self.plan,)) as pool:
+                results = pool.map(func, chunks, chunksize=1)
+        else:
+            use_plan(self.plan)
+            results = [func(chunk) for chunk in chunks]
+        self.log(f'{label}: {len(chunks)} chunks in {time.perf_counter() - started:.1f}s')
+        return results
+
+    def create_taxonomy(self):
+        plan = self.plan
+        prefix = plan.prefix.title()
+        with transaction.atomic():
+            categories = Category.objects.bulk_create([
+                Category(name=f'{name} ({prefix})', slug=slugify(f'{name} {prefix}'), description=f'{name} posts')
+                for name in CATEGORIES[:self.counts['categories']]
+            ])
+            tags = Tag.objects.bulk_create([
+                Tag(name=f'{tag_name(i)} {plan.prefix}'[:50], slug=slugify(f'{tag_name(i)} {plan.prefix}')[:50])
+                for i in range(self.counts['tags'])
+            ], batch_size=plan.batch_size)
+        self.plan = plan._replace(
+            category_ids=[category.id for category in categories], tag_ids=[tag.id for tag in tags],
+        )
+        self.log(f'taxonomy: {len(categories)} categories, {len(tags)} tags')
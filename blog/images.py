@@ -0,0 +1,123 @@
+"""
+Responsive image renditions
+
+Uploaded images are stored as they come, then resized copies are made
+by a background task (blog.tasks): WebP and JPEG at a few widths, saved next to the
+original under renditions/. The model's <field>_renditions JSON holds
+
+    {'source': 'blog/cat.png', 'width': 3000, 'height': 2000,
+     'sizes': [{'width': 320, 'height': 213, 'webp': '...', 'jpeg': '...'}, ...]}
+
+and {% responsive_image %} (blog_images tag library) turns it into a
+<picture> with srcset/sizes, so browsers fetch the smallest copy that
+looks sharp instead of the full upload.
+"""
+import io
+import os
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .tasks import enqueue, task
+
+# (app_label, model_name, field) -> rendition widths
+IMAGE_FIELDS = {
+    ('blog', 'post', 'featured_image'): (320, 640, 1024, 1600),
+    ('accounts', 'userprofile', 'profile_picture'): (64, 128, 256),
+}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def renditions_field(field_name):
+    return f'{field_name}_renditions'
+
+
+def rendition_name(source, width, extension):
+    # blog/cat.png -> blog/renditions/cat-640w.webp
+    directory, filename = os.path.split(source)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'renditions', f'{stem}-{width}w.{extension}')
+
+
+def make_renditions(field_file, widths):
+    """
+    Resizes the image in field_file to each width (never upscaling)
+    and saves WebP and JPEG copies, returns the renditions dict
+    """
+    storage = field_file.storage
+    with field_file.open('rb'), Image.open(field_file) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        source_width, source_height = image.size
+        sizes = []
+        for width in sorted({min(width, source_width) for width in widths}):
+            height = max(1, round(source_height * width / source_width))
+            resized = image.resize((width, height), Image.LANCZOS) if width != source_width else image
+            entry = {'width': width, 'height': height}
+            for extension, options in (
+                ('webp', {'format': 'WEBP', 'quality': WEBP_QUALITY, 'method': 4}),
+                ('jpeg', {'format': 'JPEG', 'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}),
+            ):
+                picture = resized.convert('RGB') if extension == 'jpeg' else resized
+                buffer = io.BytesIO()
+                picture.save(buffer, **options)
+                # The storage picks a free name if another upload already used this one
+                name = rendition_name(field_file.name, width, extension)
+                entry[extension] = storage.save(name, ContentFile(buffer.getvalue()))
+            sizes.append(entry)
+    return {'source': field_file.name, 'width': source_width, 'height': source_height, 'sizes': sizes}
+
+
+def delete_renditions(storage, renditions):
+    for entry in renditions.get('sizes', []):
+        storage.delete(entry['webp'])
+        storage.delete(entry['jpeg'])
+
+
+@task('blog.process_image', retries=2)
+def process_image(app_label, model_name, pk, field_name):
+    """
+    Builds the renditions for one model instance's image field
+    Skips the write if the image was replaced in the meantime
+    """
+    model = apps.get_model(app_label, model_name)
+    json_field = renditions_field(field_name)
+    instance = model.objects.filter(pk=pk).only(field_name, json_field).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, field_name)
+    old = getattr(instance, json_field) or {}
+    renditions = make_renditions(field_file, IMAGE_FIELDS[(app_label, model_name, field_name)]) if field_file else {}
+
+    # Only store them if the row still has this image
+    if field_file:
+        unchanged = Q(**{field_name: field_file.name})
+    else:
+        unchanged = Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+    updated = model.objects.filter(unchanged, pk=pk).update(**{json_field: renditions})
+    if not updated:
+        delete_renditions(field_file.storage, renditions)
+        return None
+    # Files of the image this one replaced, or of the previous build
+    delete_renditions(field_file.storage, old)
+    if model_name == 'post':
+        from .page_cache import invalidate_pages
+        invalidate_pages(f'post:{pk}')
+    return renditions
+
+
+def schedule_renditions(instance, field_name):
+    # Called after save - only when the image differs from the one processed last
+    if {field_name, renditions_field(field_name)} & instance.get_deferred_fields():
+        return  # saved from a partial load, e.g. a card - the image wasn't edited
+    field_file = getattr(instance, field_name)
+    renditions = getattr(instance, renditions_field(field_name)) or {}
+    if (field_file.name or '') != renditions.get('source', ''):
+        # The task reads the row's current image, so one queued per field is enough
+        args = (instance._meta.app_label, instance._meta.model_name, instance.pk, field_name)
+        enqueue('blog.process_image', *args, dedup_key='image:{}.{}:{}:{}'.format(*args))
@@ -0,0 +1,27 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from blog.images import IMAGE_FIELDS, process_image, renditions_field
+
+
+class Command(BaseCommand):
+    help = 'Create resized WebP/JPEG copies of uploaded images that have none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild existing renditions too')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = 0
+        for (app_label, model_name, field_name), _ in IMAGE_FIELDS.items():
+            model = apps.get_model(app_label, model_name)
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            if not options['all']:
+                rows = rows.filter(**{renditions_field(field_name): {}})
+            for pk in rows.values_list('pk', flat=True).iterator():
+                if process_image(app_label, model_name, pk, field_name):
+                    count += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'✓ Built renditions for {count} images in {elapsed:.2f}s'))
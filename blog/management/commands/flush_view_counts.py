@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from blog.counters import CacheViewBuffer, get_view_counter
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Write buffered post views to the database (run on deploy/shutdown)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        counter = get_view_counter()
+        if not isinstance(counter.buffer, CacheViewBuffer):
+            # A memory buffer lives inside each worker and is flushed at exit
+            self.stdout.write('BLOG_VIEW_BUFFER is "memory" - workers flush their own views on exit.')
+            return
+
+        # Any worker may have buffered views for any post, so check them all
+        chunk_size = options['chunk_size']
+        post_ids = list(Post.objects.values_list('id', flat=True))
+        written = 0
+        for start in range(0, len(post_ids), chunk_size):
+            written += counter.flush(post_ids[start:start + chunk_size])
+        self.stdout.write(self.style.SUCCESS(f'✓ Flushed {written} buffered views'))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.datagen import DataGenerator
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, skewed synthetic dataset for load tests and benchmarks (see blog/datagen.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=2000)
+        parser.add_argument('--categories', type=int, default=12, help='Up to 16')
+        parser.add_argument('--views', type=int, default=500, help='Average views per published post')
+        parser.add_argument('--likes', type=int, default=20, help='Average likes per published post')
+        parser.add_argument('--comments', type=int, default=5, help='Average comments per published post')
+        parser.add_argument('--words', type=int, default=300, help='Median words per post')
+        parser.add_argument('--days', type=int, default=1095, help='Posts are spread over this many days')
+        parser.add_argument('--seed', type=int, default=42, help='Same seed and chunk size, same data')
+        parser.add_argument('--prefix', default='gen',
+                            help='Start of usernames, slugs and tag names, so several datasets can coexist')
+        parser.add_argument('--password', default='password', help='Password of every generated user')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows per chunk, one transaction each')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Generate chunks in this many processes (worth it on PostgreSQL)')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help="Don't rebuild the search index, related posts and trending scores")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            generator = DataGenerator(
+                users=options['users'], posts=options['posts'], tags=options['tags'],
+                categories=options['categories'], views=options['views'], likes=options['likes'],
+                comments=options['comments'], words=options['words'], days=options['days'],
+                seed=options['seed'], prefix=options['prefix'], password=options['password'],
+                chunk_size=options['chunk_size'], processes=options['processes'], log=self.stdout.write,
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        generator.run()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Generated {options["users"]} users and {options["posts"]} posts in {elapsed:.2f}s'
+        ))
+
+        if options['skip_rebuild']:
+            self.stdout.write('Skipped the rebuilds, run: rebuild_search_index, rebuild_related_posts, update_trending')
+            return
+        for command in ('rebuild_search_index', 'rebuild_related_posts', 'update_trending'):
+            call_command(command, stdout=self.stdout, stderr=self.stderr)
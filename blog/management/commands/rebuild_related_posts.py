@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.related import RelatedPostsEngine
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored related posts for every published post'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = RelatedPostsEngine().rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'✓ Computed related posts for {count} posts in {elapsed:.2f}s'))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all published posts'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.perf_counter()
+        with transaction.atomic():
+            count = backend.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Indexed {count} posts with {type(backend).__name__} in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.counters import comment_count_subquery, like_count_subquery
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute like_count and comment_count for all posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Posts updated per UPDATE statement')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+        post_ids = list(Post.objects.order_by('id').values_list('id', flat=True))
+
+        # Walk id ranges so each UPDATE only locks a slice of the table
+        for start in range(0, len(post_ids), chunk_size):
+            chunk = post_ids[start:start + chunk_size]
+            with transaction.atomic():
+                Post.objects.filter(id__gte=chunk[0], id__lte=chunk[-1]).update(
+                    like_count=like_count_subquery(),
+                    comment_count=comment_count_subquery(),
+                )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Reconciled counters for {len(post_ids)} posts in {elapsed:.2f}s'
+        ))
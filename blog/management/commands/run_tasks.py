@@ -0,0 +1,56 @@
+import signal
+import subprocess
+import sys
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (view counts, image renditions, related posts...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Worker threads per process')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Start this many worker processes (for CPU-bound tasks such as image resizing)')
+        parser.add_argument('--once', action='store_true', help='Run the tasks that are due, then exit')
+
+    def handle(self, *args, **options):
+        if options['processes'] > 1 and not options['once']:
+            return self.run_processes(options['processes'], options['threads'])
+
+        workers = [Worker() for _ in range(options['threads'])]
+        target = 'run_pending' if options['once'] else 'run'
+        threads = [threading.Thread(target=getattr(worker, target), name=f'tasks-{i}')
+                   for i, worker in enumerate(workers)]
+
+        def stop(signum, frame):
+            # Finish the running batches, then exit
+            for worker in workers:
+                worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f'Running tasks (threads: {len(threads)})')
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stdout.write(self.style.SUCCESS('✓ Task worker stopped'))
+
+    def run_processes(self, processes, threads):
+        # Copies of this command - each process gets its own GIL and connections
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'run_tasks', '--threads', str(threads)]
+        children = [subprocess.Popen(command) for _ in range(processes)]
+
+        def stop(signum, frame):
+            for child in children:
+                child.send_signal(signal.SIGTERM)
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        for child in children:
+            child.wait()
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.trending import prune_rollups, update_trending_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute trending scores from daily view rollups (run every few minutes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window-days', type=int, default=None,
+                            help='Days of views to score (default: BLOG_TRENDING_WINDOW_DAYS)')
+        parser.add_argument('--gravity', type=float, default=None,
+                            help='How fast old views fade (default: BLOG_TRENDING_GRAVITY)')
+        parser.add_argument('--keep-days', type=int, default=None,
+                            help='Also delete rollups older than this many days')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        changed = update_trending_scores(
+            window_days=options['window_days'],
+            gravity=options['gravity'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'✓ Updated {changed} trending scores in {elapsed:.2f}s'))
+
+        if options['keep_days']:
+            deleted = prune_rollups(options['keep_days'])
+            self.stdout.write(f'Deleted {deleted} old daily view rows')
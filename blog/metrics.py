@@ -0,0 +1,355 @@
+"""
+Request metrics
+
+RequestMetricsMiddleware times every request and records, per URL name
+(blog:home, blog:post_detail...), histograms of:
+
+- total latency
+- SQL queries and SQL time - time_query() is installed on every database
+  connection (connection_created) and adds to the current request's
+  RequestTimings, found through a context variable, so queries that async
+  views run in worker threads count too
+- template render time - TEMPLATES uses the DjangoTemplates backend below,
+  which times each render(). It includes the queries run while rendering
+  (lazy querysets, fragments to re-render)
+
+The numbers are per worker process. Staff see them at /stats/performance/,
+Prometheus scrapes /metrics, and every response gets a Server-Timing
+header that browser dev tools show next to the request.
+
+With BLOG_PROFILE_SAMPLE_RATE set, that fraction of (sync) requests runs
+under cProfile, and the ones slower than BLOG_PROFILE_SLOW_MS are saved
+to BLOG_PROFILE_DIR for python -m pstats or snakeviz.
+"""
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+# Upper bounds of the histogram buckets, Prometheus style (the last one is +Inf)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, float('inf'))
+
+# Prometheus metric -> (RequestTimings field, buckets, help)
+HISTOGRAMS = {
+    'bloghub_request_duration_seconds': ('latency', SECONDS_BUCKETS, 'Request latency'),
+    'bloghub_sql_queries': ('sql_count', QUERY_BUCKETS, 'SQL queries per request'),
+    'bloghub_sql_duration_seconds': ('sql_seconds', SECONDS_BUCKETS, 'SQL time per request'),
+    'bloghub_template_duration_seconds': ('template_seconds', SECONDS_BUCKETS, 'Template render time per request'),
+}
+
+UNMATCHED = '<unmatched>'
+
+
+class Histogram:
+    """
+    Counts of observed values per bucket, plus their count and sum
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Estimated q-quantile, interpolated inside its bucket the way
+        Prometheus' histogram_quantile() does
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+
+class RequestTimings:
+    """
+    What one request spent, filled in while it runs
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = 0
+        self.latency = 0.0
+        # Async views run queries in several threads at once
+        self.lock = threading.Lock()
+
+    def add_query(self, seconds):
+        with self.lock:
+            self.sql_count += 1
+            self.sql_seconds += seconds
+
+    def server_timing(self):
+        return (
+            f'sql;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} queries", '
+            f'tpl;dur={self.template_seconds * 1000:.1f};desc="templates", '
+            f'total;dur={self.latency * 1000:.1f}'
+        )
+
+
+current_timings = ContextVar('blog_request_timings', default=None)
+
+
+class Metrics:
+    """
+    Histograms per URL name for this process
+    """
+
+    def __init__(self):
+        self.views = {}
+        self.statuses = Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, view_name, status_code, timings):
+        with self.lock:
+            histograms = self.views.get(view_name)
+            if histograms is None:
+                histograms = self.views[view_name] = {
+                    field: Histogram(buckets) for field, buckets, _ in HISTOGRAMS.values()
+                }
+            for field, histogram in histograms.items():
+                histogram.observe(getattr(timings, field))
+            self.statuses[(view_name, f'{status_code // 100}xx')] += 1
+
+    def summary(self):
+        """
+        {view_name: {'requests': n, 'status': {...}, 'latency_ms': {'p50': ...}, ...}}
+        """
+        with self.lock:
+            views = {}
+            for view_name, histograms in sorted(self.views.items()):
+                latency = histograms['latency']
+                queries = histograms['sql_count']
+                views[view_name] = {
+                    'requests': latency.count,
+                    'status': {status: n for (name, status), n in sorted(self.statuses.items()) if name == view_name},
+                    'latency_ms': percentiles(latency, 1000),
+                    'sql_ms': percentiles(histograms['sql_seconds'], 1000),
+                    'template_ms': percentiles(histograms['template_seconds'], 1000),
+                    'sql_queries': {
+                        'mean': round(queries.sum / queries.count, 1) if queries.count else 0,
+                        'p95': round(queries.quantile(0.95), 1),
+                    },
+                }
+            return views
+
+    def prometheus(self):
+        """
+        The histograms in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for metric, (field, buckets, help_text) in HISTOGRAMS.items():
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+                for view_name, histograms in sorted(self.views.items()):
+                    histogram = histograms[field]
+                    label = f'view="{escape_label(view_name)}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets, histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                        lines.append(f'{metric}_bucket{{{label},le="{le}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{{label}}} {histogram.sum:.6f}')
+                    lines.append(f'{metric}_count{{{label}}} {histogram.count}')
+            lines += ['# HELP bloghub_responses_total Responses by status class', '# TYPE bloghub_responses_total counter']
+            for (view_name, status), count in sorted(self.statuses.items()):
+                lines.append(f'bloghub_responses_total{{view="{escape_label(view_name)}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+            self.statuses.clear()
+
+
+def percentiles(histogram, scale):
+    return {f'p{int(q * 100)}': round(histogram.quantile(q) * scale, 2) for q in (0.5, 0.95, 0.99)}
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+_metrics = None
+
+
+def get_metrics():
+    # The metrics of this process (created once)
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def time_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(time.perf_counter() - started)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    # connection_created - runs again when a connection is reopened, so only add the wrapper once
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        timings = current_timings.get()
+        if timings is None:
+            return super().render(context, request)
+        # A template rendered while rendering another (render_to_string in a tag) is already counted
+        timings.rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.rendering -= 1
+            if not timings.rendering:
+                timings.template_seconds += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    The Django template backend, with render time counted in the request's metrics
+    """
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+class SampledProfiler:
+    """
+    Runs a random sample of requests under cProfile and saves the slow ones
+    One request at a time - the others run unprofiled meanwhile
+    """
+
+    def __init__(self, rate, slow_ms, directory):
+        self.rate = rate
+        self.slow_seconds = slow_ms / 1000
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def start(self):
+        # A running cProfile.Profile, or None when this request isn't sampled
+        if not self.rate or random.random() >= self.rate or not self.lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this process
+            self.lock.release()
+            return None
+        return profiler
+
+    def finish(self, profiler, view_name, seconds):
+        """
+        Stops the profiler, returns the saved file's path when the request was slow
+        """
+        profiler.disable()
+        self.lock.release()
+        if seconds < self.slow_seconds:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{view_name.replace(":", ".")}-{seconds * 1000:.0f}ms.prof'
+        path = os.path.join(self.directory, name)
+        profiler.dump_stats(path)
+        return path
+
+
+class RequestMetricsMiddleware:
+    """
+    Records each request's latency, SQL and template time under its URL
+    name and adds the Server-Timing header. Runs natively under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.metrics = get_metrics()
+        self.server_timing = getattr(settings, 'BLOG_SERVER_TIMING', True)
+        self.profiler = SampledProfiler(
+            getattr(settings, 'BLOG_PROFILE_SAMPLE_RATE', 0),
+            getattr(settings, 'BLOG_PROFILE_SLOW_MS', 500),
+            getattr(settings, 'BLOG_PROFILE_DIR', 'profiles'),
+        )
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        profiler = self.profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+            timings.latency = time.perf_counter() - timings.started
+            if profiler is not None:
+                self.profiler.finish(profiler, view_name(request), timings.latency)
+        return self.record(request, response, timings)
+
+    async def __acall__(self, request):
+        # No profiling - cProfile would mix in every request on the event loop
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+            timings.latency = time.perf_counter() - timings.started
+        return self.record(request, response, timings)
+
+    def record(self, request, response, timings):
+        self.metrics.observe(view_name(request), response.status_code, timings)
+        if self.server_timing:
+            response['Server-Timing'] = timings.server_timing()
+        return response
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else UNMATCHED
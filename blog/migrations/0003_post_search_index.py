@@ -0,0 +1,45 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts "
+            "USING fts5(title, content, tags, tokenize='porter unicode61')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS blog_post_search ("
+            "post_id bigint PRIMARY KEY REFERENCES blog_post (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS blog_post_search_document_gin "
+            "ON blog_post_search USING GIN (document)"
+        )
+    else:
+        return
+
+    # Fill the new index with the posts that already exist
+    from blog.search import VENDOR_BACKENDS
+    VENDOR_BACKENDS[vendor]().rebuild()
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS blog_post_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS blog_post_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_post_likes_post_views_alter_post_excerpt_comment'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:37
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Comment = apps.get_model('blog', 'Comment')
+
+    def count_of(queryset):
+        return Coalesce(Subquery(
+            queryset.filter(post_id=OuterRef('pk')).order_by()
+            .values('post_id').annotate(total=Count('*')).values('total')
+        ), 0)
+
+    Post.objects.update(
+        like_count=count_of(Post.likes.through.objects),
+        comment_count=count_of(Comment.objects),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-like_count', '-published_at'], name='blog_post_popular_idx'),
+        ),
+    ]
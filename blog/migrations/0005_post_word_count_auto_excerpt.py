@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+def fill_card_fields(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    batch = []
+    for post in Post.objects.only('content').iterator(chunk_size=500):
+        words = post.content.split()
+        post.word_count = len(words)
+        post.auto_excerpt = ' '.join(words[:50])
+        batch.append(post)
+        if len(batch) >= 500:
+            Post.objects.bulk_update(batch, ['word_count', 'auto_excerpt'])
+            batch = []
+    Post.objects.bulk_update(batch, ['word_count', 'auto_excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_like_count_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='auto_excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_card_fields, migrations.RunPython.noop),
+    ]
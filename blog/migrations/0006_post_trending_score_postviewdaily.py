@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_word_count_auto_excerpt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('views', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-trending_score', '-published_at'], name='blog_post_trending_idx'),
+        ),
+        migrations.AddField(
+            model_name='postviewdaily',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='blog.post'),
+        ),
+        migrations.AddConstraint(
+            model_name='postviewdaily',
+            constraint=models.UniqueConstraint(fields=('post', 'date'), name='blog_postviewdaily_post_date_uniq'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_post_trending_score_postviewdaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='blog.post')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_from', to='blog.post')),
+            ],
+            options={
+                'ordering': ['post', '-score'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedpost',
+            constraint=models.UniqueConstraint(fields=('post', 'related'), name='blog_relatedpost_post_related_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_relatedpost'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-published_at', '-id'], name='blog_post_listing_idx'),
+        ),
+    ]
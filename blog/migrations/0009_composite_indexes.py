@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_listing_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ['-published_at', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='blog_post_popular_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='blog_post_trending_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='blog_post_listing_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at'], name='blog_comment_post_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['-published_at', '-id'], name='blog_post_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['category', '-published_at', '-id'], name='blog_post_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['-like_count', '-published_at'], name='blog_post_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['-trending_score', '-published_at'], name='blog_post_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='blog_post_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relatedpost',
+            index=models.Index(fields=['post', '-score'], name='blog_relatedpost_score_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='featured_image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:17
+
+from django.db import migrations, models
+from django.db.models import Q
+import django.db.models.deletion
+
+
+# Comment.MAX_DEPTH - replies nested deeper answer their parent's parent, as
+# Comment.save() does, so no path is longer than 6 ids (66 of its 255 characters)
+MAX_DEPTH = 5
+
+
+def fill_tree_positions(apps, schema_editor):
+    # Existing comments, one nesting level at a time: top-level ones, then their replies, ...
+    Comment = apps.get_model('blog', 'Comment')
+    while True:
+        level = list(
+            Comment.objects.filter(Q(parent__isnull=True) | ~Q(parent__path=''), path='')
+            .values('id', 'parent_id', 'parent__parent_id', 'parent__thread_id', 'parent__path', 'parent__depth')
+        )
+        if not level:
+            break
+        comments = []
+        for row in level:
+            if row['parent_id'] is None:
+                comments.append(Comment(id=row['id'], parent_id=None, thread_id=row['id'], path=f'{row["id"]:010d}/', depth=0))
+                continue
+            parent_id, parent_path, depth = row['parent_id'], row['parent__path'], row['parent__depth'] + 1
+            if depth > MAX_DEPTH:
+                # A path segment is a zero-padded id and a slash, 11 characters
+                parent_id, parent_path, depth = row['parent__parent_id'], parent_path[:-11], depth - 1
+            comments.append(Comment(
+                id=row['id'], parent_id=parent_id, thread_id=row['parent__thread_id'],
+                path=f'{parent_path}{row["id"]:010d}/', depth=depth,
+            ))
+        Comment.objects.bulk_update(comments, ['parent', 'thread', 'path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_post_featured_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.comment'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['post', '-created_at', '-id'], name='blog_comment_roots_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['thread', 'path'], name='blog_comment_tree_idx'),
+        ),
+        migrations.RunPython(fill_tree_positions, migrations.RunPython.noop),
+    ]
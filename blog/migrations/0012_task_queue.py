@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_comment_threads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('args', models.JSONField(blank=True, default=list)),
+                ('dedup_key', models.CharField(blank=True, max_length=200, null=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=64)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['run_at', 'id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['run_at', 'id'], name='blog_task_queued_idx'), models.Index(condition=models.Q(('status', 'running')), fields=['locked_by'], name='blog_task_running_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'queued')), fields=('dedup_key',), name='blog_task_dedup_uniq'),
+        ),
+    ]
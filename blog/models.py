@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.urls import reverse
@@ -42,6 +43,9 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+# Condition of the partial indexes on Post
+PUBLISHED = Q(status='published')
+
 class Post(models.Model):
     """
     Main blog post model - stores all article data
@@ -63,6 +67,8 @@ class Post(models.Model):
     content = models.TextField()
     excerpt = models.TextField(max_length=300, blank=True, help_text="Short description for preview")
     featured_image = models.ImageField(upload_to='blog/', blank=True, null=True)
+    # Resized WebP/JPEG copies of featured_image with their sizes (blog/images.py)
+    featured_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     # Status and timestamps
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
@@ -74,8 +80,43 @@ class Post(models.Model):
     views = models.IntegerField(default=0)
     likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
     
+    # Denormalized counters - kept up to date by blog.signals,
+    # recompute with: python manage.py reconcile_counters
+    like_count = models.IntegerField(default=0, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    
+    # Precomputed from content on save, so list pages never load the body
+    word_count = models.IntegerField(default=0, editable=False)
+    auto_excerpt = models.TextField(blank=True, editable=False)
+    
+    # Time-decayed popularity, refreshed by: python manage.py update_trending
+    trending_score = models.FloatField(default=0, editable=False)
+    
+    # Columns a post card needs - use with .only() on list pages
+    CARD_FIELDS = (
+        'title', 'slug', 'excerpt', 'auto_excerpt', 'featured_image', 'featured_image_renditions', 'status',
+        'created_at', 'published_at', 'views', 'like_count', 'comment_count',
+        'word_count', 'trending_score', 'author__username', 'category__name', 'category__slug',
+    )
+    AUTO_EXCERPT_WORDS = 50
+    
     class Meta:
-        ordering = ['-published_at', '-created_at']
+        # id breaks ties, so listings have a stable order an index can serve
+        ordering = ['-published_at', '-id']
+        indexes = [
+            # Partial indexes - only published posts are listed publicly
+            # (backends without partial indexes, e.g. MySQL, skip these)
+            # Home listing - keyset pages seek straight to (published_at, id)
+            models.Index(fields=['-published_at', '-id'], condition=PUBLISHED, name='blog_post_listing_idx'),
+            # Category pages and the related posts fallback
+            models.Index(fields=['category', '-published_at', '-id'], condition=PUBLISHED, name='blog_post_category_idx'),
+            # Explore page "popular" ranking
+            models.Index(fields=['-like_count', '-published_at'], condition=PUBLISHED, name='blog_post_popular_idx'),
+            # Explore page "trending" ranking
+            models.Index(fields=['-trending_score', '-published_at'], condition=PUBLISHED, name='blog_post_trending_idx'),
+            # My Posts and profile pages - drafts included
+            models.Index(fields=['author', '-created_at', '-id'], name='blog_post_author_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -84,20 +125,32 @@ class Post(models.Model):
         # Automatically set published date when post goes live
         if self.status == 'published' and not self.published_at:
             self.published_at = timezone.now()
+        
+        # Refresh card fields whenever the content is loaded (not deferred)
+        if 'content' not in self.get_deferred_fields():
+            self.update_card_fields()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'word_count', 'auto_excerpt'}
         super().save(*args, **kwargs)
     
+    def update_card_fields(self):
+        # Word count and a short plain excerpt for post cards
+        words = self.content.split()
+        self.word_count = len(words)
+        self.auto_excerpt = ' '.join(words[:self.AUTO_EXCERPT_WORDS])
+    
     def get_absolute_url(self):
         return reverse('blog:post_detail', kwargs={'slug': self.slug})
     
     def reading_time(self):
         # Calculate reading time based on average reading speed (200 words/min)
-        word_count = len(self.content.split())
-        minutes = math.ceil(word_count / 200)
+        minutes = math.ceil(self.word_count / 200)
         return minutes if minutes > 0 else 1
     
     def total_likes(self):
-        # Count how many users liked this post
-        return self.likes.count()
+        # Number of users who liked this post (stored counter, no query)
+        return self.like_count
     
     def is_liked_by(self, user):
         # Check if a specific user has liked this post
@@ -109,6 +162,8 @@ class Comment(models.Model):
     """
     Comments allow readers to engage with posts
     Each comment is linked to a post and a user
+    Replies form threads: a materialized path orders a whole thread
+    depth-first, so one indexed range read loads it (see blog/comments.py)
     """
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
@@ -116,11 +171,132 @@ class Comment(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
-    # For nested replies (optional - can be added later)
+    # Nested replies - the comment this one answers
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     
+    # Tree position, set on the first save: the top-level comment of the thread,
+    # the ids from it down to this comment ("0000000012/0000000015/") and the nesting level
+    thread = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+',
+        db_index=False,  # blog_comment_tree_idx starts with it
+    )
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    
+    # Replies to a comment this deep become replies to its parent instead
+    MAX_DEPTH = 5
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A post's comments, newest first
+            models.Index(fields=['post', '-created_at'], name='blog_comment_post_idx'),
+            # A post's threads, newest first - keyset pages of top-level comments
+            models.Index(
+                fields=['post', '-created_at', '-id'], condition=Q(parent__isnull=True), name='blog_comment_roots_idx'
+            ),
+            # Whole threads in reply order, and "load more replies" ranges
+            models.Index(fields=['thread', 'path'], name='blog_comment_tree_idx'),
+        ]
     
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
+    
+    def save(self, *args, **kwargs):
+        if self.path:
+            return super().save(*args, **kwargs)
+        # New comment - its path needs its id, so it is written right after the insert
+        if self.parent_id:
+            parent = self.parent
+            if parent.depth >= self.MAX_DEPTH:
+                # Too deep to indent further - answer the parent's parent
+                parent = parent.parent
+                self.parent = parent
+            self.thread_id = parent.thread_id
+            self.depth = parent.depth + 1
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            self.path = f'{self.parent.path if self.parent_id else ""}{self.pk:010d}/'
+            if not self.parent_id:
+                self.thread_id = self.pk
+            Comment.objects.filter(pk=self.pk).update(path=self.path, thread_id=self.thread_id)
+
+class PostViewDaily(models.Model):
+    """
+    Views per post per day - written when buffered views are flushed
+    Used to rank trending posts by recent activity instead of lifetime views
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_views')
+    date = models.DateField(db_index=True)
+    views = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'date'], name='blog_postviewdaily_post_date_uniq'),
+        ]
+    
+    def __str__(self):
+        return f'{self.post_id} on {self.date}: {self.views} views'
+
+class RelatedPost(models.Model):
+    """
+    Precomputed "related posts" for a post, best match first
+    Filled by blog.related from tag overlap, category and recency
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_from')
+    score = models.FloatField()
+    
+    class Meta:
+        ordering = ['post', '-score']
+        indexes = [
+            # A post's best matches, read in score order
+            models.Index(fields=['post', '-score'], name='blog_relatedpost_score_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='blog_relatedpost_post_related_uniq'),
+        ]
+    
+    def __str__(self):
+        return f'{self.post_id} -> {self.related_id} ({self.score:.2f})'
+
+# Condition of the dedup constraint and claim index on Task
+QUEUED = Q(status='queued')
+
+class Task(models.Model):
+    """
+    Background job waiting for the worker (blog.tasks)
+    Finished tasks are deleted, failed ones stay for the admin to retry
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    # While a task with this key is queued, enqueueing another one is a no-op
+    dedup_key = models.CharField(max_length=200, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Set while running - a task whose worker died is picked up again after locked_until
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            # The worker's next due tasks
+            models.Index(fields=['run_at', 'id'], condition=QUEUED, name='blog_task_queued_idx'),
+            models.Index(fields=['locked_by'], condition=Q(status='running'), name='blog_task_running_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedup_key'], condition=QUEUED, name='blog_task_dedup_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
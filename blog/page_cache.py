@@ -0,0 +1,341 @@
+"""
+Full-page and fragment caching
+
+Logged-out GET requests to the public pages are answered from the
+cache, keyed by path and query string. Every cached page carries
+tags naming what it shows ('post:12', 'category:3', 'posts', ...),
+and blog.signals bumps a tag's version when that data changes. A
+page is only served while all of its tag versions still match, so a
+change refreshes exactly the pages that show it.
+
+With read replicas a miss may render from a replica that hasn't caught up
+with a change yet. Versions start with the time of the change, and a page
+read from a replica is not stored while any of its tags changed within
+BLOG_REPLICA_PIN_SECONDS - it would put the old data back under the new
+versions.
+
+Logged-in users get fragment caching instead: the expensive shared parts
+of a page ({% cache %} blocks for the post body, comments, related posts
+and category chips) are keyed by fragment_versions() built from the same
+tags, and only the small per-user parts are rendered per request.
+
+Async views use the a*() variants (aget, afragment_versions...), which go
+through the async cache API instead of blocking the event loop.
+
+Tags used by the views:
+    post:<id>       a post shown on the page (detail, card or related)
+    comments:<id>   the comment list on a post's detail page
+    posts           the home listing of published posts
+    search          search results
+    category:<id>   a category listing
+    categories      anything showing category names
+    explore         trending/popular rankings
+"""
+import hashlib
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.cache import get_conditional_response
+
+from .routers import replica_lag
+
+
+def new_version():
+    # When the tag changed, then a random part
+    return f'{time.time():.3f}:{uuid.uuid4().hex}'
+
+
+def changed_within(versions, seconds):
+    # Whether any of the tag versions is younger than seconds
+    if not seconds:
+        return False
+    since = time.time() - seconds
+    for version in versions.values():
+        changed, _, _ = version.rpartition(':')
+        if changed and float(changed) > since:
+            return True
+    return False
+
+
+class PageCache:
+
+    key_prefix = 'blog:page:'
+    tag_prefix = 'blog:pagetag:'
+
+    def __init__(self, alias='default', timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+        self.stats = Counter()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def page_key(self, request):
+        query = '&'.join(sorted(request.GET.urlencode().split('&')))
+        digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+        return f'{self.key_prefix}{digest}'
+
+    def tag_key(self, tag):
+        return f'{self.tag_prefix}{tag}'
+
+    def current_versions(self, tags):
+        # Missing versions get a fresh token, so an evicted tag can never match
+        keys = {self.tag_key(tag): tag for tag in tags}
+        found = self.cache.get_many(list(keys))
+        versions = {}
+        for key, tag in keys.items():
+            if key not in found:
+                self.cache.add(key, new_version(), timeout=None)
+                found[key] = self.cache.get(key)
+            versions[tag] = found[key]
+        return versions
+
+    async def acurrent_versions(self, tags):
+        # current_versions() with the async cache API, for async views
+        keys = {self.tag_key(tag): tag for tag in tags}
+        found = await self.cache.aget_many(list(keys))
+        versions = {}
+        for key, tag in keys.items():
+            if key not in found:
+                await self.cache.aadd(key, new_version(), timeout=None)
+                found[key] = await self.cache.aget(key)
+            versions[tag] = found[key]
+        return versions
+
+    def is_current(self, entry, found):
+        # found: the entry's tag keys read from the cache
+        return all(found.get(self.tag_key(tag)) == version for tag, version in entry['versions'].items())
+
+    def get(self, request):
+        """
+        Returns the cached entry for this request, or None when it is
+        missing or any of its tags changed since it was stored
+        """
+        entry = self.cache.get(self.page_key(request))
+        if entry is None:
+            return None
+        found = self.cache.get_many([self.tag_key(tag) for tag in entry['versions']])
+        return entry if self.is_current(entry, found) else None
+
+    async def aget(self, request):
+        # get() with the async cache API
+        entry = await self.cache.aget(self.page_key(request))
+        if entry is None:
+            return None
+        found = await self.cache.aget_many([self.tag_key(tag) for tag in entry['versions']])
+        return entry if self.is_current(entry, found) else None
+
+    def set(self, request, response, tags, meta=None, lag=0):
+        """
+        Stores the page under the current versions of its tags
+        lag: how far behind the primary its reads may be - the page is
+        skipped when a tag changed within that many seconds
+        """
+        versions = self.current_versions(set(tags))
+        if not changed_within(versions, lag):
+            entry = {'response': response, 'versions': versions, 'meta': meta or {}}
+            self.cache.set(self.page_key(request), entry, self.timeout)
+
+    async def aset(self, request, response, tags, meta=None, lag=0):
+        # set() with the async cache API
+        versions = await self.acurrent_versions(set(tags))
+        if not changed_within(versions, lag):
+            entry = {'response': response, 'versions': versions, 'meta': meta or {}}
+            await self.cache.aset(self.page_key(request), entry, self.timeout)
+
+    def invalidate(self, *tags):
+        # New version tokens - pages stored with the old ones stop matching
+        self.cache.set_many({self.tag_key(tag): new_version() for tag in tags}, timeout=None)
+
+    def record(self, view_name, outcome):
+        # outcome: 'hit', 'miss' or 'bypass'
+        self.stats[(view_name, outcome)] += 1
+
+    def summary(self):
+        # {view_name: {'hit': n, 'miss': n, 'bypass': n}}
+        views = {}
+        for (view_name, outcome), count in self.stats.items():
+            views.setdefault(view_name, {'hit': 0, 'miss': 0, 'bypass': 0})[outcome] = count
+        return views
+
+    def hit_ratio(self):
+        hits = sum(count for (_, outcome), count in self.stats.items() if outcome == 'hit')
+        misses = sum(count for (_, outcome), count in self.stats.items() if outcome == 'miss')
+        return hits / (hits + misses) if hits + misses else 0.0
+
+
+_page_cache = None
+
+
+def get_page_cache():
+    """
+    Returns the page cache for this process
+    Configured with BLOG_PAGE_CACHE (cache alias) and BLOG_PAGE_CACHE_TIMEOUT
+    """
+    global _page_cache
+    if _page_cache is None:
+        _page_cache = PageCache(
+            alias=getattr(settings, 'BLOG_PAGE_CACHE', 'default'),
+            timeout=getattr(settings, 'BLOG_PAGE_CACHE_TIMEOUT', 300),
+        )
+    return _page_cache
+
+
+def invalidate_pages(*tags):
+    # Also used for fragments, so this runs even with the page cache disabled
+    if tags:
+        get_page_cache().invalidate(*tags)
+
+
+def fragment_versions(**groups):
+    """
+    Version strings for {% cache %} fragments, from page cache tags
+    fragment_versions(body=['post:1']) -> {'body': '3f2a...'}
+    All tags are read with a single cache round trip
+    """
+    versions = get_page_cache().current_versions({tag for tags in groups.values() for tag in tags})
+    return hash_versions(groups, versions)
+
+
+async def afragment_versions(**groups):
+    # fragment_versions() with the async cache API, for async views
+    versions = await get_page_cache().acurrent_versions({tag for tags in groups.values() for tag in tags})
+    return hash_versions(groups, versions)
+
+
+def hash_versions(groups, versions):
+    return {
+        name: hashlib.md5('|'.join(versions[tag] for tag in sorted(tags)).encode()).hexdigest()[:16]
+        for name, tags in groups.items()
+    }
+
+
+def get_fragment_cache():
+    return caches['template_fragments' if 'template_fragments' in settings.CACHES else 'default']
+
+
+def cached_fragments(**fragments):
+    """
+    Names of the {% cache %} fragments that are stored, with one cache round trip
+    cached_fragments(post_body=[post.id, versions['body']]) -> {'post_body'}
+    Each name takes the vary_on values the template passes after it
+    """
+    keys = {make_template_fragment_key(name, vary_on): name for name, vary_on in fragments.items()}
+    return {keys[key] for key in get_fragment_cache().get_many(list(keys))}
+
+
+async def acached_fragments(**fragments):
+    # cached_fragments() with the async cache API, for async views
+    keys = {make_template_fragment_key(name, vary_on): name for name, vary_on in fragments.items()}
+    return {keys[key] for key in await get_fragment_cache().aget_many(list(keys))}
+
+
+def tag_page(request, *tags, **meta):
+    """
+    Called by a cached view to say what the page shows
+    meta is stored with the page and passed to on_hit for cached responses
+    """
+    request.page_cache_tags = getattr(request, 'page_cache_tags', set()) | set(tags)
+    request.page_cache_meta = {**getattr(request, 'page_cache_meta', {}), **meta}
+
+
+def post_tags(posts):
+    return [f'post:{post.id}' for post in posts]
+
+
+def is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # Pages with flash messages (e.g. "Logged out successfully") are one-offs
+    return not len(messages.get_messages(request))
+
+
+def cache_anonymous_page(on_hit=None):
+    """
+    View decorator - serves logged-out GETs from the page cache
+    on_hit(request, meta) runs for cached responses, e.g. to count a view
+    Works on sync and async views (on_hit then runs in a thread)
+    """
+    def decorator(view):
+        view_name = view.__name__
+
+        def enabled():
+            return getattr(settings, 'BLOG_PAGE_CACHE_ENABLED', True)
+
+        def cached_response(request, entry):
+            response = entry['response']
+            response['X-Page-Cache'] = 'HIT'
+            if response.has_header('ETag'):
+                # A revalidation of the stored page (see blog.conditional) - 304 without queries
+                response = get_conditional_response(request, etag=response['ETag'], response=response)
+            return response
+
+        def storable(request, response):
+            # Only store plain successful pages that don't set cookies
+            sets_cookie = response.cookies or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+            return getattr(request, 'page_cache_tags', None) and response.status_code == 200 and not sets_cookie
+
+        def store(request, response):
+            if storable(request, response):
+                get_page_cache().set(
+                    request, response, request.page_cache_tags, getattr(request, 'page_cache_meta', {}),
+                    lag=replica_lag(request),
+                )
+            response['X-Page-Cache'] = 'MISS'
+            return response
+
+        async def astore(request, response):
+            if storable(request, response):
+                await get_page_cache().aset(
+                    request, response, request.page_cache_tags, getattr(request, 'page_cache_meta', {}),
+                    lag=replica_lag(request),
+                )
+            response['X-Page-Cache'] = 'MISS'
+            return response
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                page_cache = get_page_cache()
+                # The session user and flash messages may need queries - checked in a thread
+                if not enabled() or not await sync_to_async(is_cacheable_request)(request):
+                    page_cache.record(view_name, 'bypass')
+                    return await view(request, *args, **kwargs)
+
+                entry = await page_cache.aget(request)
+                if entry is not None:
+                    page_cache.record(view_name, 'hit')
+                    if on_hit:
+                        await sync_to_async(on_hit)(request, entry['meta'])
+                    return cached_response(request, entry)
+
+                page_cache.record(view_name, 'miss')
+                return await astore(request, await view(request, *args, **kwargs))
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            page_cache = get_page_cache()
+            if not enabled() or not is_cacheable_request(request):
+                page_cache.record(view_name, 'bypass')
+                return view(request, *args, **kwargs)
+
+            entry = page_cache.get(request)
+            if entry is not None:
+                page_cache.record(view_name, 'hit')
+                if on_hit:
+                    on_hit(request, entry['meta'])
+                return cached_response(request, entry)
+
+            page_cache.record(view_name, 'miss')
+            return store(request, view(request, *args, **kwargs))
+        return wrapper
+    return decorator
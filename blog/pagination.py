@@ -0,0 +1,168 @@
+"""
+Keyset (cursor) pagination
+
+Paginator runs a COUNT(*) and then OFFSET n, and both get slower the
+deeper a reader goes. CursorPaginator instead remembers the sort key of
+the last row on the page and asks for the rows after it:
+
+    WHERE (published_at, id) < (last_published_at, last_id)
+    ORDER BY published_at DESC, id DESC LIMIT per_page + 1
+
+which is one index range scan whatever the page. Cursors are opaque
+strings for ?cursor=, and the total count is optional and cached.
+"""
+import base64
+import json
+from functools import cached_property
+
+from django.core.cache import caches
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorPage:
+    """
+    One page of rows. Iterates like a Paginator page; links use
+    next_cursor/previous_cursor instead of page numbers
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Pages through queryset in ordering order, e.g. ('-published_at', '-id')
+    The last field must be unique and none of them may be NULL
+    queryset may also be a .values() queryset that includes the ordering fields
+    count_key caches the total count under that key (None = count each time)
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-published_at', '-id'),
+                 count_key=None, count_timeout=300, cache_alias='default'):
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.count_key = count_key
+        self.count_timeout = count_timeout
+        self.cache_alias = cache_alias
+
+    @cached_property
+    def count(self):
+        # Only for display ("1,234 articles") - paging never needs it
+        if self.count_key is None:
+            return self.queryset.count()
+        return caches[self.cache_alias].get_or_set(self.count_key, self.queryset.count, self.count_timeout)
+
+    def encode_cursor(self, obj, direction):
+        # direction: 'n' (rows after obj) or 'p' (rows before obj)
+        model_meta = self.queryset.model._meta
+        if isinstance(obj, dict):
+            # A row from .values() - it has to include the ordering fields
+            obj = self.queryset.model(**{model_meta.get_field(name).attname: obj[name] for name in self.fields})
+        values = [model_meta.get_field(name).value_to_string(obj) for name in self.fields]
+        data = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(data)
+            if direction not in ('n', 'p') or len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            model_meta = self.queryset.model._meta
+            return direction, [model_meta.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except InvalidCursor:
+            raise
+        except Exception as e:
+            raise InvalidCursor(cursor) from e
+
+    def after(self, values, reverse=False):
+        """
+        Rows strictly after values in the page order (before, if reverse):
+        (a > x) OR (a = x AND b > y) OR ... with each field's direction
+        """
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            field = name.lstrip('-')
+            descending = name.startswith('-') != reverse
+            step = Q(**{f'{field}__{"lt" if descending else "gt"}': values[i]})
+            for previous, value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{previous: value})
+            condition |= step
+        # Redundant range on the first field - lets the database seek the index
+        # instead of filtering every row through the OR
+        first_descending = self.ordering[0].startswith('-') != reverse
+        return Q(**{f'{self.fields[0]}__{"lte" if first_descending else "gte"}': values[0]}) & condition
+
+    def window(self, cursor=None):
+        """
+        (queryset, direction) for the page at cursor: the rows after it
+        in page order, or for direction 'p' the rows before it, nearest
+        first. Take per_page + 1 rows and pass them to page_from_rows()
+        Raises InvalidCursor for tokens that don't decode
+        """
+        if not cursor:
+            return self.queryset, None
+        direction, values = self.decode_cursor(cursor)
+        if direction == 'n':
+            return self.queryset.filter(self.after(values)), direction
+        # Walk backwards with the ordering flipped
+        reversed_ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+        return self.queryset.filter(self.after(values, reverse=True)).order_by(*reversed_ordering), direction
+
+    def page_from_rows(self, rows, direction):
+        # rows: up to per_page + 1 rows of window(cursor)
+        has_more, rows = len(rows) > self.per_page, rows[:self.per_page]
+        if direction == 'p':
+            # Restore page order
+            return self.make_page(rows[::-1], has_next=True, has_previous=has_more)
+        return self.make_page(rows, has_next=has_more, has_previous=direction == 'n')
+
+    def page(self, cursor=None):
+        """
+        Returns the CursorPage for cursor (the first page for None)
+        Raises InvalidCursor for tokens that don't decode
+        """
+        queryset, direction = self.window(cursor)
+        return self.page_from_rows(list(queryset[:self.per_page + 1]), direction)
+
+    def get_page(self, cursor=None):
+        # Like Paginator.get_page - a bad cursor falls back to the first page
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+    def make_page(self, rows, has_next, has_previous):
+        return CursorPage(
+            rows,
+            self,
+            next_cursor=self.encode_cursor(rows[-1], 'n') if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'p') if rows and has_previous else None,
+        )
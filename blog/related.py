@@ -0,0 +1,230 @@
+"""
+Related posts engine
+
+Scores candidate posts against each post by tag overlap (Jaccard),
+a shared category and recency, then stores the top matches in the
+RelatedPost table so post_detail reads them with one query.
+
+Candidates come from inverted indexes (tag -> recent posts,
+category -> recent posts), so a post is only compared with posts
+it could plausibly be related to, never with the whole archive.
+
+Edits refresh the lists in a background task (blog.tasks), batched so a
+burst of edits is scored together.
+"""
+import heapq
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Post, RelatedPost
+from .page_cache import invalidate_pages
+from .tasks import enqueue, task
+
+# Per post: category id, publish date and the set of tag ids
+Features = namedtuple('Features', ['category_id', 'published_at', 'tags'])
+
+TAG_WEIGHT = 1.0        # full Jaccard overlap
+CATEGORY_WEIGHT = 0.3   # same category
+RECENCY_WEIGHT = 0.2    # boost for fresh posts, fades over RECENCY_DAYS
+RECENCY_DAYS = 90
+CANDIDATES_PER_TAG = 100
+CANDIDATES_PER_CATEGORY = 50
+
+
+class RelatedPostsEngine:
+
+    def __init__(self, top_k=None, now=None):
+        self.top_k = top_k or getattr(settings, 'BLOG_RELATED_POSTS_STORED', 6)
+        self.now = now or timezone.now()
+
+    def load(self, post_ids=None):
+        """
+        Returns {post_id: Features} for published posts
+        (all of them, or only post_ids)
+        """
+        posts = Post.objects.filter(status='published')
+        if post_ids is not None:
+            posts = posts.filter(id__in=post_ids)
+        features = {
+            post_id: Features(category_id, published_at or self.now, set())
+            for post_id, category_id, published_at
+            in posts.values_list('id', 'category_id', 'published_at').iterator(chunk_size=5000)
+        }
+        through = Post.tags.through.objects.all()
+        if post_ids is not None:
+            through = through.filter(post_id__in=post_ids)
+        for post_id, tag_id in through.values_list('post_id', 'tag_id').iterator(chunk_size=5000):
+            if post_id in features:
+                features[post_id].tags.add(tag_id)
+        return features
+
+    def build_index(self, features):
+        """
+        Returns the lookups used for scoring:
+        tag -> newest posts with it, category -> newest posts in it,
+        and each post's recency boost (computed once, not per pair)
+        """
+        newest_first = sorted(features, key=lambda pid: features[pid].published_at, reverse=True)
+        by_tag = defaultdict(list)
+        by_category = defaultdict(list)
+        recency = {}
+        for post_id in newest_first:
+            item = features[post_id]
+            for tag_id in item.tags:
+                if len(by_tag[tag_id]) < CANDIDATES_PER_TAG:
+                    by_tag[tag_id].append(post_id)
+            if item.category_id and len(by_category[item.category_id]) < CANDIDATES_PER_CATEGORY:
+                by_category[item.category_id].append(post_id)
+            age_days = max((self.now - item.published_at).days, 0)
+            recency[post_id] = RECENCY_WEIGHT / (1 + age_days / RECENCY_DAYS)
+        return by_tag, by_category, recency
+
+    def top_related(self, post_id, features, index):
+        """
+        Returns [(score, related_id), ...] best first for one post
+        score = Jaccard tag overlap + same category bonus + recency boost
+        """
+        by_tag, by_category, recency = index
+        item = features[post_id]
+        # Shared tag counts for every candidate in one pass over the postings
+        overlaps = Counter()
+        for tag_id in item.tags:
+            overlaps.update(by_tag.get(tag_id, ()))
+        for candidate in by_category.get(item.category_id, ()):
+            overlaps.setdefault(candidate, 0)
+        overlaps.pop(post_id, None)
+
+        size, category_id = len(item.tags), item.category_id
+        scored = []
+        for candidate, overlap in overlaps.items():
+            other = features[candidate]
+            score = TAG_WEIGHT * overlap / (size + len(other.tags) - overlap) if overlap else 0.0
+            if category_id and other.category_id == category_id:
+                score += CATEGORY_WEIGHT
+            if score:
+                scored.append((score + recency[candidate], candidate))
+        return heapq.nlargest(self.top_k, scored)
+
+    def save(self, results, replace=True):
+        # results: {post_id: [(score, related_id), ...]}
+        with transaction.atomic():
+            if replace:
+                RelatedPost.objects.filter(post_id__in=list(results)).delete()
+            # Plain executemany - building model instances dominates on large rebuilds
+            table = RelatedPost._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {table} (post_id, related_id, score) VALUES (%s, %s, %s)',
+                    [
+                        (post_id, related_id, score)
+                        for post_id, pairs in results.items()
+                        for score, related_id in pairs
+                    ],
+                )
+
+    def rebuild(self):
+        """
+        Recomputes related posts for every published post, returns the count
+        """
+        features = self.load()
+        index = self.build_index(features)
+        results = {post_id: self.top_related(post_id, features, index) for post_id in features}
+        with transaction.atomic():
+            RelatedPost.objects.all().delete()
+            self.save(results, replace=False)
+        return len(results)
+
+    def candidates_for(self, post_ids):
+        """
+        Same candidates the full index would give post_ids:
+        the newest posts of each of their tags and categories
+        """
+        through = Post.tags.through.objects
+        published = Post.objects.filter(status='published')
+        tag_ids = set(through.filter(post_id__in=post_ids).values_list('tag_id', flat=True))
+        category_ids = set(
+            published.filter(id__in=post_ids).exclude(category=None).values_list('category_id', flat=True)
+        )
+        candidates = set(post_ids)
+        for tag_id in tag_ids:
+            candidates.update(
+                through.filter(tag_id=tag_id, post__status='published')
+                .order_by('-post__published_at')
+                .values_list('post_id', flat=True)[:CANDIDATES_PER_TAG]
+            )
+        for category_id in category_ids:
+            candidates.update(
+                published.filter(category_id=category_id)
+                .order_by('-published_at')
+                .values_list('id', flat=True)[:CANDIDATES_PER_CATEGORY]
+            )
+        return candidates
+
+    def compute(self, post_ids):
+        # Top matches for post_ids, loading only their candidates
+        features = self.load(self.candidates_for(post_ids))
+        index = self.build_index(features)
+        return {
+            post_id: self.top_related(post_id, features, index) if post_id in features else []
+            for post_id in post_ids
+        }
+
+    def stored(self, post_ids):
+        # {post_id: [related_id, ...]} in display order, as top_related ranks them
+        lists = defaultdict(list)
+        rows = (
+            RelatedPost.objects.filter(post_id__in=list(post_ids))
+            .order_by('post_id', '-score', '-related_id')
+            .values_list('post_id', 'related_id')
+        )
+        for post_id, related_id in rows:
+            lists[post_id].append(related_id)
+        return lists
+
+    def refresh(self, post_ids):
+        """
+        Recomputes related posts after post_ids changed (tags, category,
+        status). Posts that listed them before, and their new neighbours,
+        are refreshed too so both directions stay current.
+        Only lists that changed are written. Returns the ids of those posts.
+        """
+        post_ids = set(post_ids)
+        if not post_ids:
+            return set()
+        results = self.compute(post_ids)
+
+        others = set(
+            RelatedPost.objects.filter(related_id__in=post_ids).values_list('post_id', flat=True)
+        )
+        for pairs in results.values():
+            others.update(related_id for _, related_id in pairs)
+        others -= post_ids
+        if others:
+            results.update(self.compute(others))
+        # Recency moves every score a little - a list changes when its posts or their order do
+        stored = self.stored(results)
+        changed = {
+            post_id: pairs for post_id, pairs in results.items()
+            if [related_id for _, related_id in pairs] != stored.get(post_id, [])
+        }
+        if changed:
+            self.save(changed)
+        return set(changed)
+
+
+@task('blog.refresh_related', batch_size=50)
+def refresh_related(batch):
+    # Post ids of several edits, refreshed together - then the pages whose list changed
+    refreshed = RelatedPostsEngine().refresh({post_id for (post_ids,) in batch for post_id in post_ids})
+    invalidate_pages(*[f'post:{post_id}' for post_id in refreshed])
+
+
+def schedule_refresh(post_ids):
+    # After post_ids' tags, category or status changed (or a post they list was deleted)
+    post_ids = sorted(post_ids)
+    if post_ids:
+        dedup_key = f'related:{post_ids[0]}' if len(post_ids) == 1 else None
+        enqueue('blog.refresh_related', post_ids, dedup_key=dedup_key)
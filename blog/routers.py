@@ -0,0 +1,136 @@
+"""
+Primary/replica database routing
+
+Writes always go to the primary ('default'). Reads go there too, except
+inside views wrapped with @replica_reads (the read-only public pages),
+which read from a random replica when DATABASES lists any.
+
+Read-your-writes: a request that changes data (POST, PUT, DELETE, ...)
+sets a short-lived cookie, and while it is present the user's reads stay
+on the primary, so their new post, comment or like shows up even if the
+replicas lag behind. Within one request, reads after a write stay on
+the primary as well.
+
+Both flags are context variables, so they also hold in async views and in
+the threads their queries run in (sync_to_async copies the context).
+
+The page cache doesn't store a page read from a replica while one of its
+tags changed within BLOG_REPLICA_PIN_SECONDS (see blog/page_cache.py).
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+PIN_COOKIE = 'bloghub_primary'
+
+# True inside @replica_reads views
+_replica_allowed = ContextVar('blog_replica_allowed', default=False)
+# True once the request wrote to the primary (or the user did recently)
+_wrote = ContextVar('blog_wrote', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in connections.settings if alias != 'default']
+
+
+def replica_lag(request):
+    """
+    Seconds the public pages' reads may be behind the primary for this
+    request - 0 without replicas or while the user is pinned to the primary
+    """
+    if not replica_aliases() or PIN_COOKIE in request.COOKIES:
+        return 0
+    return getattr(settings, 'BLOG_REPLICA_PIN_SECONDS', 10)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _replica_allowed.get() and not _wrote.get():
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        return db == 'default'
+
+
+def replica_reads(view):
+    """
+    View decorator - the view's queries may read from a replica
+    Writes, and reads after a write, still use the primary
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _replica_allowed.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica_allowed.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_allowed.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_allowed.reset(token)
+    return wrapper
+
+
+class ReadYourWritesMiddleware:
+    """
+    Keeps a user's reads on the primary for BLOG_REPLICA_PIN_SECONDS
+    after a request of theirs changed data
+    Runs natively under both WSGI and ASGI
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _wrote.set(PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _wrote.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = _wrote.set(PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _wrote.reset(token)
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and replica_aliases():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'BLOG_REPLICA_PIN_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
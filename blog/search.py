@@ -0,0 +1,248 @@
+"""
+Full-text search for blog posts
+
+Posts are copied into a side index (SQLite FTS5 or a PostgreSQL tsvector
+table) so the home page search never scans the whole post table.
+The index only holds published posts and is kept in sync by blog.signals.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+# Words made of letters/numbers - everything else is dropped from queries
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BaseSearchBackend:
+    """
+    Common interface for all search backends
+    search() returns post ids ordered by relevance (best match first),
+    at most limit of them - the newest matches, ranked
+    """
+
+    def search(self, query, limit=None):
+        raise NotImplementedError
+
+    def index_posts(self, posts):
+        # Add or refresh the given posts in the index
+        pass
+
+    def remove_posts(self, post_ids):
+        # Drop the given post ids from the index
+        pass
+
+    def rebuild(self):
+        # Recreate the whole index from the post table, returns row count
+        return 0
+
+    def get_limit(self, limit):
+        return limit or getattr(settings, 'BLOG_SEARCH_MAX_RESULTS', 1000)
+
+    @staticmethod
+    def tokenize(query):
+        return TOKEN_RE.findall(query.lower())
+
+    @staticmethod
+    def document_for(post):
+        # Returns (title, content, tags) text for a single post
+        tags = ' '.join(tag.name for tag in post.tags.all())
+        return post.title, post.content, tags
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Fallback backend - plain icontains lookups, no index needed
+    Used for database engines without full-text support
+    """
+
+    def search(self, query, limit=None):
+        from .models import Post
+
+        return list(
+            Post.objects.filter(status='published')
+            .filter(
+                Q(title__icontains=query) |
+                Q(content__icontains=query) |
+                Q(tags__name__icontains=query)
+            )
+            .distinct()
+            .values_list('id', flat=True)[:self.get_limit(limit)]
+        )
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 backend ranked with bm25()
+    Title matches weigh the most, then tags, then body text
+    """
+    table = 'blog_post_fts'
+    weights = (10.0, 1.0, 5.0)  # title, content, tags
+
+    def build_match(self, query):
+        # Every word must appear, each as a prefix match: "djan"* "tip"*
+        return ' '.join(f'"{token}"*' for token in self.tokenize(query))
+
+    def search(self, query, limit=None):
+        match = self.build_match(query)
+        if not match:
+            return []
+        limit = self.get_limit(limit)
+        # bm25() is computed for every row it orders, and a common word
+        # matches nearly every post. Walking the matches by rowid is cheap,
+        # so only the newest `limit` of them are ranked
+        sql = (
+            f'SELECT rowid FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid >= COALESCE(('
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+            f'ORDER BY rowid DESC LIMIT 1 OFFSET %s'
+            f'), 0) '
+            f'ORDER BY bm25({self.table}, %s, %s, %s) LIMIT %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, match, limit - 1, *self.weights, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_posts(self, posts):
+        published = [post for post in posts if post.status == 'published']
+        self.remove_posts([post.id for post in posts])
+        if not published:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)',
+                [(post.id, *self.document_for(post)) for post in published],
+            )
+
+    def remove_posts(self, post_ids):
+        if not post_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s',
+                [(post_id,) for post_id in post_ids],
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f"""
+                INSERT INTO {self.table} (rowid, title, content, tags)
+                SELECT p.id, p.title, p.content, COALESCE((
+                    SELECT group_concat(t.name, ' ')
+                    FROM blog_tag t
+                    JOIN blog_post_tags pt ON pt.tag_id = t.id
+                    WHERE pt.post_id = p.id
+                ), '')
+                FROM blog_post p
+                WHERE p.status = 'published'
+                """
+            )
+            # Merge index segments so queries touch as few b-trees as possible
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL backend - tsvector column with a GIN index
+    Ranked with ts_rank_cd, using the same A/B/C weights as SQLite
+    """
+    table = 'blog_post_search'
+    config = 'english'
+
+    document_sql = (
+        "setweight(to_tsvector(%(config)s, %(title)s), 'A') || "
+        "setweight(to_tsvector(%(config)s, %(tags)s), 'B') || "
+        "setweight(to_tsvector(%(config)s, %(content)s), 'C')"
+    )
+
+    def search(self, query, limit=None):
+        if not self.tokenize(query):
+            return []
+        # Like SQLite, rank only the newest `limit` matches
+        sql = (
+            f'SELECT post_id FROM ('
+            f'SELECT post_id, document, query FROM {self.table}, websearch_to_tsquery(%s, %s) query '
+            f'WHERE document @@ query ORDER BY post_id DESC LIMIT %s'
+            f') newest ORDER BY ts_rank_cd(document, query) DESC'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.config, query, self.get_limit(limit)])
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_posts(self, posts):
+        published = [post for post in posts if post.status == 'published']
+        self.remove_posts([post.id for post in posts if post.status != 'published'])
+        if not published:
+            return
+        sql = (
+            f'INSERT INTO {self.table} (post_id, document) '
+            f'VALUES (%(post_id)s, {self.document_sql}) '
+            f'ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document'
+        )
+        rows = []
+        for post in published:
+            title, content, tags = self.document_for(post)
+            rows.append({
+                'post_id': post.id, 'config': self.config,
+                'title': title, 'content': content, 'tags': tags,
+            })
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def remove_posts(self, post_ids):
+        if not post_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE post_id = ANY(%s)', [list(post_ids)])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+            cursor.execute(
+                f"""
+                INSERT INTO {self.table} (post_id, document)
+                SELECT p.id,
+                    setweight(to_tsvector(%s, p.title), 'A') ||
+                    setweight(to_tsvector(%s, COALESCE(string_agg(t.name, ' '), '')), 'B') ||
+                    setweight(to_tsvector(%s, p.content), 'C')
+                FROM blog_post p
+                LEFT JOIN blog_post_tags pt ON pt.post_id = p.id
+                LEFT JOIN blog_tag t ON t.id = pt.tag_id
+                WHERE p.status = 'published'
+                GROUP BY p.id
+                """,
+                [self.config] * 3,
+            )
+            return cursor.rowcount
+
+
+# Default backend for each database vendor
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Returns the configured search backend (created once per process)
+    settings.BLOG_SEARCH_BACKEND can point at a backend class by dotted path,
+    otherwise one is picked from the database vendor
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'BLOG_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connection.vendor, DatabaseSearchBackend)
+        _backend = backend_class()
+    return _backend
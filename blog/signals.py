@@ -0,0 +1,264 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .author_stats import add_author_stats, forget_author_stats
+from .counters import add_comments, recount_likes
+from .images import schedule_renditions
+from .models import Post, Tag, Category, Comment, RelatedPost
+from .page_cache import invalidate_pages
+from .related import schedule_refresh
+from .search import get_search_backend
+from .tasks import enqueue, task
+
+
+# Keep the search index in sync with posts and their tags
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index_posts([instance])
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_search_backend().remove_posts([instance.id])
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def reindex_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Changed from the tag side (tag.posts.add(...)) - pk_set holds post ids
+        posts = Post.objects.filter(id__in=tagged_post_ids(instance, pk_set)).prefetch_related('tags')
+    else:
+        posts = [instance]
+    get_search_backend().index_posts(list(posts))
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def remember_cleared_tag_posts(sender, instance, action, reverse, **kwargs):
+    # tag.posts.clear() - pk_set is None and the rows are gone by post_clear
+    if action == 'pre_clear' and reverse:
+        instance._tagged_post_ids = list(instance.posts.values_list('id', flat=True))
+
+def tagged_post_ids(tag, pk_set):
+    # Posts changed from the tag side: pk_set, or the ones collected in pre_clear
+    return pk_set or getattr(tag, '_tagged_post_ids', [])
+
+@task('blog.reindex_posts', batch_size=20)
+def reindex_posts(batch):
+    # Posts whose indexed text changed with a tag, then the pages showing them
+    post_ids = {post_id for (ids,) in batch for post_id in ids}
+    get_search_backend().index_posts(list(Post.objects.filter(id__in=post_ids).prefetch_related('tags')))
+    invalidate_pages('search', *[f'post:{post_id}' for post_id in post_ids])
+
+@receiver(post_save, sender=Tag)
+def reindex_tag_posts(sender, instance, created, raw=False, **kwargs):
+    # A renamed tag changes the indexed text of every post using it
+    if not created and not raw:
+        enqueue('blog.reindex_posts', list(instance.posts.values_list('id', flat=True)))
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_posts(sender, instance, **kwargs):
+    # The join rows are gone by post_delete, so collect the posts first
+    instance._indexed_post_ids = list(instance.posts.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Tag)
+def reindex_deleted_tag_posts(sender, instance, **kwargs):
+    post_ids = getattr(instance, '_indexed_post_ids', [])
+    if post_ids:
+        enqueue('blog.reindex_posts', post_ids)
+        schedule_refresh(post_ids)
+
+
+# Keep precomputed related posts current when tags, category or status change
+# (refreshed by a background task, which also refreshes the posts' pages)
+@receiver(post_save, sender=Post)
+def refresh_related_posts(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # Title, content or view count edits don't move the related posts
+    old = getattr(instance, '_old_state', None)
+    if created or not old or (old['status'], old['category_id']) != (instance.status, instance.category_id):
+        schedule_refresh([instance.id])
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_related_for_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    schedule_refresh(tagged_post_ids(instance, pk_set) if reverse else [instance.id])
+
+@receiver(pre_delete, sender=Post)
+def remember_related_from(sender, instance, **kwargs):
+    # Posts listing this one lose an entry when it is deleted
+    instance._related_from_ids = list(
+        RelatedPost.objects.filter(related=instance).values_list('post_id', flat=True)
+    )
+
+@receiver(post_delete, sender=Post)
+def refresh_related_after_delete(sender, instance, **kwargs):
+    schedule_refresh(getattr(instance, '_related_from_ids', []))
+
+
+# Resize new featured images in the background
+@receiver(post_save, sender=Post)
+def process_featured_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_renditions(instance, 'featured_image')
+
+
+# Keep Post.like_count and Post.comment_count in sync
+@receiver(m2m_changed, sender=Post.likes.through)
+def update_like_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recount_likes([instance.pk])
+    elif action == 'post_clear':
+        # user.liked_posts.clear() - pk_set is None, posts were collected in pre_clear
+        recount_likes(getattr(instance, '_liked_post_ids', []))
+    else:
+        recount_likes(pk_set)
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def remember_cleared_likes(sender, instance, action, reverse, **kwargs):
+    if action != 'pre_clear':
+        return
+    if reverse:
+        instance._liked_post_ids = list(instance.liked_posts.values_list('id', flat=True))
+    else:
+        # post.likes.clear() - the author stats of the likers change too
+        instance._liker_ids = list(instance.likes.values_list('id', flat=True))
+
+@receiver(pre_delete, sender=User)
+def remember_user_likes(sender, instance, **kwargs):
+    # Deleting a user removes their likes without any m2m_changed signal
+    instance._liked_post_ids = list(instance.liked_posts.values_list('id', flat=True))
+
+@receiver(post_delete, sender=User)
+def recount_deleted_user_likes(sender, instance, **kwargs):
+    recount_likes(getattr(instance, '_liked_post_ids', []))
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_comments(instance.post_id, 1)
+
+def deleted_with_post(origin):
+    # A comment deleted because its post is (origin: what delete() was called on) -
+    # the post's row and pages go too, so its comments skip their own updates
+    return isinstance(origin, Post) or (isinstance(origin, QuerySet) and origin.model is Post)
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, origin=None, **kwargs):
+    if not deleted_with_post(origin):
+        add_comments(instance.post_id, -1)
+
+
+# Keep the cached author stats (blog.author_stats) current - counted up
+# where the change is known exactly, dropped and recomputed otherwise
+@receiver(post_save, sender=Post)
+def count_author_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        add_author_stats('posts', {instance.author_id: 1})
+        return
+    old = getattr(instance, '_old_state', None)
+    if old and old['author_id'] != instance.author_id:
+        forget_author_stats([old['author_id'], instance.author_id])
+
+@receiver(pre_delete, sender=Post)
+def remember_post_likers(sender, instance, **kwargs):
+    # Likes go with the post without any m2m_changed signal
+    instance._liker_ids = list(instance.likes.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Post)
+def forget_deleted_post_stats(sender, instance, **kwargs):
+    forget_author_stats([instance.author_id, *getattr(instance, '_liker_ids', [])])
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def update_like_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        user_ids = {instance.pk: len(pk_set or ())}
+        post_ids = pk_set or getattr(instance, '_liked_post_ids', [])
+        authors = Counter(Post.objects.filter(id__in=post_ids).values_list('author_id', flat=True))
+    else:
+        user_ids = dict.fromkeys(pk_set or getattr(instance, '_liker_ids', []), 1)
+        authors = {instance.author_id: len(user_ids)}
+    if action == 'post_add':
+        # pk_set only holds the likes actually added
+        add_author_stats('liked_posts', user_ids)
+        add_author_stats('likes_received', authors)
+    else:
+        # pk_set of a remove also holds likes that didn't exist
+        forget_author_stats([*user_ids, *authors])
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user_stats(sender, instance, **kwargs):
+    # Authors of the posts the user liked lose those likes
+    post_ids = getattr(instance, '_liked_post_ids', [])
+    author_ids = Post.objects.filter(id__in=post_ids).values_list('author_id', flat=True) if post_ids else []
+    forget_author_stats([instance.pk, *author_ids])
+
+
+# Page cache invalidation - bump the tags of the pages showing what changed
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    # Status, category and author before the save, to know which listings change
+    instance._old_state = None
+    if instance.pk and not raw:
+        instance._old_state = (
+            Post.objects.filter(pk=instance.pk).values('status', 'category_id', 'author_id').first()
+        )
+
+@receiver(post_save, sender=Post)
+def invalidate_post_pages(sender, instance, raw=False, **kwargs):
+    old = getattr(instance, '_old_state', None) or {'status': 'draft', 'category_id': None}
+    was_published = old['status'] == 'published'
+    is_published = instance.status == 'published'
+    if not (was_published or is_published):
+        return  # drafts aren't on any public page
+    tags = {f'post:{instance.id}', 'search', f'category:{instance.category_id}'}
+    if was_published != is_published:
+        # Post appeared on or disappeared from the listings
+        tags |= {'posts', 'explore'}
+    if old['category_id'] != instance.category_id:
+        tags.add(f'category:{old["category_id"]}')
+    invalidate_pages(*tags)
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_pages(sender, instance, **kwargs):
+    if instance.status == 'published':
+        invalidate_pages(f'post:{instance.id}', 'posts', 'search', 'explore', f'category:{instance.category_id}')
+
+@receiver(m2m_changed, sender=Post.likes.through)
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_m2m_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        post_ids = [instance.id]
+    elif sender is Post.tags.through:
+        post_ids = tagged_post_ids(instance, pk_set)
+    else:
+        post_ids = pk_set or getattr(instance, '_liked_post_ids', [])
+    tags = [f'post:{post_id}' for post_id in post_ids]
+    if sender is Post.tags.through:
+        tags.append('search')
+    invalidate_pages(*tags)
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, raw=False, origin=None, **kwargs):
+    if not raw and not deleted_with_post(origin):
+        invalidate_pages(f'comments:{instance.post_id}')
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_pages('categories', f'category:{instance.id}')
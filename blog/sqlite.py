@@ -0,0 +1,41 @@
+"""
+SQLite production profile
+
+With several gunicorn workers on one SQLite file, the default rollback
+journal makes readers and the writer block each other, and a
+transaction that reads before it writes fails with "database is locked"
+as soon as another worker holds the write lock. busy_timeout can't help
+there: SQLite refuses the lock upgrade rather than risk a deadlock.
+
+configure_connection() runs for every new connection (connection_created):
+WAL lets readers run next to the single writer, busy_timeout makes
+writers queue instead of failing, and atomic() blocks start with
+BEGIN IMMEDIATE so they take the write lock up front and wait their turn.
+(Django 5.1+ can do the last part with OPTIONS['transaction_mode'].)
+"""
+from django.conf import settings
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',     # safe with WAL - a power cut can only lose the last commits
+    'busy_timeout': 5000,        # ms to wait for the write lock
+    'mmap_size': 268435456,      # 256 MB of the file read through the page cache
+    'cache_size': -20000,        # 20 MB per connection
+    'temp_store': 'memory',
+}
+
+
+def begin_immediate(connection):
+    # Replaces DatabaseWrapper._start_transaction_under_autocommit ("BEGIN")
+    connection.cursor().execute('BEGIN IMMEDIATE')
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not getattr(settings, 'BLOG_SQLITE_PRODUCTION', False):
+        return
+    pragmas = getattr(settings, 'BLOG_SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    if getattr(settings, 'BLOG_SQLITE_IMMEDIATE_TRANSACTIONS', True):
+        connection._start_transaction_under_autocommit = lambda: begin_immediate(connection)
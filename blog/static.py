@@ -0,0 +1,42 @@
+"""
+WhiteNoise for both WSGI and ASGI
+
+whitenoise's middleware is sync-only. At the top of the middleware stack
+that would make Django run every request under ASGI through a thread and
+back (async_to_sync), async views included. This subclass runs natively in
+both modes: under ASGI, pages pass straight through, and only requests
+under STATIC_URL look up and open their file in a thread.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if request.path_info.startswith(self.static_prefix):
+            response = await sync_to_async(self.static_response, thread_sensitive=False)(request)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def static_response(self, request):
+        # The file response for a static file URL, or None
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        return self.serve(static_file, request) if static_file is not None else None
@@ -0,0 +1,208 @@
+"""
+Background tasks
+
+Work the reader doesn't need to wait for (writing buffered view counts,
+image renditions, refreshing related posts, the profile save chain) is
+queued in the Task table and done by a worker:
+
+    python manage.py run_tasks --threads 4
+
+Tasks are plain functions registered with @task next to the code they
+run. enqueue() inserts a row inside the caller's transaction, so a
+rolled back request leaves no task behind and the worker only sees the
+task once the data it reads is committed. A task type can:
+
+- retry: a failed task runs again after retry_delay seconds, doubled
+  after each attempt, until it has failed `retries` more times
+- dedup: while a task with the same dedup_key is queued, enqueueing
+  another does nothing (for "refresh X" jobs that read the current state)
+- batch: the worker hands up to batch_size queued tasks of the same name
+  to one call, as a list of their args
+
+With BLOG_TASKS_EAGER (on under DEBUG: runserver, tests, scripts) tasks
+run in the calling thread as soon as the transaction commits, and their
+errors propagate.
+"""
+import json
+import logging
+import threading
+import traceback
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+TaskType = namedtuple('TaskType', ['name', 'func', 'retries', 'retry_delay', 'batch_size'])
+
+# Task name -> TaskType, filled by @task as the apps load
+registry = {}
+
+
+def task(name, retries=3, retry_delay=10, batch_size=1):
+    """
+    Registers the decorated function as the task called name
+    With batch_size > 1 it is called with a list of args lists, one per task
+    """
+    def decorator(func):
+        registry[name] = TaskType(name, func, retries, retry_delay, batch_size)
+        return func
+    return decorator
+
+
+def enqueue(name, *args, dedup_key=None, delay=0):
+    """
+    Queues a call of the task name - args must be JSON-serializable
+    """
+    task_type = registry[name]
+    if getattr(settings, 'BLOG_TASKS_EAGER', False):
+        # Through JSON like a queued task, so eager runs see the same args (string dict keys...)
+        args = json.loads(json.dumps(args))
+        transaction.on_commit(lambda: call(task_type, [args]))
+        return
+    row = Task(name=name, args=list(args), dedup_key=dedup_key, run_at=timezone.now() + timedelta(seconds=delay))
+    if dedup_key is None:
+        row.save()
+    elif connection.features.supports_partial_indexes:
+        # The unique constraint on queued dedup keys drops the duplicate
+        Task.objects.bulk_create([row], ignore_conflicts=True)
+    elif not Task.objects.filter(dedup_key=dedup_key, status='queued').exists():
+        row.save()
+
+
+def call(task_type, batch):
+    # batch: the args of each task, one call for a batch task, one each otherwise
+    if task_type.batch_size > 1:
+        task_type.func(batch)
+    else:
+        for args in batch:
+            task_type.func(*args)
+
+
+def requeue(row, **fields):
+    # Back in the queue - unless a task with the same dedup key was queued meanwhile, which replaces it
+    try:
+        with transaction.atomic():
+            Task.objects.filter(id=row.id).update(status='queued', locked_by='', locked_until=None, **fields)
+    except IntegrityError:
+        Task.objects.filter(id=row.id).delete()
+
+
+def retry_or_fail(row, error):
+    """
+    Schedules the next attempt of a failed task, with exponential
+    backoff, or marks it failed once its retries are used up
+    """
+    task_type = registry.get(row.name)
+    if task_type is not None and row.attempts <= task_type.retries:
+        delay = task_type.retry_delay * 2 ** (row.attempts - 1)
+        requeue(row, run_at=timezone.now() + timedelta(seconds=delay), last_error=error)
+    else:
+        Task.objects.filter(id=row.id).update(status='failed', locked_by='', locked_until=None, last_error=error)
+
+
+def retry_failed(queryset):
+    # Gives failed tasks a fresh set of attempts (admin action)
+    for row in queryset.filter(status='failed'):
+        requeue(row, attempts=0, run_at=timezone.now())
+
+
+class Worker:
+    """
+    Claims due tasks and runs them, one batch at a time
+    Any number of workers (threads or processes) can share the table
+    """
+
+    def __init__(self, poll_interval=None, lease=None):
+        self.poll_interval = poll_interval or getattr(settings, 'BLOG_TASKS_POLL_INTERVAL', 1)
+        self.lease = timedelta(seconds=lease or getattr(settings, 'BLOG_TASKS_LEASE', 300))
+        self.stopping = threading.Event()
+
+    def run(self):
+        # Until stop() - sleeps poll_interval whenever the queue is empty
+        while not self.stopping.is_set():
+            try:
+                ran = self.run_once()
+            except Exception:
+                logger.exception('Task worker could not claim tasks')
+                ran = 0
+            if not ran:
+                self.stopping.wait(self.poll_interval)
+
+    def run_pending(self):
+        # Runs due tasks until none are left, returns how many ran (run_tasks --once, scripts)
+        total = 0
+        while True:
+            ran = self.run_once()
+            if not ran:
+                return total
+            total += ran
+
+    def stop(self):
+        self.stopping.set()
+
+    def run_once(self):
+        """
+        Claims and runs the next batch of due tasks, returns its size (0 if none)
+        """
+        # Like a request: drop an expired or broken connection before and after
+        close_old_connections()
+        try:
+            self.release_expired()
+            batch = self.claim()
+            if batch:
+                self.execute(batch)
+            return len(batch)
+        finally:
+            close_old_connections()
+
+    def release_expired(self):
+        # Tasks whose worker died while running them (read first - most polls find none)
+        for row in Task.objects.filter(status='running', locked_until__lt=timezone.now()).only('id', 'name', 'attempts'):
+            retry_or_fail(row, 'The worker running this task stopped')
+
+    def claim(self):
+        """
+        Locks the oldest due task and up to batch_size - 1 more of the same
+        name for this worker, returns them
+        """
+        now = timezone.now()
+        due = Task.objects.filter(status='queued', run_at__lte=now)
+        # A plain read first, so idle polls don't take the write lock
+        name = due.values_list('name', flat=True).first()
+        if name is None:
+            return []
+        task_type = registry.get(name)
+        batch_size = task_type.batch_size if task_type else 1
+        token = uuid.uuid4().hex
+        with transaction.atomic():
+            ids = list(
+                due.filter(name=name).select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size]
+            )
+            # status='queued' again - without row locks (SQLite) another worker may have won the row
+            Task.objects.filter(id__in=ids, status='queued').update(
+                status='running', locked_by=token, locked_until=now + self.lease, attempts=F('attempts') + 1,
+            )
+        return list(Task.objects.filter(status='running', locked_by=token))
+
+    def execute(self, batch):
+        name = batch[0].name
+        try:
+            task_type = registry.get(name)
+            if task_type is None:
+                raise LookupError(f'No task is registered as {name!r}')
+            call(task_type, [row.args for row in batch])
+        except Exception:
+            logger.exception('Task %s failed (%d in the batch)', name, len(batch))
+            error = traceback.format_exc()
+            for row in batch:
+                retry_or_fail(row, error)
+        else:
+            Task.objects.filter(id__in=[row.id for row in batch]).delete()
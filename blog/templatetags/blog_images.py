@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, renditions, sizes='100vw', alt='', loading='lazy', **attrs):
+    """
+    <picture> for an image field and its renditions (see blog/images.py)
+    {% responsive_image post.featured_image post.featured_image_renditions sizes="(max-width: 768px) 100vw, 33vw" alt=post.title %}
+    Falls back to the original upload until the renditions are built
+    Use loading="eager" for images above the fold
+    """
+    if not image:
+        return ''
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    sizes_list = (renditions or {}).get('sizes')
+    if not sizes_list or renditions.get('source') != image.name:
+        return format_html('<img src="{}" alt="{}" loading="{}" decoding="async"{}>', image.url, alt, loading, extra)
+
+    storage = image.storage
+    webp = ', '.join(f'{storage.url(entry["webp"])} {entry["width"]}w' for entry in sizes_list)
+    jpeg = ', '.join(f'{storage.url(entry["jpeg"])} {entry["width"]}w' for entry in sizes_list)
+    # Fallback src: the middle size, for browsers without srcset
+    default = sizes_list[len(sizes_list) // 2]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async"{}>'
+        '</picture>',
+        webp, sizes, storage.url(default['jpeg']), jpeg, sizes,
+        renditions['width'], renditions['height'], alt, loading, extra,
+    )
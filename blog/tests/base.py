@@ -0,0 +1,228 @@
+"""
+Shared setup for the blog tests, and the sample data and query plan
+helpers the benchmarks use too
+"""
+import random
+import re
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.text import slugify
+
+from blog.counters import get_view_counter
+from blog.models import Category, Post, Tag
+from blog.routers import replica_aliases
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+# Plain static file names - the pages render without a collectstatic manifest.
+# Tests run in one process, so local memory stands in for the shared caches
+test_settings = override_settings(
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    CACHES={
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'tests-{alias}'}
+        for alias in ('default', 'pages', 'template_fragments', 'counters')
+    },
+)
+
+
+class BlogTestMixin:
+    """
+    Starts every test with empty caches and keeps buffered views from
+    being flushed in the middle of it
+    """
+
+    def setUp(self):
+        super().setUp()
+        clear_caches()
+        # Reads only go to the replicas the test may query (see test_routers.py)
+        replicas = [alias for alias in replica_aliases() if alias in self.databases]
+        patcher = mock.patch('blog.routers.replica_aliases', return_value=replicas)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        counter = get_view_counter()
+        for name in ('flush_threshold', 'flush_interval'):
+            patcher = mock.patch.object(counter, name, float('inf'))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Drop the test's buffered views, the atexit flush would write them to the real database
+        self.addCleanup(counter.buffer.drain)
+
+
+@test_settings
+class BlogTestCase(BlogTestMixin, TestCase):
+    pass
+
+
+@test_settings
+class BlogTransactionTestCase(BlogTestMixin, TransactionTestCase):
+    pass
+
+
+# Sample data - the benchmarks load it too (benchmarks/common.py)
+WORDS = (
+    'python django web server database query index cache search travel food '
+    'health fitness startup marketing design music movie sport football cricket '
+    'science history culture photography recipe coffee mountain ocean city '
+    'learning teaching career finance budget garden family weekend adventure'
+).split()
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_posts(count, words=200, users=50, seed=42, batch_size=2000, prefix='bench'):
+    """
+    Bulk-creates published posts with authors, categories and tags
+    Signals are not fired, so derived data has to be rebuilt afterwards
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        authors = User.objects.bulk_create([
+            User(username=f'{prefix}_user_{i}') for i in range(users)
+        ])
+        categories = Category.objects.bulk_create([
+            Category(name=f'{prefix} {name}', slug=slugify(f'{prefix} {name}')) for name in WORDS[:8]
+        ])
+        tags = Tag.objects.bulk_create([
+            Tag(name=f'{prefix} {name}', slug=slugify(f'{prefix} {name}')) for name in WORDS
+        ])
+        now = timezone.now()
+        through = Post.tags.through
+        for start in range(0, count, batch_size):
+            posts = [
+                Post(
+                    title=random_text(rng, 6).title(),
+                    slug=f'{prefix}-post-{i}',
+                    author=rng.choice(authors),
+                    category=rng.choice(categories),
+                    content=random_text(rng, words),
+                    status='published',
+                    published_at=now - timezone.timedelta(minutes=i),
+                    views=rng.randint(0, 5000),
+                )
+                for i in range(start, min(start + batch_size, count))
+            ]
+            for post in posts:
+                post.update_card_fields()
+            Post.objects.bulk_create(posts)
+            through.objects.bulk_create([
+                through(post_id=post.id, tag_id=tag.id)
+                for post in posts
+                for tag in rng.sample(tags, 3)
+            ])
+
+
+def page_urls():
+    # The pages the query checks request, for the first post and category
+    post = Post.objects.order_by('id').first()
+    category = Category.objects.order_by('id').first()
+    return {
+        'home': '/',
+        'search': '/?search=python',
+        'explore': '/explore/',
+        'post_detail': post.get_absolute_url(),
+        'category': category.get_absolute_url(),
+        'my_posts': '/my-posts/',
+        'profile': '/accounts/profile/',
+    }
+
+
+# Query plan checks, run by test_query_plans.py and benchmarks/query_plans.py
+# Pages checked: url name -> logged in
+PAGES = {
+    'home': False,
+    'home_page_2': False,
+    'search': False,
+    'explore': False,
+    'post_detail': True,
+    'category': False,
+    'category_page_2': False,
+    'my_posts': True,
+    'profile': True,
+}
+
+# Lookup tables with a few dozen rows - scanning them is fine, and the
+# wrapper Django puts around a filtered window function (rows already read)
+SCAN_OK = {'blog_category', 'qualify'}
+# Plans on these tables may sort: categories, a post's few tags by name,
+# and search results ordered by relevance rank
+SORT_OK = {'blog_category', 'blog_tag', 'blog_post_fts', 'blog_post_search'}
+# Queries that read every row by design
+EXPECTED = [
+    # Home article count - cached until a post is published or removed
+    re.compile(r'^SELECT COUNT\(\*\) AS "__count" FROM "blog_post" WHERE "blog_post"\."status" = \S+$'),
+]
+
+
+def plan_lines(sql):
+    # One line per plan step, with the planner pushed off scans and sorts on PostgreSQL
+    # so a remaining Seq Scan or Sort means no usable index exists
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0].strip() for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def problems(lines, windowed=False):
+    """
+    Plan steps that read a whole table or sort rows outside an index
+    (except the tables in SCAN_OK and SORT_OK)
+    windowed: the query numbers rows with a window function, which sorts
+    the rows it reads - allowed as long as they are read through an index
+    """
+    if connection.vendor == 'postgresql':
+        scan = re.compile(r'Seq Scan on (\w+)')
+        sort = re.compile(r'^(->\s+)?(Incremental )?Sort\b')
+        tables = set(re.findall(r' on (\w+)', '\n'.join(lines)))
+    else:
+        scan = re.compile(r'^SCAN (\w+)\b(?! USING)(?!.*VIRTUAL TABLE)')
+        sort = re.compile(r'USE TEMP B-TREE')
+        tables = set(re.findall(r'^(?:SCAN|SEARCH) (\w+)', '\n'.join(lines), re.M))
+    found = []
+    for line in lines:
+        match = scan.search(line)
+        if match and match.group(1) not in SCAN_OK:
+            found.append(line)
+        elif sort.search(line) and not tables & SORT_OK and not windowed:
+            found.append(line)
+    return found
+
+
+def page_queries(reader):
+    urls = page_urls()
+    home_page = Client().get(urls['home']).context['posts']
+    category_page = Client().get(urls['category']).context['posts']
+    urls['home_page_2'] = f'{urls["home"]}?cursor={home_page.next_cursor}'
+    urls['category_page_2'] = f'{urls["category"]}?cursor={category_page.next_cursor}'
+
+    queries = {}
+    for name, logged_in in PAGES.items():
+        client = Client()
+        if logged_in:
+            client.force_login(reader)
+        for cache in caches.all():
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            # A stale ETag, so the revalidation lookups (blog/conditional.py) run too
+            response = client.get(urls[name], HTTP_IF_NONE_MATCH='W/"stale"')
+        assert response.status_code == 200, f'{urls[name]} returned {response.status_code}'
+        queries[name] = [query['sql'] for query in captured if query['sql'].lstrip().upper().startswith('SELECT')]
+    return queries
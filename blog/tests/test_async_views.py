@@ -0,0 +1,78 @@
+"""
+Async views (blog/async_views.py) - the page and fragment caches are read
+and written without blocking the event loop
+"""
+import asyncio
+import importlib
+from functools import wraps
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import User
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import override_settings
+from django.urls import clear_url_caches
+
+from blog.related import RelatedPostsEngine
+
+from .base import BlogTransactionTestCase, make_posts, page_urls
+
+
+def route_views():
+    # blog.urls picks the sync or async views when it is imported
+    import blog.urls
+    import blog_project.urls
+    importlib.reload(blog.urls)
+    importlib.reload(blog_project.urls)
+    clear_url_caches()
+
+
+class AsyncViewCacheTests(BlogTransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        make_posts(6, users=2, seed=19, prefix='async')
+        RelatedPostsEngine().rebuild()
+        self.reader = User.objects.create_user('async_reader')
+        self.urls = page_urls()
+        settings = override_settings(BLOG_ASYNC_VIEWS=True)
+        settings.enable()
+        self.addCleanup(route_views)
+        self.addCleanup(settings.disable)
+        route_views()
+
+        # Sync cache calls made on the event loop's thread
+        self.blocking = []
+        for name in ('get', 'set', 'add'):
+            patcher = mock.patch.object(LocMemCache, name, self.watch(getattr(LocMemCache, name)))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def watch(self, method):
+        @wraps(method)
+        def watched(cache, *args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                self.blocking.append(method.__name__)
+            return method(cache, *args, **kwargs)
+        return watched
+
+    async def test_anonymous_pages(self):
+        for name in ('home', 'explore', 'category', 'post_detail'):
+            for outcome in ('MISS', 'HIT'):
+                response = await self.async_client.get(self.urls[name])
+                self.assertEqual(response.status_code, 200, name)
+                self.assertEqual(response['X-Page-Cache'], outcome, name)
+        self.assertEqual(self.blocking, [])
+
+    async def test_logged_in_pages(self):
+        # Django 4.2 has no aforce_login()
+        await sync_to_async(self.async_client.force_login)(self.reader)
+        for name in ('home', 'explore', 'post_detail', 'post_detail'):
+            response = await self.async_client.get(self.urls[name])
+            self.assertEqual(response.status_code, 200, name)
+        self.assertEqual(self.blocking, [])
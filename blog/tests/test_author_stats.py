@@ -0,0 +1,83 @@
+"""
+Author stats cache (blog/author_stats.py) - changes made while a read
+computes the numbers are never lost or overwritten
+"""
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from blog import author_stats
+from blog.author_stats import compute_author_stats, get_author_stats
+from blog.models import Post
+
+from .base import BlogTestCase
+
+
+class AuthorStatsCacheTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('stats_author')
+        cls.reader = User.objects.create_user('stats_reader')
+        cls.post = cls.write_post(0)
+
+    @classmethod
+    def write_post(cls, number):
+        return Post.objects.create(
+            title=f'Stats {number}', slug=f'stats-{number}', author=cls.author, content='Counted', status='published',
+        )
+
+    def assertExact(self, user):
+        self.assertEqual(get_author_stats(user.pk), compute_author_stats(user.pk))
+
+    def during_read(self, change):
+        # Runs change after the read's query, before it stores the numbers
+        def racing(user_id):
+            stats = compute_author_stats(user_id)
+            change()
+            return stats
+        return mock.patch.object(author_stats, 'compute_author_stats', racing)
+
+    def test_cached_numbers_are_counted_up(self):
+        get_author_stats(self.author.pk)
+        self.write_post(1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_author_stats(self.author.pk).posts, 2)
+        self.assertExact(self.author)
+
+    def test_change_during_a_cold_read(self):
+        with self.during_read(lambda: self.write_post(1)):
+            self.assertEqual(get_author_stats(self.author.pk).posts, 1)
+        self.assertExact(self.author)
+
+    def test_change_during_a_read_of_an_evicted_number(self):
+        get_author_stats(self.author.pk)
+        generation = author_stats.current_generation(author_stats.get_cache(), self.author.pk)
+        author_stats.get_cache().delete(author_stats.stats_key(self.author.pk, generation, 'posts'))
+        # The like counts up the number still cached, the read mustn't put the old one back
+        with self.during_read(lambda: self.post.likes.add(self.reader)):
+            get_author_stats(self.author.pk)
+        self.assertExact(self.author)
+
+    def test_forget_during_a_read(self):
+        with self.during_read(lambda: self.post.likes.remove(self.reader) or self.post.likes.add(self.reader)):
+            get_author_stats(self.author.pk)
+        self.assertExact(self.author)
+        self.assertExact(self.reader)
+
+    def test_file_cache_recomputes_instead_of_counting_up(self):
+        # FileBasedCache.incr() reads and writes back - not safe across workers
+        location = tempfile.mkdtemp(prefix='bloghub-stats-')
+        self.addCleanup(shutil.rmtree, location, True)
+        files = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        with override_settings(CACHES={**settings.CACHES, 'counters': files}):
+            get_author_stats(self.author.pk)
+            with mock.patch.object(author_stats.get_cache(), 'incr') as incr:
+                self.write_post(1)
+            incr.assert_not_called()
+            with self.assertNumQueries(1):
+                self.assertEqual(get_author_stats(self.author.pk).posts, 2)
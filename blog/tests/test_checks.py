@@ -0,0 +1,60 @@
+"""
+System checks (blog/checks.py)
+"""
+from django.test import SimpleTestCase, override_settings
+
+from blog.checks import check_shared_caches
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+FILES = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/bloghub-tests'}
+REDIS = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}
+SHARED = {'default': LOCMEM, 'pages': FILES, 'template_fragments': FILES}
+
+
+@override_settings(
+    BLOG_PAGE_CACHE='pages', BLOG_AUTHOR_STATS_CACHE='counters', BLOG_VIEW_CACHE='counters',
+    BLOG_VIEW_BUFFER='memory', BLOG_TASKS_EAGER=False,
+)
+class SharedCacheCheckTests(SimpleTestCase):
+
+    def errors(self):
+        return [error.id for error in check_shared_caches(None)]
+
+    @override_settings(CACHES={'default': LOCMEM, 'pages': LOCMEM, 'template_fragments': FILES, 'counters': REDIS})
+    def test_local_page_cache_with_queued_tasks(self):
+        self.assertEqual(self.errors(), ['blog.E001'])
+
+    @override_settings(CACHES={'default': LOCMEM, 'pages': FILES, 'template_fragments': LOCMEM, 'counters': REDIS})
+    def test_local_fragment_cache_with_queued_tasks(self):
+        self.assertEqual(self.errors(), ['blog.E002'])
+
+    @override_settings(CACHES={'default': LOCMEM, 'pages': FILES, 'counters': REDIS})
+    def test_fragments_fall_back_to_the_default_cache(self):
+        self.assertEqual(self.errors(), ['blog.E002'])
+
+    @override_settings(
+        CACHES={'default': LOCMEM, 'pages': LOCMEM, 'template_fragments': LOCMEM, 'counters': LOCMEM},
+        BLOG_TASKS_EAGER=True, BLOG_VIEW_BUFFER='cache',
+    )
+    def test_local_caches_with_eager_tasks(self):
+        self.assertEqual(self.errors(), [])
+
+    @override_settings(CACHES={'default': LOCMEM, 'pages': FILES, 'template_fragments': FILES, 'counters': REDIS})
+    def test_shared_caches(self):
+        self.assertEqual(self.errors(), [])
+
+    @override_settings(CACHES={**SHARED, 'counters': LOCMEM})
+    def test_local_author_stats_cache(self):
+        self.assertEqual(self.errors(), ['blog.E003'])
+
+    @override_settings(CACHES={**SHARED, 'counters': REDIS}, BLOG_VIEW_BUFFER='cache', BLOG_VIEW_CACHE='default')
+    def test_local_view_buffer_cache(self):
+        self.assertEqual(self.errors(), ['blog.E004'])
+
+    @override_settings(CACHES={**SHARED, 'counters': FILES}, BLOG_VIEW_BUFFER='cache')
+    def test_view_buffer_cache_without_atomic_incr(self):
+        self.assertEqual(self.errors(), ['blog.W001'])
+
+    @override_settings(CACHES={**SHARED, 'counters': REDIS}, BLOG_VIEW_BUFFER='cache')
+    def test_shared_view_buffer_cache(self):
+        self.assertEqual(self.errors(), [])
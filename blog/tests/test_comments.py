@@ -0,0 +1,116 @@
+"""
+Comment threads (blog/comments.py) - tree positions filled for rows that
+skipped Comment.save(), however deep their replies were nested, and
+comments deleted with their post
+"""
+import importlib
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+
+from blog.comments import fill_tree_positions
+from blog.models import Comment, Post
+
+from .base import BlogTestCase
+
+threads_migration = importlib.import_module('blog.migrations.0011_comment_threads')
+
+
+class TreePositionTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('thread_author')
+        cls.post = Post.objects.create(
+            title='Threads', slug='threads', author=cls.author, content='Discussed', status='published',
+        )
+
+    def deep_chain(self, length):
+        # Each comment answers the previous one, written without save() like an import
+        parent = None
+        for _ in range(length):
+            (parent,) = Comment.objects.bulk_create([
+                Comment(post=self.post, author=self.author, content='Reply', parent=parent),
+            ])
+        return Comment.objects.filter(post=self.post).order_by('id')
+
+    def assertCapped(self, comments):
+        comments = list(comments)
+        path_length = Comment._meta.get_field('path').max_length
+        for comment in comments:
+            self.assertLessEqual(comment.depth, Comment.MAX_DEPTH)
+            self.assertLessEqual(len(comment.path), path_length)
+            self.assertEqual(len(comment.path), (comment.depth + 1) * 11)
+            self.assertEqual(comment.thread_id, comments[0].id)
+            if comment.parent_id:
+                parent = Comment.objects.get(id=comment.parent_id)
+                self.assertEqual(comment.path, f'{parent.path}{comment.id:010d}/')
+                self.assertEqual(comment.depth, parent.depth + 1)
+        # The thread still reads in reply order
+        self.assertEqual(
+            [comment.id for comment in sorted(comments, key=lambda comment: comment.path)],
+            [comment.id for comment in comments],
+        )
+
+    def test_deep_thread_is_capped(self):
+        comments = self.deep_chain(40)
+        self.assertEqual(fill_tree_positions(), 40)
+        self.assertCapped(comments)
+
+    def test_migration_backfill_is_capped(self):
+        comments = self.deep_chain(40)
+        threads_migration.fill_tree_positions(apps, None)
+        self.assertCapped(comments)
+
+    def test_reply_to_a_deep_comment_answers_its_parent(self):
+        comments = list(self.deep_chain(Comment.MAX_DEPTH + 1))
+        fill_tree_positions()
+        deepest = Comment.objects.get(id=comments[-1].id)
+        self.assertEqual(deepest.depth, Comment.MAX_DEPTH)
+        reply = Comment.objects.create(post=self.post, author=self.author, content='Reply', parent=deepest)
+        self.assertEqual(reply.parent_id, deepest.parent_id)
+        self.assertEqual(reply.depth, Comment.MAX_DEPTH)
+
+
+class CommentDeleteTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('delete_author')
+        cls.post = Post.objects.create(
+            title='Doomed', slug='doomed', author=cls.author, content='Gone soon', status='published',
+        )
+        root = Comment.objects.create(post=cls.post, author=cls.author, content='First')
+        for _ in range(3):
+            Comment.objects.create(post=cls.post, author=cls.author, content='Reply', parent=root)
+
+    def patch_signals(self):
+        counts = mock.patch('blog.signals.add_comments')
+        pages = mock.patch('blog.signals.invalidate_pages')
+        self.addCleanup(counts.stop)
+        self.addCleanup(pages.stop)
+        return counts.start(), pages.start()
+
+    def invalidated(self, pages):
+        return {tag for call in pages.call_args_list for tag in call.args}
+
+    def test_deleted_post_skips_its_comments(self):
+        post_id = self.post.id
+        counts, pages = self.patch_signals()
+        self.post.delete()
+        counts.assert_not_called()
+        self.assertNotIn(f'comments:{post_id}', self.invalidated(pages))
+        # The post's own tags still refresh its pages
+        self.assertIn(f'post:{post_id}', self.invalidated(pages))
+
+    def test_deleted_posts_queryset_skips_their_comments(self):
+        counts, pages = self.patch_signals()
+        Post.objects.filter(id=self.post.id).delete()
+        counts.assert_not_called()
+        self.assertNotIn(f'comments:{self.post.id}', self.invalidated(pages))
+
+    def test_deleted_comment_is_counted(self):
+        Comment.objects.filter(parent=None).first().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
@@ -0,0 +1,77 @@
+"""
+Conditional GET (blog/conditional.py) - only the ETag validates a page,
+every change the page shows breaks it, and plain GETs reuse the page
+state instead of reading it again
+"""
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.utils.http import http_date
+
+from blog import conditional
+from blog.models import Category, Comment, Post
+
+from .base import BlogTestCase
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class ConditionalPageTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('etag_author')
+        cls.category = Category.objects.create(name='Validated', slug='validated')
+        cls.posts = [
+            Post.objects.create(
+                title=f'Post {i}', slug=f'etag-post-{i}', author=cls.author, category=cls.category,
+                content='Body', status='published',
+            )
+            for i in range(3)
+        ]
+
+    def changed(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+    def test_no_last_modified(self):
+        response = self.client.get('/')
+        self.assertTrue(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        again = self.client.get('/', HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 3600))
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_new_comment(self):
+        url = self.posts[0].get_absolute_url()
+        response = self.client.get(url)
+        Comment.objects.create(post=self.posts[0], author=self.author, content='First')
+        self.assertTrue(self.changed(url, response))
+
+    def test_deleted_newest_post(self):
+        response = self.client.get('/')
+        self.posts[-1].delete()
+        self.assertTrue(self.changed('/', response))
+
+    def test_category_description(self):
+        url = self.category.get_absolute_url()
+        response = self.client.get(url)
+        self.category.description = 'Now described'
+        self.category.save()
+        self.assertTrue(self.changed(url, response))
+
+    def test_plain_get_reuses_state(self):
+        with mock.patch('blog.conditional.state_digest', wraps=conditional.state_digest) as digest:
+            first = self.client.get('/')
+            second = self.client.get('/')
+            self.assertEqual(digest.call_count, 1)
+            self.assertEqual(first['ETag'], second['ETag'])
+            # Revalidations read the state from the database
+            self.client.get('/', HTTP_IF_NONE_MATCH=second['ETag'])
+            self.assertEqual(digest.call_count, 2)
+            # A change the page shows makes the next GET read it again
+            self.posts[0].title = 'Edited'
+            self.posts[0].save()
+            third = self.client.get('/')
+            self.assertEqual(digest.call_count, 3)
+        self.assertNotEqual(third['ETag'], first['ETag'])
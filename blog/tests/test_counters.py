@@ -0,0 +1,83 @@
+"""
+View counter buffers (blog/counters.py) - hits drained by several workers
+at once are written exactly once, and an idle worker still flushes
+"""
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from blog.counters import CacheViewBuffer, MemoryViewBuffer, ViewCounter
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+
+@override_settings(CACHES={'default': LOCMEM, 'views': {**LOCMEM, 'LOCATION': 'tests-views'}})
+class CacheViewBufferTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['views'].clear()
+        self.buffers = [CacheViewBuffer('views'), CacheViewBuffer('views')]
+
+    def test_drain(self):
+        first, second = self.buffers
+        first.add(1, 3)
+        second.add(1)
+        second.add(2)
+        self.assertEqual(first.pending(1), 4)
+        self.assertEqual(first.drain([1, 2]), {1: 4, 2: 1})
+        self.assertEqual(second.drain([1, 2]), {})
+        self.assertEqual(first.pending(1), 0)
+
+    def test_hits_read_by_two_drains_are_claimed_once(self):
+        first, second = self.buffers
+        key = first.key(1)
+        first.add(1, 5)
+        # Both drains read the count before either takes it, more hits arrive in between
+        first_read = caches['views'].get(key)
+        second.add(1, 3)
+        second_read = caches['views'].get(key)
+        self.assertEqual(first.claim(key, first_read), 5)
+        self.assertEqual(second.claim(key, second_read), 3)
+        self.assertEqual(caches['views'].get(key), 0)
+        self.assertEqual(first.claim(key, second_read), 0)
+        self.assertEqual(caches['views'].get(key), 0)
+
+    def test_concurrent_adds_and_drains(self):
+        drained = []
+        lock = threading.Lock()
+
+        def work(buffer):
+            for _ in range(500):
+                buffer.add(1)
+                counts = buffer.drain([1])
+                with lock:
+                    drained.append(counts.get(1, 0))
+
+        threads = [threading.Thread(target=work, args=(self.buffers[i % 2],)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        left = self.buffers[0].drain([1]).get(1, 0)
+        self.assertEqual(sum(drained) + left, 4000)
+
+
+class ViewCounterTests(SimpleTestCase):
+
+    def test_idle_worker_flushes_after_the_interval(self):
+        counter = ViewCounter(MemoryViewBuffer(), flush_interval=0.2, flush_threshold=100)
+        counter.flush_check_interval = 0.01
+        self.addCleanup(counter.stop)
+        with mock.patch('blog.counters.enqueue') as enqueue:
+            counter.record(7)
+            counter.record(7)
+            enqueue.assert_not_called()
+            # No more hits - the flusher thread writes them once the interval has passed
+            deadline = time.monotonic() + 5
+            while not enqueue.called and time.monotonic() < deadline:
+                time.sleep(0.01)
+        enqueue.assert_called_once_with('blog.write_views', {7: 2})
+        self.assertEqual(counter.pending(7), 0)
@@ -0,0 +1,77 @@
+"""
+Query budgets - every page runs a fixed number of SQL queries, no matter
+how many posts, comments or categories it shows
+"""
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from blog.models import Comment, Post
+from blog.related import RelatedPostsEngine
+from blog.search import get_search_backend
+
+from .base import BlogTestCase, clear_caches, make_posts, page_urls
+
+# Queries per page: (url name, logged in) -> budget
+# Logged-in pages pay 3 extra queries for the session, user and navbar profile
+# Validated pages pay 2-3 for their conditional GET state (blog/conditional.py)
+# when it isn't remembered yet - the caches are cleared before each count
+BUDGETS = {
+    ('home', False): 5,           # +2 state: the page's posts, the categories
+    ('search', False): 3,
+    ('explore', False): 4,        # +1 category count outside the cached grid
+    ('post_detail', False): 8,    # +1 deferred body, only when its fragment is cold; +3 state
+    ('category', False): 5,       # +3 state
+    ('home', True): 8,
+    ('post_detail', True): 12,
+    ('my_posts', True): 4,
+    ('profile', True): 5,         # +1 author stats, only when they aren't cached
+}
+
+
+def add_posts(count, reader, seed):
+    # Posts by the reader, each liked and commented on, so per-row lookups would show up
+    make_posts(count, users=5, seed=seed, prefix=f'q{seed}')
+    get_search_backend().rebuild()
+    RelatedPostsEngine().rebuild()
+    Post.objects.update(author=reader)
+    for post in Post.objects.all():
+        post.likes.add(reader)
+        Comment.objects.create(post=post, author=reader, content='Nice post!')
+
+
+# Measure the database work, not the page cache
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class QueryBudgetTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('budget_reader')
+        add_posts(6, cls.reader, seed=6)
+
+    def assertWithinBudget(self, name, logged_in):
+        if logged_in:
+            self.client.force_login(self.reader)
+        url = page_urls()[name]
+        # Cold fragment caches - the budget is the worst case
+        clear_caches()
+        with self.assertNumQueries(BUDGETS[(name, logged_in)]):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+    def test_anonymous_pages(self):
+        for name in ('home', 'search', 'explore', 'post_detail', 'category'):
+            with self.subTest(name):
+                self.assertWithinBudget(name, logged_in=False)
+
+    def test_logged_in_pages(self):
+        for name in ('home', 'post_detail', 'my_posts', 'profile'):
+            with self.subTest(name):
+                self.assertWithinBudget(name, logged_in=True)
+
+    def test_budgets_dont_grow_with_rows(self):
+        add_posts(60, self.reader, seed=60)
+        for name, logged_in in BUDGETS:
+            with self.subTest(name, logged_in=logged_in):
+                self.client.logout()
+                self.assertWithinBudget(name, logged_in)
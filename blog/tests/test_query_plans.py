@@ -0,0 +1,46 @@
+"""
+Query plans - every query the hot pages run reads through an index,
+with no full table scan or temporary sort (helpers in blog/tests/base.py)
+"""
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+
+from blog.models import Comment, Post
+from blog.related import RelatedPostsEngine
+from blog.search import get_search_backend
+
+from .base import EXPECTED, BlogTestCase, make_posts, page_queries, plan_lines, problems
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class QueryPlanTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Enough rows, likes and statistics that the planner prefers indexes where they exist
+        make_posts(2000, words=20, users=20)
+        get_search_backend().rebuild()
+        RelatedPostsEngine().rebuild()
+        cls.reader = User.objects.create_user('plan_reader')
+        Post.objects.filter(id__in=Post.objects.order_by('id').values('id')[:30]).update(author=cls.reader)
+        readers = list(User.objects.all())
+        for post in Post.objects.order_by('id')[:30]:
+            post.likes.add(*readers)
+            Comment.objects.create(post=post, author=cls.reader, content='Nice post!')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_hot_pages_use_indexes(self):
+        for name, queries in page_queries(self.reader).items():
+            for sql in queries:
+                if any(pattern.match(sql) for pattern in EXPECTED):
+                    continue
+                with self.subTest(name, sql=sql[:160]):
+                    self.assertEqual(problems(plan_lines(sql), windowed=' OVER (' in sql), [])
+
+    def test_problems_finds_scans_and_sorts(self):
+        # The check itself - an unindexed filter and sort must be reported
+        sql = 'SELECT id FROM blog_post WHERE word_count > 10 ORDER BY excerpt'
+        self.assertTrue(problems(plan_lines(sql)))
@@ -0,0 +1,80 @@
+"""
+Related posts refresh (blog/related.py) - which edits queue it, and which
+posts' lists and pages it rewrites
+"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from blog.models import Category, Post, RelatedPost, Tag, Task
+from blog.related import RelatedPostsEngine, refresh_related
+
+from .base import BlogTestCase
+
+
+@override_settings(BLOG_TASKS_EAGER=False)
+class RelatedRefreshTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('related_author')
+        cls.category = Category.objects.create(name='Related', slug='related')
+        cls.other_category = Category.objects.create(name='Other', slug='other')
+        tag = Tag.objects.create(name='Shared', slug='shared')
+        cls.posts = [
+            Post.objects.create(
+                title=f'Related {i}', slug=f'related-{i}', author=author, category=cls.category,
+                content='Related posts', status='published',
+            )
+            for i in range(4)
+        ]
+        for post in cls.posts:
+            post.tags.add(tag)
+        RelatedPostsEngine().rebuild()
+
+    def setUp(self):
+        super().setUp()
+        Task.objects.all().delete()
+
+    def queued(self):
+        return Task.objects.filter(name='blog.refresh_related').exists()
+
+    def test_content_edit_queues_nothing(self):
+        post = self.posts[0]
+        post.title = 'Edited title'
+        post.content = 'Edited content'
+        post.save()
+        self.assertFalse(self.queued())
+
+    def test_category_or_status_change_queues_a_refresh(self):
+        post = self.posts[0]
+        post.category = self.other_category
+        post.save()
+        self.assertTrue(self.queued())
+        Task.objects.all().delete()
+        post.status = 'draft'
+        post.save()
+        self.assertTrue(self.queued())
+
+    def test_new_post_queues_a_refresh(self):
+        Post.objects.create(
+            title='New', slug='related-new', author=self.posts[0].author, content='New', status='published',
+        )
+        self.assertTrue(self.queued())
+
+    def test_refresh_writes_only_changed_lists(self):
+        draft, *others = self.posts
+        self.assertEqual(RelatedPostsEngine().refresh([draft.id]), set())
+
+        Post.objects.filter(id=draft.id).update(status='draft')
+        with mock.patch('blog.related.invalidate_pages') as invalidate:
+            refresh_related([([draft.id],)])
+        # The draft's list is emptied and its neighbours stop listing it
+        self.assertCountEqual(invalidate.call_args.args, [f'post:{post.id}' for post in self.posts])
+        self.assertFalse(RelatedPost.objects.filter(related=draft).exists())
+        self.assertFalse(RelatedPost.objects.filter(post=draft).exists())
+
+        with mock.patch('blog.related.invalidate_pages') as invalidate:
+            refresh_related([([draft.id],)])
+        invalidate.assert_called_once_with()
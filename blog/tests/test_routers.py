@@ -0,0 +1,107 @@
+"""
+Primary/replica routing (blog/routers.py) - a 'replica1' alias mirrors the
+test database, so both aliases see the same rows and the tests check which
+connection each query went through
+"""
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from blog.models import Category, Post
+from blog.page_cache import invalidate_pages
+from blog.routers import PIN_COOKIE
+
+from .base import BlogTransactionTestCase, make_posts
+
+
+if 'replica1' not in connections.settings:
+    # Registered before the test databases are set up, as DB_REPLICAS would.
+    # Other tests keep their reads on 'default' (tests/base.py)
+    connections.settings['replica1'] = {
+        **connections.settings['default'],
+        'TEST': {**connections.settings['default']['TEST'], 'MIRROR': 'default'},
+    }
+
+
+# Mirrors only see committed rows, hence a TransactionTestCase
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False, BLOG_REPLICA_PIN_SECONDS=30)
+class ReplicaRoutingTests(BlogTransactionTestCase):
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        super().setUp()
+        make_posts(6, words=20, users=2)
+        self.writer = User.objects.create_user('writer', password='writer-pass')
+
+    def get(self, client, url, method='get', data=None):
+        # (response, queries on the primary, queries on the replica)
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica1']) as replica:
+            response = getattr(client, method)(url, data or {})
+        return response, len(primary), len(replica)
+
+    def test_public_pages_read_from_the_replica(self):
+        post = Post.objects.first()
+        for url in ('/', '/explore/', post.get_absolute_url(), post.category.get_absolute_url()):
+            with self.subTest(url):
+                response, primary, replica = self.get(self.client, url)
+                self.assertEqual(response.status_code, 200)
+                self.assertGreater(replica, 0)
+                self.assertEqual(primary, 0)
+
+    def test_other_pages_read_from_the_primary(self):
+        self.client.force_login(self.writer)
+        response, primary, replica = self.get(self.client, '/my-posts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+
+    def test_writer_is_pinned_to_the_primary(self):
+        self.client.force_login(self.writer)
+        response, primary, replica = self.get(self.client, '/create/', method='post', data={
+            'title': 'Fresh from the primary', 'slug': 'fresh-from-the-primary',
+            'content': 'Written just now', 'category': Category.objects.first().id, 'status': 'published',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(replica, 0)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 30)
+
+        post = Post.objects.get(slug='fresh-from-the-primary')
+        response, primary, replica = self.get(self.client, post.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+        # Once the cookie expires the writer reads from the replica again
+        del self.client.cookies[PIN_COOKIE]
+        response, primary, replica = self.get(self.client, post.get_absolute_url())
+        self.assertGreater(replica, 0)
+
+    def test_reads_after_a_write_in_the_same_request_stay_on_the_primary(self):
+        self.client.force_login(self.writer)
+        post = Post.objects.first()
+        response, primary, replica = self.get(self.client, f'{post.get_absolute_url()}like/', method='post')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_only_request_sets_no_cookie(self):
+        response, primary, replica = self.get(self.client, '/')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    @override_settings(BLOG_PAGE_CACHE_ENABLED=True)
+    def test_pages_read_from_the_replica_right_after_a_change_are_not_cached(self):
+        post = Post.objects.first()
+        url = post.get_absolute_url()
+        invalidate_pages(f'post:{post.id}')
+        # The replica may not have the change yet - don't store what it returned
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        later = time.time() + 31
+        with mock.patch('blog.page_cache.time', SimpleNamespace(time=lambda: later)):
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
@@ -0,0 +1,71 @@
+"""
+Search index (blog/search.py) - kept in sync with tag changes made from
+either side, and ranking capped at the newest matches
+"""
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+
+from blog.models import Post, Tag, Task
+from blog.search import get_search_backend
+
+from .base import BlogTestCase
+
+
+@override_settings(BLOG_TASKS_EAGER=False)
+class TagSyncTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('search_author')
+        cls.tag = Tag.objects.create(name='Zebracorn', slug='zebracorn')
+        cls.posts = [
+            Post.objects.create(
+                title=f'Search {i}', slug=f'search-{i}', author=author, content='Searched', status='published',
+            )
+            for i in range(3)
+        ]
+        cls.tag.posts.add(*cls.posts[:2])
+
+    def test_tag_side_add_and_remove(self):
+        backend = get_search_backend()
+        self.assertCountEqual(backend.search('zebracorn'), [post.id for post in self.posts[:2]])
+        self.tag.posts.add(self.posts[2])
+        self.assertEqual(len(backend.search('zebracorn')), 3)
+        self.tag.posts.remove(self.posts[0])
+        self.assertCountEqual(backend.search('zebracorn'), [post.id for post in self.posts[1:]])
+
+    def test_tag_side_clear(self):
+        Task.objects.all().delete()
+        with mock.patch('blog.signals.invalidate_pages') as invalidate:
+            self.tag.posts.clear()
+        self.assertEqual(get_search_backend().search('zebracorn'), [])
+        tags = {tag for call in invalidate.call_args_list for tag in call.args}
+        self.assertTrue({f'post:{post.id}' for post in self.posts[:2]} <= tags)
+        queued = Task.objects.get(name='blog.refresh_related')
+        self.assertCountEqual(queued.args[0], [post.id for post in self.posts[:2]])
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'No full-text index')
+class RankingTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('ranking_author')
+        Post.objects.bulk_create([
+            Post(title=f'Ranked {i}', slug=f'ranked-{i}', author=author, content='common words', status='published')
+            for i in range(30)
+        ])
+        get_search_backend().rebuild()
+        cls.newest = list(Post.objects.order_by('-id').values_list('id', flat=True))
+
+    def test_ranks_the_newest_matches(self):
+        # A title match among the newest posts ranks first, older ones are left out
+        best = Post.objects.get(id=self.newest[5])
+        best.title = 'Common words'
+        best.save()
+        found = get_search_backend().search('common', limit=10)
+        self.assertEqual(found[0], best.id)
+        self.assertCountEqual(found, self.newest[:10])
@@ -0,0 +1,173 @@
+"""
+Task queue (blog/tasks.py) - eager mode, queueing, dedup keys, batching,
+retries and tasks whose worker died
+"""
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from blog.models import Task
+from blog.tasks import Worker, enqueue, retry_failed, task
+
+calls = []
+
+
+@task('tests.record', retries=2, retry_delay=0)
+def record(*args):
+    calls.append(list(args))
+
+
+@task('tests.record_batch', batch_size=10)
+def record_batch(batch):
+    calls.append(batch)
+
+
+@task('tests.fail', retries=2, retry_delay=10)
+def fail(*args):
+    raise RuntimeError('Task failed')
+
+
+class TaskTestMixin:
+
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def expire(self, row):
+        # As if the worker running it had died, its lease ran out a minute ago
+        Task.objects.filter(id=row.id).update(
+            status='running', locked_by='dead-worker', attempts=1,
+            locked_until=timezone.now() - timedelta(minutes=1),
+        )
+
+
+@override_settings(BLOG_TASKS_EAGER=True)
+class EagerTaskTests(TaskTestMixin, TestCase):
+
+    def test_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', 1)
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [[1]])
+        self.assertFalse(Task.objects.exists())
+
+    def test_rolled_back_task_never_runs(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    enqueue('tests.record', 1)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(calls, [])
+
+    def test_args_go_through_json(self):
+        # Like a queued task: dict keys become strings
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {1: 2})
+        self.assertEqual(calls, [[{'1': 2}]])
+
+    def test_batch_task_gets_a_list(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record_batch', 'a')
+        self.assertEqual(calls, [[['a']]])
+
+    def test_errors_propagate(self):
+        with self.assertRaises(RuntimeError):
+            with self.captureOnCommitCallbacks(execute=True):
+                enqueue('tests.fail')
+
+
+@override_settings(BLOG_TASKS_EAGER=False)
+class QueuedTaskTests(TaskTestMixin, TestCase):
+
+    def test_queued_then_run_and_deleted(self):
+        enqueue('tests.record', 1, 'two')
+        self.assertEqual(calls, [])
+        self.assertEqual(Worker().run_pending(), 1)
+        self.assertEqual(calls, [[1, 'two']])
+        self.assertFalse(Task.objects.exists())
+
+    def test_delay(self):
+        enqueue('tests.record', 1, delay=60)
+        self.assertEqual(Worker().run_pending(), 0)
+        self.assertEqual(calls, [])
+
+    def test_dedup_key(self):
+        enqueue('tests.record', 1, dedup_key='refresh:1')
+        enqueue('tests.record', 2, dedup_key='refresh:1')
+        enqueue('tests.record', 3, dedup_key='refresh:2')
+        Worker().run_pending()
+        self.assertEqual(calls, [[1], [3]])
+
+    def test_batching(self):
+        for number in range(25):
+            enqueue('tests.record_batch', number)
+        self.assertEqual(Worker().run_pending(), 25)
+        self.assertEqual([len(batch) for batch in calls], [10, 10, 5])
+        self.assertEqual([args for batch in calls for args in batch], [[number] for number in range(25)])
+
+    def test_retries_with_backoff_then_fails(self):
+        enqueue('tests.fail')
+        worker = Worker()
+        for attempt, delay in ((1, 10), (2, 20)):
+            with self.assertLogs('blog.tasks', 'ERROR'):
+                worker.run_once()
+            row = Task.objects.get()
+            self.assertEqual((row.status, row.attempts), ('queued', attempt))
+            self.assertIn('RuntimeError: Task failed', row.last_error)
+            self.assertAlmostEqual((row.run_at - timezone.now()).total_seconds(), delay, delta=5)
+            Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('blog.tasks', 'ERROR'):
+            worker.run_once()
+        row = Task.objects.get()
+        self.assertEqual((row.status, row.attempts), ('failed', 3))
+
+        retry_failed(Task.objects.all())
+        row = Task.objects.get()
+        self.assertEqual((row.status, row.attempts), ('queued', 0))
+
+    def test_expired_lease_is_retried(self):
+        enqueue('tests.record', 1)
+        self.expire(Task.objects.get())
+        self.assertEqual(Worker().run_pending(), 1)
+        self.assertEqual(calls, [[1]])
+        self.assertFalse(Task.objects.exists())
+
+    def test_running_task_with_a_lease_is_left_alone(self):
+        enqueue('tests.record', 1)
+        Task.objects.update(
+            status='running', locked_by='live-worker', locked_until=timezone.now() + timedelta(minutes=5),
+        )
+        self.assertEqual(Worker().run_pending(), 0)
+        self.assertEqual(Task.objects.get().status, 'running')
+
+    def test_expired_lease_without_retries_left_fails(self):
+        enqueue('tests.fail')
+        row = Task.objects.get()
+        self.expire(row)
+        Task.objects.update(attempts=3)
+        Worker().run_pending()
+        row = Task.objects.get()
+        self.assertEqual(row.status, 'failed')
+        self.assertEqual(row.last_error, 'The worker running this task stopped')
+
+
+# The command's worker threads use their own connections, so the rows must be committed
+@override_settings(BLOG_TASKS_EAGER=False)
+class RunTasksCommandTests(TaskTestMixin, TransactionTestCase):
+
+    def test_picks_up_an_expired_lease(self):
+        enqueue('tests.record', 'abandoned')
+        self.expire(Task.objects.get())
+        enqueue('tests.record', 'queued')
+        # Leave the test runner's Ctrl-C handler in place
+        with mock.patch('signal.signal'):
+            call_command('run_tasks', '--once', '--threads', '1', stdout=StringIO())
+        self.assertCountEqual(calls, [['abandoned'], ['queued']])
+        self.assertFalse(Task.objects.exists())
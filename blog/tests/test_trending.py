@@ -0,0 +1,69 @@
+"""
+Trending scores (blog/trending.py) - a run only writes the scores that
+changed since the last one
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.utils import timezone
+
+from blog.models import Post, PostViewDaily
+from blog.trending import compute_scores, update_trending_scores
+
+from .base import BlogTestCase
+
+
+class TrendingScoreTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('trending_author')
+        cls.posts = [
+            Post.objects.create(title=f'Trending {i}', slug=f'trending-{i}', author=author, content='Read', status='published')
+            for i in range(3)
+        ]
+        cls.today = timezone.localdate()
+        PostViewDaily.objects.bulk_create([
+            PostViewDaily(post=cls.posts[0], date=cls.today, views=10),
+            PostViewDaily(post=cls.posts[1], date=cls.today - timedelta(days=3), views=40),
+            PostViewDaily(post=cls.posts[2], date=cls.today - timedelta(days=20), views=5),
+        ])
+
+    def scores(self):
+        return dict(Post.objects.filter(trending_score__gt=0).values_list('id', 'trending_score'))
+
+    def update(self, **kwargs):
+        with mock.patch('blog.trending.invalidate_pages') as invalidate:
+            changed = update_trending_scores(today=self.today, **kwargs)
+        self.assertEqual(invalidate.called, bool(changed))
+        return changed
+
+    def test_first_run_scores_every_viewed_post(self):
+        self.assertEqual(self.update(), 3)
+        self.assertEqual(self.scores().keys(), compute_scores(self.today).keys())
+
+    def test_unchanged_scores_are_not_written(self):
+        self.update()
+        # Reads the rollups and the stored scores, writes nothing
+        with self.assertNumQueries(2):
+            self.assertEqual(self.update(), 0)
+
+    def test_only_posts_viewed_since_are_written(self):
+        self.update()
+        before = self.scores()
+        PostViewDaily.objects.filter(post=self.posts[0], date=self.today).update(views=F('views') + 5)
+        self.assertEqual(self.update(), 1)
+        after = self.scores()
+        self.assertGreater(after[self.posts[0].id], before[self.posts[0].id])
+        self.assertEqual(after[self.posts[1].id], before[self.posts[1].id])
+
+    def test_posts_leaving_the_window_go_back_to_zero(self):
+        self.update()
+        self.assertEqual(self.update(window_days=10), 1)
+        self.assertNotIn(self.posts[2].id, self.scores())
+
+    def test_batches(self):
+        self.assertEqual(self.update(batch_size=1), 3)
+        self.assertEqual(len(self.scores()), 3)
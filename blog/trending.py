@@ -0,0 +1,82 @@
+"""
+Trending posts ranked by recent views with time decay
+
+Each day of views counts less the older it is, Hacker News style:
+
+    score = sum(views_on_day / (age_in_days + 2) ** gravity)
+
+over the last BLOG_TRENDING_WINDOW_DAYS days of PostViewDaily rollups.
+Scores are stored in the indexed Post.trending_score column by the
+update_trending command, so explore just reads the top rows. Only the
+scores that changed since the last run are written.
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Post, PostViewDaily
+from .page_cache import invalidate_pages
+
+
+def decay_score(views, age_days, gravity):
+    return views / (age_days + 2) ** gravity
+
+
+def compute_scores(today=None, window_days=None, gravity=None):
+    """
+    Returns {post_id: score} for every post viewed inside the window
+    Only the rollup rows in the window are read, not the post table
+    """
+    today = today or timezone.localdate()
+    window_days = window_days or getattr(settings, 'BLOG_TRENDING_WINDOW_DAYS', 30)
+    gravity = gravity or getattr(settings, 'BLOG_TRENDING_GRAVITY', 1.8)
+
+    start = today - timezone.timedelta(days=window_days - 1)
+    rows = (
+        PostViewDaily.objects.filter(date__gte=start, date__lte=today, views__gt=0)
+        .values_list('post_id', 'date', 'views')
+        .iterator(chunk_size=5000)
+    )
+    scores = defaultdict(float)
+    for post_id, date, views in rows:
+        scores[post_id] += decay_score(views, (today - date).days, gravity)
+    return scores
+
+
+def update_trending_scores(today=None, window_days=None, gravity=None, batch_size=1000):
+    """
+    Stores fresh scores on Post.trending_score, returns how many changed
+    Posts whose views dropped out of the window go back to 0
+    """
+    scores = compute_scores(today, window_days, gravity)
+    stored = dict(Post.objects.filter(trending_score__gt=0).values_list('id', 'trending_score'))
+    # Between two runs on the same day, only posts viewed in between score
+    # differently - every other row is left alone. The first run of a day
+    # ages every score, so it rewrites them all
+    changed = {post_id: 0.0 for post_id in stored.keys() - scores.keys()}
+    changed.update({
+        post_id: score for post_id, score in scores.items()
+        if not math.isclose(score, stored.get(post_id, 0.0), rel_tol=1e-9)
+    })
+    post_ids = sorted(changed)
+    for start in range(0, len(post_ids), batch_size):
+        # One short write transaction per batch, page views keep writing in between
+        with transaction.atomic():
+            Post.objects.bulk_update(
+                [Post(id=post_id, trending_score=changed[post_id]) for post_id in post_ids[start:start + batch_size]],
+                ['trending_score'],
+            )
+    if changed:
+        invalidate_pages('explore')
+    return len(changed)
+
+
+def prune_rollups(keep_days, today=None):
+    # Delete rollup rows older than keep_days, returns how many were removed
+    today = today or timezone.localdate()
+    cutoff = today - timezone.timedelta(days=keep_days)
+    deleted, _ = PostViewDaily.objects.filter(date__lt=cutoff).delete()
+    return deleted
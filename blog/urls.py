@@ -1,27 +1,37 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'blog'
 
+# Read-heavy pages: the async versions when served over ASGI (see blog/async_views.py)
+pages = async_views if settings.BLOG_ASYNC_VIEWS else views
+
 urlpatterns = [
     # Main pages
-    path('', views.home, name='home'),
-    path('explore/', views.explore, name='explore'),
+    path('', pages.home, name='home'),
+    path('explore/', pages.explore, name='explore'),
     
     # Post CRUD operations
-    path('post/<slug:slug>/', views.post_detail, name='post_detail'),
+    path('post/<slug:slug>/', pages.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('post/<slug:slug>/edit/', views.post_update, name='post_update'),
     path('post/<slug:slug>/delete/', views.post_delete, name='post_delete'),
     
     # Category filtering
-    path('category/<slug:slug>/', views.category_posts, name='category'),
+    path('category/<slug:slug>/', pages.category_posts, name='category'),
     
     # User dashboard
     path('my-posts/', views.my_posts, name='my_posts'),
     
     # Engagement features
-    path('post/<slug:slug>/like/', views.post_like, name='post_like'),
+    path('post/<slug:slug>/like/', pages.post_like, name='post_like'),
     path('post/<slug:slug>/comment/', views.add_comment, name='add_comment'),
     path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
+    path('comment/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
+    
+    # Monitoring (staff only)
+    path('stats/page-cache/', views.page_cache_stats, name='page_cache_stats'),
+    path('stats/performance/', views.performance_stats, name='performance_stats'),
+    path('metrics', views.prometheus_metrics, name='prometheus_metrics'),
 ]
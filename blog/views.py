@@ -1,119 +1,287 @@
+import hmac
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
-from django.http import JsonResponse
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.functional import SimpleLazyObject
 from .models import Post, Category, Tag, Comment
 from .forms import PostForm, CommentForm
+from .search import get_search_backend
+from .counters import get_view_counter
+from .pagination import CursorPaginator
+from .comments import more_replies, thread_page
+from .routers import replica_reads
+from .page_cache import cache_anonymous_page, fragment_versions, get_page_cache, tag_page, post_tags
+from .conditional import conditional_page
+from .metrics import get_metrics
+
+def published_posts():
+    """
+    Published posts with the author and category joined in,
+    so post cards don't run extra queries per row.
+    Only card columns are loaded - the content body stays in the database
+    """
+    return (
+        Post.objects.filter(status='published')
+        .select_related('author', 'category')
+        .only(*Post.CARD_FIELDS)
+    )
+
+# What a post card shows that can change, for conditional GET (see blog/conditional.py)
+CARD_STATE = ('id', 'updated_at', 'like_count', 'featured_image_renditions')
+
+def cards_state(posts):
+    return [tuple(getattr(post, field) for field in CARD_STATE) for post in posts]
+
+def categories_state():
+    # Every page shows the category names (a handful of rows)
+    return list(Category.objects.values_list('id', 'name', 'slug'))
+
+def published_count_key(count_version):
+    # The total count is cached until a post is published or removed ('posts')
+    return f'blog:count:posts:{count_version}'
 
+def home_state(request):
+    # What home() shows, for revalidations - search results aren't validated
+    if request.GET.get('search'):
+        return None
+    paginator = CursorPaginator(
+        Post.objects.filter(status='published').only(*CARD_STATE, 'published_at'), 6,
+        count_key=published_count_key(fragment_versions(count=['posts'])['count']),
+    )
+    posts = paginator.get_page(request.GET.get('cursor'))
+    return [paginator.count, cards_state(posts), categories_state()], {}
+
+@cache_anonymous_page()
+@replica_reads
+@conditional_page(home_state)
 def home(request):
     """
     Homepage - shows all published posts with search and pagination
     Users can browse latest articles here
     """
-    posts_list = Post.objects.filter(status='published')
-    
-    # Search feature - looks in title, content, and tags
+    # One cache round trip for the fragment and post count versions
+    versions = fragment_versions(categories=['categories'], count=['posts'])
     search_query = request.GET.get('search', '')
-    if search_query:
-        posts_list = posts_list.filter(
-            Q(title__icontains=search_query) |
-            Q(content__icontains=search_query) |
-            Q(tags__name__icontains=search_query)
-        ).distinct()
-    
-    # Show 6 posts per page for better UX
-    paginator = Paginator(posts_list, 6)
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
+    posts = home_posts(request, search_query, versions['count'])
+    return render(request, 'blog/home.html', home_context(request, posts, search_query, versions))
+
+def home_posts(request, search_query, count_version):
+    """
+    The page of posts home() shows - search results or the newest posts
+    """
+    posts_list = published_posts()
     
+    # Search feature - looks in title, content, and tags through the search index
+    if search_query:
+        # Paginate the ranked ids, then load only the posts on this page
+        post_ids = get_search_backend().search(search_query)
+        paginator = Paginator(post_ids, 6)
+        posts = paginator.get_page(request.GET.get('page'))
+        found = posts_list.in_bulk(list(posts.object_list))
+        posts.object_list = [found[post_id] for post_id in posts.object_list if post_id in found]
+    else:
+        # Show 6 posts per page, newest first - keyset pages cost the same at any depth
+        paginator = CursorPaginator(posts_list, 6, count_key=published_count_key(count_version))
+        posts = paginator.get_page(request.GET.get('cursor'))
+    return posts
+
+def home_context(request, posts, search_query, versions):
+    """
+    Tags the home page and returns its template context
+    """
     # Get all categories for the filter section
     categories = Category.objects.all()
     
+    # Page cache: refresh when the listing/results change or a shown post is edited
+    tag_page(request, 'categories', 'search' if search_query else 'posts', *post_tags(posts))
+    
     context = {
         'posts': posts,
         'categories': categories,
         'search_query': search_query,
+        'fragment_timeout': settings.BLOG_FRAGMENT_CACHE_TIMEOUT,
+        'fragment_versions': versions,
     }
-    return render(request, 'blog/home.html', context)
+    return context
+
+def count_cached_view(request, meta):
+    # Pages served from the page cache still count as views
+    get_view_counter().record(meta['post_id'])
+
+def related_posts_of(post_id, category_id, posts):
+    # Precomputed related posts (tag overlap, category, recency - see blog/related.py)
+    related = list(posts.filter(related_from__post=post_id).order_by('-related_from__score')[:3])
+    if not related:
+        # Not computed yet - fall back to posts from the same category
+        related = list(posts.filter(category=category_id).exclude(id=post_id)[:3])
+    return related
+
+def post_detail_state(request, slug):
+    # What post_detail() shows, for revalidations - a new or deleted comment
+    # changes comment_count or the newest comment id
+    newest_comment = Comment.objects.filter(post=OuterRef('pk')).order_by('-id').values('id')[:1]
+    post = (
+        Post.objects.filter(slug=slug, status='published')
+        .only(*CARD_STATE, 'category_id', 'comment_count')
+        .annotate(newest_comment=Subquery(newest_comment))
+        .first()
+    )
+    if post is None:
+        return None
+    related = related_posts_of(post.id, post.category_id, Post.objects.filter(status='published').only(*CARD_STATE))
+    state = [cards_state([post]), post.comment_count, post.newest_comment, cards_state(related), categories_state()]
+    return state, {'post_id': post.id}
 
+@cache_anonymous_page(on_hit=count_cached_view)
+@replica_reads
+@conditional_page(post_detail_state, on_not_modified=count_cached_view)
 def post_detail(request, slug):
     """
     Shows full post content with comments and related articles
     Also tracks view count for analytics
     """
-    post = get_object_or_404(Post, slug=slug, status='published')
+    # The body is only read when its cached fragment has to be re-rendered
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'category').defer('content'),
+        slug=slug, status='published'
+    )
     
-    # Increment view count each time someone opens the post
-    post.views += 1
-    post.save(update_fields=['views'])
+    count_view(post)
     
-    # Get related posts from same category (max 3)
-    related_posts = Post.objects.filter(
-        category=post.category,
-        status='published'
-    ).exclude(id=post.id)[:3]
+    # Get precomputed related posts, or posts from the same category
+    related_posts = related_posts_of(post.id, post.category_id, published_posts())
     
-    # Get all comments for this post
-    comments = post.comments.all()
+    # A page of comment threads with their authors, in one query (see blog/comments.py)
+    # Lazy - only runs when the cached comment list has to be re-rendered
+    comments_cursor = request.GET.get('comments', '')
+    comment_threads = SimpleLazyObject(lambda: thread_page(post.id, comments_cursor))
     
+    context = post_detail_context(
+        request, post, related_posts, comment_threads, comments_cursor, post.is_liked_by(request.user)
+    )
+    return render(request, 'blog/post_detail.html', context)
+
+def count_view(post):
+    # Count the view - buffered and written to the database in batches,
+    # so show the stored count plus the views that are not flushed yet
+    view_counter = get_view_counter()
+    view_counter.record(post.id)
+    post.views += view_counter.pending(post.id)
+
+def post_detail_context(request, post, related_posts, comment_threads, comments_cursor, is_liked):
+    """
+    Tags the post page and returns its template context
+    """
     # Comment form for logged in users
     comment_form = CommentForm()
     
+    tag_page(
+        request, 'categories', f'post:{post.id}', f'comments:{post.id}',
+        *post_tags(related_posts), post_id=post.id
+    )
+    
     context = {
         'post': post,
         'related_posts': related_posts,
-        'comments': comments,
+        'comment_threads': comment_threads,
+        'comments_cursor': comments_cursor,
         'comment_form': comment_form,
+        # Per-user parts, rendered around the shared cached fragments
+        'is_liked': is_liked,
+        'fragment_timeout': settings.BLOG_FRAGMENT_CACHE_TIMEOUT,
+        'fragment_versions': fragment_versions(
+            body=[f'post:{post.id}'],
+            comments=[f'comments:{post.id}'],
+            related=post_tags(related_posts),
+        ),
     }
-    return render(request, 'blog/post_detail.html', context)
+    return context
 
+@cache_anonymous_page()
+@replica_reads
 def explore(request):
     """
     Explore page - shows trending and popular content
     Helps users discover new articles
     """
-    # Get trending posts (most views in last 30 days)
-    trending_posts = Post.objects.filter(
-        status='published'
-    ).order_by('-views', '-published_at')[:6]
-    
-    # Get most liked posts
-    popular_posts = Post.objects.filter(
-        status='published'
-    ).annotate(
-        like_count=Count('likes')
-    ).order_by('-like_count', '-published_at')[:6]
+    context = explore_context(request, trending_posts(), popular_posts(), Category.objects.count())
+    return render(request, 'blog/explore.html', context)
+
+def trending_posts():
+    # Trending posts (recent views with time decay, see blog/trending.py)
+    return published_posts().order_by('-trending_score', '-published_at')[:6]
+
+def popular_posts():
+    # Most liked posts (stored like_count, served from an index)
+    return published_posts().order_by('-like_count', '-published_at')[:6]
+
+def explore_context(request, trending, popular, category_count):
+    """
+    Tags the explore page and returns its template context
+    """
+    # Get all categories with post counts (counted in the same query)
+    categories = Category.objects.annotate(
+        published_count=Count('posts', filter=Q(posts__status='published'))
+    )
     
-    # Get all categories with post counts
-    categories = Category.objects.all()
+    tag_page(request, 'explore', 'categories', *post_tags(trending), *post_tags(popular))
     
     context = {
-        'trending_posts': trending_posts,
-        'popular_posts': popular_posts,
+        'trending_posts': trending,
+        'popular_posts': popular,
         'categories': categories,
+        'category_count': category_count,
+        'fragment_timeout': settings.BLOG_FRAGMENT_CACHE_TIMEOUT,
+        # Counts change when posts are published or removed ('posts')
+        'fragment_versions': fragment_versions(categories=['categories', 'posts']),
     }
-    return render(request, 'blog/explore.html', context)
+    return context
 
+def category_state(request, slug):
+    # What category_posts() shows, for revalidations
+    category = Category.objects.filter(slug=slug).values_list('id', 'description').first()
+    if category is None:
+        return None
+    paginator = CursorPaginator(
+        Post.objects.filter(status='published', category=category[0]).only(*CARD_STATE, 'published_at'), 6
+    )
+    posts = paginator.get_page(request.GET.get('cursor'))
+    return [category, cards_state(posts), categories_state()], {}
+
+@cache_anonymous_page()
+@replica_reads
+@conditional_page(category_state)
 def category_posts(request, slug):
     """
     Shows all posts from a specific category
     Helps users find content by topic
     """
     category = get_object_or_404(Category, slug=slug)
-    posts_list = Post.objects.filter(category=category, status='published')
-    
-    # Pagination for better performance
-    paginator = Paginator(posts_list, 6)
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
+    posts = category_page(category, request.GET.get('cursor'))
+    return render(request, 'blog/category_posts.html', category_context(request, category, posts))
+
+def category_page(category, cursor):
+    # Keyset pagination for better performance on deep pages
+    paginator = CursorPaginator(published_posts().filter(category=category), 6)
+    return paginator.get_page(cursor)
+
+def category_context(request, category, posts):
+    """
+    Tags the category page and returns its template context
+    """
+    tag_page(request, 'categories', f'category:{category.id}', *post_tags(posts))
     
     context = {
         'category': category,
         'posts': posts,
     }
-    return render(request, 'blog/category_posts.html', context)
+    return context
 
 @login_required
 def post_create(request):
@@ -190,12 +358,15 @@ def my_posts(request):
     Dashboard showing all posts by current user
     Includes both drafts and published posts
     """
-    posts_list = Post.objects.filter(author=request.user)
+    posts_list = (
+        Post.objects.filter(author=request.user)
+        .select_related('author', 'category')
+        .only(*Post.CARD_FIELDS)
+    )
     
-    # Show 10 posts per page in dashboard
-    paginator = Paginator(posts_list, 10)
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
+    # Show 10 posts per page in dashboard (drafts have no publish date)
+    paginator = CursorPaginator(posts_list, 10, ordering=('-created_at', '-id'))
+    posts = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'posts': posts,
@@ -220,6 +391,9 @@ def post_like(request, slug):
         post.likes.add(request.user)
         liked = True
     
+    # Counter was updated by the m2m signal - reload just that column
+    post.refresh_from_db(fields=['like_count'])
+    
     # Return JSON response for AJAX
     return JsonResponse({
         'liked': liked,
@@ -236,17 +410,39 @@ def add_comment(request, slug):
     
     if request.method == 'POST':
         form = CommentForm(request.POST)
-        if form.is_valid():
+        # Replies name the comment they answer - it has to be on the same post
+        parent_id = request.POST.get('parent')
+        parent = Comment.objects.filter(id=parent_id, post=post).first() if parent_id and parent_id.isdigit() else None
+        if form.is_valid() and (parent or not parent_id):
             comment = form.save(commit=False)
             comment.post = post
             comment.author = request.user
+            comment.parent = parent
             comment.save()
-            messages.success(request, 'Comment added successfully!')
+            messages.success(request, 'Reply added successfully!' if parent else 'Comment added successfully!')
+            return redirect(f'{post.get_absolute_url()}#comment-{comment.id}')
         else:
             messages.error(request, 'Error adding comment. Please try again.')
     
     return redirect('blog:post_detail', slug=slug)
 
+@cache_anonymous_page()
+@replica_reads
+def comment_replies(request, comment_id):
+    """
+    "Load more replies" - the next replies of a comment thread, as HTML
+    to insert in place of the button
+    """
+    thread = get_object_or_404(Comment.objects.only('id', 'post_id'), id=comment_id, parent__isnull=True)
+    replies, has_more = more_replies(thread.id, request.GET.get('after', ''))
+    tag_page(request, f'comments:{thread.post_id}')
+    context = {
+        'thread': thread,
+        'replies': replies,
+        'has_more': has_more,
+    }
+    return render(request, 'blog/includes/comment_replies.html', context)
+
 @login_required
 def delete_comment(request, comment_id):
     """
@@ -263,3 +459,32 @@ def delete_comment(request, comment_id):
     else:
         messages.error(request, 'You can only delete your own comments.')
         return redirect('blog:home')
+
+@staff_member_required
+def page_cache_stats(request):
+    """
+    Page cache hit/miss counts for this worker process - staff only
+    """
+    page_cache = get_page_cache()
+    return JsonResponse({
+        'hit_ratio': round(page_cache.hit_ratio(), 4),
+        'views': page_cache.summary(),
+    })
+
+@staff_member_required
+def performance_stats(request):
+    """
+    Latency, SQL and template time per URL name for this worker process - staff only
+    """
+    return JsonResponse({'views': get_metrics().summary()})
+
+def prometheus_metrics(request):
+    """
+    The request metrics for Prometheus - staff, or a scraper sending
+    "Authorization: Bearer <BLOG_METRICS_TOKEN>"
+    """
+    token = getattr(settings, 'BLOG_METRICS_TOKEN', '')
+    authorized = token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(get_metrics().prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
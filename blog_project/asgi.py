@@ -1,5 +1,11 @@
 """
 ASGI config for blog_project.
+
+Serves the read-heavy pages with the async views in blog/async_views.py
+(BLOG_ASYNC_VIEWS). Run it with uvicorn workers, see "Async Serving (ASGI)"
+in the README:
+
+    gunicorn blog_project.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -7,5 +13,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog_project.settings')
+os.environ.setdefault('BLOG_ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
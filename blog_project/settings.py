@@ -5,6 +5,8 @@ Django settings for blog_project.
 from pathlib import Path
 import os
 
+from decouple import Csv, config
+
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -24,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'whitenoise.runserver_nostatic',  # runserver serves static files the same way
     'django.contrib.staticfiles',
     'blog',      # main blog app
     'accounts',  # user authentication
@@ -31,10 +34,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'blog.static.WhiteNoiseMiddleware',  # serves collected static files (WSGI and ASGI)
+    'blog.metrics.RequestMetricsMiddleware',  # latency, SQL and template time per URL name
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'blog.routers.ReadYourWritesMiddleware',  # keeps a writer's next reads on the primary
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -43,7 +49,7 @@ ROOT_URLCONF = 'blog_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'blog.metrics.DjangoTemplates',  # Django templates, timed for the request metrics
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -60,12 +66,78 @@ TEMPLATES = [
 WSGI_APPLICATION = 'blog_project.wsgi.application'
 
 
-# Database - SQLite
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database - read from the environment (or a .env file, see .env.example)
+# DB_ENGINE=sqlite (default) or postgresql. Persistent connections are kept
+# for DB_CONN_MAX_AGE seconds and checked before reuse.
+# DB_REPLICAS lists read replicas (hosts for PostgreSQL, files for SQLite);
+# blog.routers sends the read-only public pages to them
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='bloghub'),
+            'USER': config('DB_USER', default='bloghub'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+        }
     }
+    replica_setting = 'HOST'
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+    replica_setting = 'NAME'
+DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+for number, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv()), 1):
+    # Tests read the replicas from the test primary
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], replica_setting: replica, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['blog.routers.PrimaryReplicaRouter']
+
+
+# Caches - 'pages' holds the anonymous page cache and the versions of its
+# tags (see blog/page_cache.py), 'template_fragments' the fragments of
+# logged-in pages. Every process must see the same tags and fragments, or
+# an edit made by another worker (or by run_tasks) never reaches what it
+# cached, so both are file caches under BLOG_CACHE_DIR by default. Redis
+# (django.core.cache.backends.redis.RedisCache) works too; local memory
+# only for a single process with eager tasks (checked by blog/checks.py).
+# 'counters' holds the author stats and, with BLOG_VIEW_BUFFER = 'cache', the
+# buffered views. Every worker counts them up with incr, which only Redis and
+# Memcached do atomically - set BLOG_COUNTERS_REDIS_URL in production. The
+# file cache fallback is shared but not atomic, so author stats are then
+# recomputed from the database after each change instead of counted up
+BLOG_CACHE_DIR = config('BLOG_CACHE_DIR', default=str(BASE_DIR / 'cache'))
+BLOG_COUNTERS_REDIS_URL = config('BLOG_COUNTERS_REDIS_URL', default='')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BLOG_CACHE_DIR, 'pages'),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Used by {% cache %} fragments (post body, comments, related posts, category chips)
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BLOG_CACHE_DIR, 'fragments'),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'counters': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': BLOG_COUNTERS_REDIS_URL,
+    } if BLOG_COUNTERS_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BLOG_CACHE_DIR, 'counters'),
+    },
 }
 
 
@@ -98,6 +170,14 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic writes content-hashed copies (base.3f2a9c.css) plus gzip and
+# Brotli versions; WhiteNoise serves the hashed names with a one year
+# immutable Cache-Control and picks the compressed file the browser accepts
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -109,3 +189,92 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = 'blog:home'
 LOGOUT_REDIRECT_URL = 'blog:home'
 LOGIN_URL = 'accounts:login'
+
+# Full-text search - backend is picked from the database engine when not set
+# (SQLite FTS5 / PostgreSQL tsvector), see blog/search.py
+BLOG_SEARCH_BACKEND = None
+BLOG_SEARCH_MAX_RESULTS = 1000
+
+# Post view counting - views are buffered and written in batches, so the
+# stored count lags by at most BLOG_VIEW_FLUSH_INTERVAL seconds.
+# 'memory' buffers per worker, 'cache' uses the BLOG_VIEW_CACHE cache (share it
+# across workers, e.g. Redis - not Memcached, whose decr stops at zero, and
+# not the file cache, whose incr isn't atomic)
+BLOG_VIEW_BUFFER = 'memory'
+BLOG_VIEW_CACHE = 'counters'
+BLOG_VIEW_FLUSH_INTERVAL = 10
+BLOG_VIEW_FLUSH_THRESHOLD = 100
+
+# Author stats on the profile page (blog/author_stats.py) - computed in one
+# query, cached and counted up by signals. The cache must be shared by the
+# web and task workers (blog.E003), and is only counted up on a backend with
+# an atomic incr (Redis, Memcached) - on others each change drops the numbers
+BLOG_AUTHOR_STATS_CACHE = 'counters'
+BLOG_AUTHOR_STATS_TIMEOUT = 3600
+
+# Trending posts - score = sum(views per day / (age in days + 2) ** gravity)
+# over the window, stored by: python manage.py update_trending
+BLOG_TRENDING_WINDOW_DAYS = 30
+BLOG_TRENDING_GRAVITY = 1.8
+
+# Related posts stored per post (the detail page shows the top 3)
+BLOG_RELATED_POSTS_STORED = 6
+
+# Anonymous page cache - pages are refreshed by signals when what they show
+# changes; view and like counts on cached pages may lag by the timeout
+BLOG_PAGE_CACHE_ENABLED = True
+BLOG_PAGE_CACHE = 'pages'
+BLOG_PAGE_CACHE_TIMEOUT = 300
+
+# Shared page fragments for logged-in users (versioned by the same signals)
+BLOG_FRAGMENT_CACHE_TIMEOUT = 600
+
+# SQLite production profile (blog/sqlite.py) - lets several gunicorn workers
+# share db.sqlite3 without "database is locked" errors: WAL journal,
+# synchronous=NORMAL, mmap, a busy timeout and BEGIN IMMEDIATE for atomic()
+# blocks. BLOG_SQLITE_PRAGMAS overrides the pragmas (see DEFAULT_PRAGMAS)
+BLOG_SQLITE_PRODUCTION = True
+BLOG_SQLITE_IMMEDIATE_TRANSACTIONS = True
+
+# Read replicas - seconds a user's reads stay on the primary after they
+# write something, so they see their own change despite replication lag.
+# Also how long after a change the page cache skips pages read from a replica
+BLOG_REPLICA_PIN_SECONDS = 10
+
+# Image renditions (blog/images.py) - resized WebP/JPEG copies of uploads,
+# made by a background task after the upload's request;
+# python manage.py build_image_renditions fills in images uploaded before
+
+# Background tasks (blog/tasks.py) - view count writes, image renditions,
+# related posts and profile saves are queued in the Task table and run by
+# python manage.py run_tasks. BLOG_TASKS_EAGER runs them in the request
+# instead, right after its transaction commits (runserver, tests, scripts).
+# A task whose worker died is picked up again after BLOG_TASKS_LEASE seconds
+BLOG_TASKS_EAGER = config('BLOG_TASKS_EAGER', default=DEBUG, cast=bool)
+BLOG_TASKS_POLL_INTERVAL = 1
+BLOG_TASKS_LEASE = 300
+
+# Threaded comments (blog/comments.py) - top-level threads per page on a post,
+# replies shown under each before "Show more replies", and replies per load
+BLOG_COMMENT_THREADS_PER_PAGE = 10
+BLOG_COMMENT_REPLIES_SHOWN = 3
+BLOG_COMMENT_REPLIES_PAGE = 20
+
+# Async views (blog/async_views.py) for the home, explore, category and post
+# pages and the like button - on when served over ASGI (blog_project/asgi.py
+# sets it), off under WSGI, where the sync views in blog/views.py run
+BLOG_ASYNC_VIEWS = config('BLOG_ASYNC_VIEWS', default=False, cast=bool)
+
+# Request metrics (blog/metrics.py) - latency, SQL queries/time and template
+# time per URL name, kept per worker process: JSON for staff at
+# /stats/performance/, Prometheus text at /metrics (staff, or the header
+# "Authorization: Bearer <BLOG_METRICS_TOKEN>"), and a Server-Timing header
+BLOG_METRICS_TOKEN = config('BLOG_METRICS_TOKEN', default='')
+BLOG_SERVER_TIMING = True
+
+# Sampled profiling - this fraction of requests runs under cProfile; the ones
+# slower than BLOG_PROFILE_SLOW_MS are saved to BLOG_PROFILE_DIR as .prof
+# files (python -m pstats, snakeviz). 0 turns it off
+BLOG_PROFILE_SAMPLE_RATE = config('BLOG_PROFILE_SAMPLE_RATE', default=0.0, cast=float)
+BLOG_PROFILE_SLOW_MS = 500
+BLOG_PROFILE_DIR = BASE_DIR / 'profiles'
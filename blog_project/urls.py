@@ -10,6 +10,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('blog.urls')),
     path('accounts/', include('accounts.urls')),
+    path('api/v1/', include('blog.api_urls')),
 ]
 
 # Serve media files during development
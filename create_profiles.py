@@ -7,12 +7,13 @@ django.setup()
 from django.contrib.auth.models import User
 from accounts.models import UserProfile
 
-# Create profiles for existing users
-for user in User.objects.all():
-    profile, created = UserProfile.objects.get_or_create(user=user)
-    if created:
-        print(f"✅ Profile created for {user.username}")
-    else:
-        print(f"ℹ️  Profile already exists for {user.username}")
+# Create the missing profiles in one bulk insert - users added with
+# bulk_create or raw SQL skip the signal that makes them
+missing = User.objects.filter(profile__isnull=True).values_list('id', flat=True)
+created = UserProfile.objects.bulk_create(
+    [UserProfile(user_id=user_id) for user_id in missing.iterator(chunk_size=5000)],
+    batch_size=1000,
+    ignore_conflicts=True,  # a profile made meanwhile, e.g. by a signup
+)
 
-print("\n✅ All users now have profiles!")
+print(f"✅ Created {len(created)} missing profiles, all users now have profiles!")
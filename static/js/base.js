@@ -0,0 +1,137 @@
+// Smooth navbar hide/show on scroll
+let lastScroll = 0;
+const navbar = document.querySelector('.main-navbar');
+const scrollToTop = document.getElementById('scrollToTop');
+const scrollThreshold = 100; // Minimum scroll before hiding
+
+window.addEventListener('scroll', () => {
+    const currentScroll = window.pageYOffset;
+
+    // Add scrolled class for styling
+    if (currentScroll > 50) {
+        navbar.classList.add('scrolled');
+    } else {
+        navbar.classList.remove('scrolled');
+    }
+
+    // Hide navbar on scroll down, show on scroll up
+    if (currentScroll > scrollThreshold) {
+        if (currentScroll > lastScroll && !navbar.classList.contains('navbar-hidden')) {
+            // Scrolling down - hide navbar
+            navbar.classList.add('navbar-hidden');
+        } else if (currentScroll < lastScroll && navbar.classList.contains('navbar-hidden')) {
+            // Scrolling up - show navbar
+            navbar.classList.remove('navbar-hidden');
+        }
+    } else {
+        // Always show navbar at top of page
+        navbar.classList.remove('navbar-hidden');
+    }
+
+    // Show scroll to top button
+    if (currentScroll > 400) {
+        scrollToTop.classList.add('show');
+    } else {
+        scrollToTop.classList.remove('show');
+    }
+
+    lastScroll = currentScroll;
+});
+
+// Scroll to top functionality
+scrollToTop.addEventListener('click', () => {
+    window.scrollTo({
+        top: 0,
+        behavior: 'smooth'
+    });
+});
+
+// Active nav link
+const currentPath = window.location.pathname;
+document.querySelectorAll('.nav-link').forEach(link => {
+    if (link.getAttribute('href') === currentPath) {
+        link.classList.add('active');
+    }
+});
+
+// Dark mode toggle (basic implementation)
+function toggleDarkMode() {
+    // This is a placeholder - you can implement full dark mode later
+    const icon = document.querySelector('.dark-mode-toggle i');
+    if (icon.classList.contains('fa-moon')) {
+        icon.classList.remove('fa-moon');
+        icon.classList.add('fa-sun');
+        // Add dark mode classes here in future
+    } else {
+        icon.classList.remove('fa-sun');
+        icon.classList.add('fa-moon');
+    }
+}
+
+// Notifications (placeholder)
+function showNotifications() {
+    alert('🔔 You have 3 new notifications!\n\n• Someone liked your post\n• New comment on your article\n• Weekly digest is ready');
+}
+
+// Fade in animation on scroll
+const observerOptions = {
+    threshold: 0.1,
+    rootMargin: '0px 0px -50px 0px'
+};
+
+const observer = new IntersectionObserver((entries) => {
+    entries.forEach(entry => {
+        if (entry.isIntersecting) {
+            entry.target.classList.add('fade-in-up');
+        }
+    });
+}, observerOptions);
+
+document.querySelectorAll('.post-card').forEach(card => {
+    observer.observe(card);
+});
+
+// "Load more" - appends the next page's cards in place of the Newer/Older links
+document.querySelectorAll('[data-load-more]').forEach(button => {
+    const selector = button.dataset.loadMore;
+    document.querySelectorAll('.cursor-pagination').forEach(nav => nav.remove());
+    button.classList.remove('d-none');
+    button.addEventListener('click', () => {
+        button.disabled = true;
+        fetch(button.dataset.nextUrl)
+            .then(response => response.text())
+            .then(html => {
+                const page = new DOMParser().parseFromString(html, 'text/html');
+                const grid = document.querySelector(selector);
+                page.querySelectorAll(`${selector} > *`).forEach(item => {
+                    const node = grid.appendChild(document.importNode(item, true));
+                    node.querySelectorAll('.post-card').forEach(card => observer.observe(card));
+                });
+                const next = page.querySelector(`[data-load-more="${selector}"]`);
+                if (next) {
+                    button.dataset.nextUrl = next.dataset.nextUrl;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+                document.dispatchEvent(new CustomEvent('blog:content-loaded'));
+            })
+            .catch(() => { button.disabled = false; });
+    });
+});
+
+// "Load more replies" - the next replies of a comment thread take the button's place
+document.addEventListener('click', event => {
+    const button = event.target.closest('[data-load-replies]');
+    if (!button) {
+        return;
+    }
+    button.disabled = true;
+    fetch(button.dataset.loadReplies)
+        .then(response => response.text())
+        .then(html => {
+            button.replaceWith(document.createRange().createContextualFragment(html));
+            document.dispatchEvent(new CustomEvent('blog:content-loaded'));
+        })
+        .catch(() => { button.disabled = false; });
+});